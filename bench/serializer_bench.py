@@ -0,0 +1,118 @@
+# serializer_bench.py
+#
+# Benchmarks the JSON serializers of the output sink on typical reddit
+# post and comment dicts, as yielded by the reddit spider.
+#
+# Usage:
+#     python bench/serializer_bench.py [-n <number_of_items>]
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+root_path = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path[0:0] = [
+    os.path.join(root_path, 'src'),
+    os.path.join(root_path, 'dep-py'),
+    os.path.join(root_path, 'dep-py', 'jsonlines'),
+]
+
+from dmine import Serializer, OutputSink, ComponentLoader
+
+WORDS = ['linux', 'cat', 'game', 'the', 'a', 'meme', 'kernel', 'windows',
+         'café', '\U0001f600']
+
+def item_stream(n, seed=0):
+    """
+    @param n: The number of items to generate.
+
+    Returns a list of `n` synthetic items, one post for every ten
+    comments.
+    """
+    rand = random.Random(seed)
+    def text(k):
+        return ' '.join(rand.choice(WORDS) for _ in range(k))
+    items = []
+    for i in range(n):
+        if i % 11 == 0:
+            items.append(ComponentLoader('post', {
+                'post_id': '%x' % rand.getrandbits(32),
+                'title': text(10),
+                'subreddit': rand.choice(['gaming', 'linuxmemes']),
+                'score': rand.randint(-50, 50000),
+                'author': 'user_%d' % rand.randint(0, 10000),
+            }))
+        else:
+            items.append(ComponentLoader('comment', {
+                'comment_id': '%x' % rand.getrandbits(32),
+                'author': 'user_%d' % rand.randint(0, 10000),
+                'body': text(rand.randint(5, 60)),
+                'score': str(rand.randint(-50, 5000)),
+            }))
+    return items
+
+def measure(name, func, items):
+    start = time.perf_counter()
+    size = func(items)
+    elapsed = time.perf_counter() - start
+    print('%-22s %9d items in %7.3fs %11.0f items/s %7.1f MB/s'
+          % (name, len(items), elapsed, len(items) / elapsed,
+             size / elapsed / 1e6))
+
+def run_dumps(serializer):
+    """
+    Serialize each item on its own.
+    """
+    def run(items):
+        dumps_line = serializer.dumps_line
+        return sum(len(dumps_line(item.data)) for item in items)
+    return run
+
+def run_str_write(items):
+    """
+    The way items were written before the serializers: a str per item,
+    written into a text file.
+    """
+    with tempfile.TemporaryFile('w+') as f:
+        for item in items:
+            f.write(json.dumps(item.data) + '\n')
+        return f.tell()
+
+def run_sink(serializer):
+    """
+    Write the items into a JSONL file per component, through a sink.
+    """
+    def run(items):
+        with tempfile.TemporaryDirectory() as out_dir:
+            with OutputSink(out_dir=out_dir, file_format='jsonl',
+                            serializer=serializer) as sink:
+                for item in items:
+                    sink.write(item)
+            return sum(os.path.getsize(os.path.join(out_dir, f))
+                       for f in os.listdir(out_dir))
+    return run
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the JSON serializers.'
+    )
+    parser.add_argument('-n', type=int, default=200000,
+                        help='The number of synthetic items.')
+    args = parser.parse_args()
+
+    items = item_stream(args.n)
+    names = [b for b in Serializer.backends if Serializer.available(b)]
+    print('available serializers: %s' % ', '.join(names))
+
+    for name in names:
+        measure('dumps (%s)' % name, run_dumps(Serializer(name)), items)
+    measure('str + text write', run_str_write, items)
+    for name in names:
+        measure('sink (%s)' % name, run_sink(name), items)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+# sfl_bench.py
+#
+# Benchmarks the scrape filter on a synthetic stream of reddit comments.
+#
+# Usage:
+#     python bench/sfl_bench.py [-n <number_of_comments>] [--calls <calls>]
+#                               [--script-size <bytes>]
+#                               [--batch <number_of_records>]
+
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+root_path = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path[0:0] = [
+    os.path.join(root_path, 'src'),
+    os.path.join(root_path, 'dep-py'),
+    os.path.join(root_path, 'dep-py', 'jsonlines'),
+]
+
+import sfl
+from dmine import ScrapeFilter, FilterCache
+
+SFL_SCRIPT = """
+    @subreddits = 'gaming, linuxmemes'
+    post { score > 100 and title search 'cat' }
+    comment {
+        0 < score < 1000
+        and author not in ['AutoModerator', 'bot1', 'bot2', 'bot3']
+        and body search 'linux'
+    }
+"""
+
+WORDS = ['linux', 'cat', 'game', 'the', 'a', 'meme', 'kernel', 'windows']
+AUTHORS = ['AutoModerator', 'bot1', 'alice', 'bob', 'carol', 'dave']
+
+def setup_filter(sf):
+    """
+    The same components and variables as the reddit spider's.
+    """
+    sf.add_com('post')
+    sf.add_com('comment')
+    sf.add_com('redditor')
+    sf_post = sf.get('post')
+    for name in ('score', 'title', 'subreddit', 'author'):
+        sf_post.add(name)
+    sf_comment = sf.get('comment')
+    for name in ('score', 'body', 'author'):
+        sf_comment.add(name)
+    sf_redditor = sf.get('redditor')
+    for name in ('username', 'trophies'):
+        sf_redditor.add(name)
+    sf.add_var('subreddits', default='all')
+    sf.add_var('skip_comments', default=False, type=bool)
+
+def comment_stream(n, seed=0):
+    """
+    @param n: The number of comments to generate.
+
+    Returns a list of `n` synthetic comments.
+    """
+    rand = random.Random(seed)
+    return [{
+        'score': rand.randint(-50, 2000),
+        'body': ' '.join(rand.choice(WORDS) for _ in range(12)),
+        'author': rand.choice(AUTHORS),
+    } for _ in range(n)]
+
+def run_compiled(sf, comments):
+    sf_comment = sf.get('comment')
+    for c in comments:
+        sf_comment.set_attr_values(**c)
+        sf_comment.should_scrape()
+
+def run_batch(sf, comments):
+    sf.filter_batch('comment', comments)
+
+def run_batch_columns(sf, columns):
+    sf.filter_batch('comment', columns)
+
+def measure(name, func, sf, comments):
+    start = time.perf_counter()
+    func(sf, comments)
+    elapsed = time.perf_counter() - start
+    n = len(comments['score']) if isinstance(comments, dict) else len(comments)
+    print('%-14s %10d items in %7.3fs %12.0f items/s'
+          % (name, n, elapsed, n / elapsed))
+
+def measure_allocations(sf, comments, calls):
+    """
+    Trace the memory allocated while setting the attribute values of a
+    comment and checking whether it should be scraped, `calls` times.
+    The per-call figure is the peak of memory allocated during a call
+    above what was allocated before it.
+    """
+    sf_comment = sf.get('comment')
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    total = 0
+    for i in range(calls):
+        c = comments[i % len(comments)]
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        sf_comment.set_attr_values(**c)
+        sf_comment.should_scrape()
+        total += tracemalloc.get_traced_memory()[1] - current
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    retained = sum(
+        stat.count_diff for stat in after.compare_to(before, 'lineno')
+        if stat.count_diff > 0
+    )
+    print('%-14s %10d calls %11.1f bytes/call peak %8d blocks retained'
+          % ('allocations', calls, total / calls, retained))
+
+def measure_lexer(size):
+    """
+    @param size: The approximate size of the generated script, in bytes.
+
+    Tokenize a generated script holding a large list of usernames.
+    """
+    names = []
+    length = 0
+    while length < size:
+        names.append('\'user_%d\'' % len(names))
+        length += len(names[-1]) + 2
+    script = 'comment { author not in [%s] and score > 0 }' % ', '.join(names)
+
+    start = time.perf_counter()
+    tokens = sfl.Lexer.lexer(script)
+    elapsed = time.perf_counter() - start
+    print('%-14s %10d bytes in %7.3fs %12.0f tokens/s'
+          % ('lexer', len(script), elapsed, len(tokens) / elapsed))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SFL filtering.')
+    parser.add_argument('-n', type=int, default=20000,
+                        help='The number of synthetic comments.')
+    parser.add_argument('--calls', type=int, default=100000,
+                        help='The number of should_scrape() calls traced '\
+                             'for allocations.')
+    parser.add_argument('--script-size', type=int, default=1 << 20,
+                        help='The size in bytes of the tokenized script.')
+    parser.add_argument('--batch', type=int, default=1000000,
+                        help='The number of synthetic comments filtered '\
+                             'with filter_batch().')
+    args = parser.parse_args()
+
+    FilterCache.enabled = False
+    sf = ScrapeFilter(SFL_SCRIPT, spider_name='reddit')
+    setup_filter(sf)
+    sf.run_interpreter()
+
+    comments = comment_stream(args.n)
+    measure('compiled', run_compiled, sf, comments)
+    measure_allocations(sf, comments, args.calls)
+    measure_lexer(args.script_size)
+
+    # Filtering a large batch of records, one at a time and all at once
+    # (vectorized if numpy is installed).
+    records = comment_stream(args.batch)
+    columns = {k: [r[k] for r in records] for k in records[0]}
+    print('numpy %s' % ('available' if sfl.numpy else 'not available'))
+    measure('per-item', run_compiled, sf, records)
+    measure('batch (rows)', run_batch, sf, records)
+    measure('batch (cols)', run_batch_columns, sf, columns)
+
+if __name__ == '__main__':
+    main()
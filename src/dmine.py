@@ -10,15 +10,58 @@ import datetime
 import logging
 import time
 import json
-import jsonlines
 import re
 import enum
+import math
+import hashlib
+import tempfile
 import textwrap
+import importlib
+import importlib.util
+import queue
+import threading
+import io
+import zlib
+import gzip
+import csv
+import sqlite3
+import struct
+import collections
 from sfl import Interpreter
+
+# pyarrow is optional, and only needed to write the columnar file formats
+# (see `ColumnarFile`).
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# zstandard is optional, and only needed to write zstd compressed files
+# (see `CompressedFile`).
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# fcntl is only needed by the file backend of the `RateLimiter` (it isn't
+# available on Windows), and requests by the sessions of the spiders.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import requests
+except ImportError:
+    requests = None
 from abc import ABCMeta, abstractmethod
 
 class Project:
-    version = ''
+    # The version of dmine. It's part of the key of the cached SFL code
+    # (see `FilterCache`), so releasing a new version drops the code
+    # cached by the older ones.
+    version = '0.1.0'
     root_path = ''
     dep_bin_path = ''
 
@@ -29,6 +72,103 @@ class Project:
         Project.root_path = root_path
         Project.dep_bin_path = os.path.join(Project.root_path, 'dep-bin')
     
+class FilterCache:
+    """
+    An on-disk cache of the code of SFL scripts (see `sfl.Compiler.lower`),
+    so that running a spider again with the same scrape filter skips
+    lexing and parsing the script entirely.
+
+    The code of a script is stored in a file named after the hash of the
+    script, the name of the spider and the version of dmine, inside the
+    directory `$XDG_CACHE_HOME/dmine/sfl` (or `~/.cache/dmine/sfl`).
+
+    The code is stored as JSON, as it only holds literals (its tuples
+    are read back as lists, which the compiler takes just as well).
+    Unlike a pickle, a cache file can't run any code when it's loaded.
+    """
+
+    enabled = True
+    hits = 0
+    misses = 0
+    format = 3 # Changed whenever the layout of the cached code changes.
+
+    def path():
+        """
+        Returns the directory path where the cached code is stored.
+        """
+        cache_home = os.environ.get('XDG_CACHE_HOME') or\
+                     os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(cache_home, 'dmine', 'sfl')
+
+    def key(sfl_script, spider_name):
+        """
+        @param sfl_script: The scrape filter language script.
+        @param spider_name: The name of the spider that employ the script.
+
+        Returns the key of the script's code in the cache.
+        """
+        h = hashlib.sha256()
+        for s in (str(FilterCache.format), Project.version, spider_name, 
+                  sfl_script):
+            h.update(s.encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def code(sfl_script, spider_name=''):
+        """
+        @param sfl_script: The scrape filter language script.
+        @param spider_name: The name of the spider that employ the script.
+
+        Returns the code of the script. The code is taken from the cache
+        if it's there. Otherwise, the script is parsed and its code is
+        stored in the cache.
+        """
+        if not FilterCache.enabled or not sfl_script.strip():
+            return Interpreter.parse(sfl_script)
+
+        file_path = os.path.join(
+            FilterCache.path(), FilterCache.key(sfl_script, spider_name)
+        )
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                code = json.load(f)
+            FilterCache.hits += 1
+            logging.info('Loaded the SFL code from %s.' % file_path)
+            return code
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning('Ignoring the unreadable SFL cache file %s: %s'
+                            % (file_path, e))
+
+        FilterCache.misses += 1
+        code = Interpreter.parse(sfl_script)
+        FilterCache.__store(file_path, code)
+        return code
+
+    def stats():
+        """
+        Returns a line showing the number of cache hits and misses.
+        """
+        return 'SFL filter cache: %d hit(s), %d miss(es).'\
+               % (FilterCache.hits, FilterCache.misses)
+
+    def __store(file_path, code):
+        """
+        Write the code into the file atomically, so that a concurrent
+        run never reads a partly written file.
+        """
+        dir_path = os.path.dirname(file_path)
+        try:
+            os.makedirs(dir_path, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=dir_path, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(code, f)
+            os.replace(temp_path, file_path)
+        except (IOError, OSError) as e:
+            logging.warning('Unable to write the SFL cache file %s: %s'
+                            % (file_path, e))
+
 class Component:
     """
     WARNING: This class isn't supposed to be instantiated outside
@@ -45,6 +185,8 @@ class Component:
     name = ''
     info = ''
     attr = {}
+    values = {} # The attribute values keyed by the attribute names. This
+                # dictionary is shared with the SFL interpreter.
     flag = False
 
     def __init__(self, scrape_filter, name, info=''):
@@ -61,6 +203,7 @@ class Component:
         self.name = name
         self.info = info
         self.attr = {}
+        self.values = {}
         self.flag = False
 
     def add(self, name, info=''):
@@ -75,6 +218,7 @@ class Component:
             self.__throw_attr_name_error(name)
     
         self.attr[name] = Attribute(self, name, info)
+        self.values[name] = None
 
     def get(self, name):
         """
@@ -86,7 +230,7 @@ class Component:
             self.__throw_get_attr_error(name)
 
     def should_scrape(self):
-        self.scrape_filter.run_interpreter()
+        self.scrape_filter.run_interpreter(self.name)
         return self.flag
 
     def set_attr_values(self, lenient=False, **attributes):
@@ -96,8 +240,9 @@ class Component:
                              the value corresponding to the dictionary key.
         """
         for k in attributes:
-            self.get(k).value = attributes[k]
-            self.get(k).is_assigned = True
+            attr = self.get(k)
+            attr.value = self.values[k] = attributes[k]
+            attr.is_assigned = True
 
         if not lenient:
             for k in self.attr:
@@ -308,19 +453,29 @@ class ScrapeFilter:
     spider_name = ''
     sfl_input = ''
     var = {}
+    interpreter = None # The sfl.Interpreter owned by this scrape filter.
     
-    def __init__(self, sfl_script, spider_name=''):
+    def __init__(self, sfl_script, spider_name='', script_dir=None):
         """
         @param sfl_script: The scrape filter language script.
         @param spider_name: The name of the spider that employ this scrape
                             filter.
+        @param script_dir: The directory of the file the script was read
+                           from, against which the relative paths of its
+                           list files are resolved. If None, they're
+                           resolved against the current directory.
 
         Create an instance of `ScrapFilter` class.
         """
         self.spider_name = spider_name
         self.sfl_input = sfl_script
+        self.comp = {}
         self.var = {}
-        Interpreter.set(sfl_script)
+        self.interpreter = Interpreter()
+        self.interpreter.set(
+            sfl_script, FilterCache.code(sfl_script, spider_name),
+            script_dir
+        )
 
     def add_com(self, name, info=''):
         """
@@ -401,15 +556,30 @@ class ScrapeFilter:
         except:
             ScrapeFilter.__throw_not_exist_error('variable', name)
 
-    def run_interpreter(self):
+    def run_interpreter(self, comp_name=None):
         """
+        @param comp_name: The name of the only component to evaluate. If
+                          None, every component and variable is evaluated.
+
         Run the SFL interpreter. All the definitions of components
         and variables are defined from this scrape filter. We just
         need to feed the interpreter this scrape filter, and get
         its output.
+
+        The variables only need to be resolved once (i.e. right after the
+        spider's `setup_filter`), whereas a component only needs to be
+        evaluated when its attribute values are changed. Hence, passing
+        `comp_name` makes the cost of a run proportional to the size of
+        that component's block alone.
         """
-        Interpreter.feed(self)
-        sfl_output = Interpreter.output()
+        if comp_name is not None:
+            self.interpreter.feed(self)
+            self.get(comp_name).flag = \
+                self.interpreter.output_component(comp_name)
+            return
+
+        self.interpreter.feed(self)
+        sfl_output = self.interpreter.output()
         for key in sfl_output:
             sym, name = key 
             val = sfl_output[key]
@@ -422,6 +592,42 @@ class ScrapeFilter:
                 logging.error(msg)
                 raise ValueError(msg)
 
+    def filter_batch(self, comp_name, records):
+        """
+        @param comp_name: The name of the component.
+        @param records: The attribute values of many components named
+                        `comp_name`, either as a list of dicts (one per
+                        component), or as a dict of lists (one per
+                        attribute).
+
+        Returns a boolean mask telling which of the records should be
+        scraped. This gives the same result as setting the attribute
+        values of each record and calling `should_scrape()`, but it's
+        much faster for a page of items, since the SFL block is run on
+        all of them at once (using numpy if it's installed).
+
+        Unlike `Component.set_attr_values()`, the records only need the
+        attributes referred to in the SFL block of the component.
+        """
+        self.get(comp_name)
+        self.interpreter.feed(self)
+        return self.interpreter.output_batch(comp_name, records)
+
+    def filter_stats(self):
+        """
+        Returns a multiline string showing how many times each term in the
+        SFL block of each component decided the result of its `and` chain,
+        which helps to find the terms worth putting first. The counts are
+        approximate if the scrape filter is used by several threads.
+        """
+        lines = ''
+        program = self.interpreter.program
+        for comp_name, decisions in program.decisions.items():
+            lines += comp_name + '\n'
+            for source, count in decisions:
+                lines += '    %10d  %s\n' % (count, source)
+        return lines
+
     def detail(self):
         """
         Returns a multiline string that represents the components and
@@ -487,6 +693,2075 @@ class ScrapeFilter:
             lines += info + '\n\n'
         return lines
 
+class Serializer:
+    """
+    The serializer turns the scraped data into JSON, encoded in UTF-8.
+    Any of the JSON libraries in `Serializer.backends` can do the job:
+    the fastest one installed is picked by default.
+
+    The JSON is returned as bytes, which are written as is into the
+    output files' buffers. Only orjson produces bytes in the first place:
+    json and ujson build a string, which is then encoded into a copy.
+    Streaming their output into the files instead (with
+    `json.JSONEncoder.iterencode`, or `ujson.dump` into a text wrapper)
+    saves the copy, but is more than twice as slow, and the output
+    files need the whole item at once (i.e. to count the records of a
+    `RotatingFile`).
+    """
+
+    # The supported JSON libraries, fastest first.
+    backends = ('orjson', 'ujson', 'json')
+
+    name = ''
+    dumps = None        # Function: data -> JSON bytes.
+    dumps_line = None   # Function: data -> JSON bytes ending with a newline.
+
+    def __init__(self, name='auto'):
+        """
+        @param name: Either one of `Serializer.backends`, or 'auto' for
+                     the fastest one installed.
+        """
+        if name == 'auto':
+            name = [b for b in Serializer.backends
+                    if Serializer.available(b)][0]
+        elif name not in Serializer.backends:
+            Serializer.__throw_error('Unknown serializer: %s' % name)
+        elif not Serializer.available(name):
+            Serializer.__throw_error(
+                'The serializer \'%s\' is not installed.' % name
+            )
+
+        self.name = name
+        module = importlib.import_module(name)
+        if name == 'orjson':
+            option = module.OPT_APPEND_NEWLINE
+            self.dumps = module.dumps
+            self.dumps_line = lambda data: module.dumps(data, option=option)
+        else:
+            dumps = module.dumps
+            self.dumps = lambda data: dumps(data).encode('utf-8')
+            self.dumps_line = lambda data: (dumps(data) + '\n').encode('utf-8')
+
+    def available(name):
+        """
+        @param name: The name of a JSON library.
+
+        Returns True if the library is installed.
+        """
+        return importlib.util.find_spec(name) is not None
+
+    def __throw_error(msg):
+        logging.error(msg)
+        raise ValueError(msg)
+
+class OutputSink:
+    """
+    The output sink writes the scraped data of a spider run into the
+    output file(s). Unlike `Utils.dict_to_file` and
+    `Utils.component_loader_to_file`, which open and close a file for
+    every item written, the sink keeps one buffered file open for each
+    of its outputs until it's closed.
+
+    The data is written either into a single file, into one file per
+    component inside a directory, or into STDOUT. The JSON format is
+    written into a `JsonArrayFile`, and the CSV format into a `CsvFile`.
+    The columnar formats (see `OutputSink.columnar_formats`) are written
+    into a `ColumnarFile`, and the 'sqlite' format into a `SqliteFile`
+    (with a table for each component); they can't be written into
+    STDOUT.
+
+    Usage:
+        >> with OutputSink(out_dir='my_dir', file_format='jsonl') as sink:
+        >>     for item in spider.start(scrape_filter):
+        >>         sink.write(item)
+    """
+
+    filename = None     # The file into which all the data is written.
+    out_dir = None      # The directory in which each component is
+                        # written into its own file.
+    file_format = 'json'
+    buffer_size = 0     # The size (in bytes) of the buffer of each file.
+    flush_interval = 0  # The maximum time (in seconds) that written data
+                        # may stay in the buffers.
+    files = {}          # Component name (None if the data isn't written
+                        # per component) -> open file object.
+    columns = {}        # Component name -> the names of its columns, in
+                        # the CSV, columnar and sqlite formats.
+    row_group_size = 0  # The number of rows in each row group, in the
+                        # columnar formats, and in each transaction, in
+                        # the sqlite format.
+
+    # The formats written into a `ColumnarFile`.
+    columnar_formats = ('parquet', 'arrow')
+
+    compress = None     # The compression of the files (see
+                        # `CompressedFile`), or None.
+    compress_level = None
+    serializer = None   # The `Serializer` of the JSON formats.
+    rotate_size = None  # See `RotatingFile`.
+    rotate_records = None
+    rotate_interval = None
+
+    def __init__(
+            self, filename=None, out_dir=None, file_format='json',
+            buffer_size=1 << 16, flush_interval=1.0, columns=None,
+            row_group_size=1 << 16, compress=None, compress_level=None,
+            serializer='auto', rotate_size=None, rotate_records=None,
+            rotate_interval=None
+        ):
+        """
+        @param filename: The file into which the data is written. If
+                         neither `filename` nor `out_dir` is given, the
+                         data is written into STDOUT.
+        @param out_dir: The directory in which to put the file of each
+                        component. The name of each file is the name of
+                        its component, and its extension is
+                        `file_format`.
+        @param file_format: The format in which the data is written.
+        @param buffer_size: The size (in bytes) of the buffer of each
+                            file. A file is flushed whenever its buffer
+                            is full.
+        @param flush_interval: All the files are also flushed when an
+                               item is written at least `flush_interval`
+                               seconds after the last flush.
+        @param columns: A dict of the component names to the names of the
+                        columns that come first in their files (or
+                        tables), in the CSV, columnar and sqlite formats
+                        (i.e. the attributes declared in the spider's
+                        `setup_filter`).
+        @param row_group_size: The number of rows buffered before they
+                               are written, in the columnar and sqlite
+                               formats.
+        @param compress: Either 'gzip' or 'zstd' to compress the files
+                         (see `CompressedFile`), or None. The extension of
+                         the compression is added to the file names.
+        @param compress_level: The compression level, or None for the
+                               default level of the compression.
+        @param serializer: The name of the JSON library used by the
+                           serializer (see `Serializer`).
+        @param rotate_size: If given, the files are rotated (see
+                            `RotatingFile`) when they reach this size, in
+                            bytes.
+        @param rotate_records: If given, the files are rotated when they
+                               hold this many records.
+        @param rotate_interval: If given, the files are rotated at the end
+                                of each time window, either 'minute',
+                                'hour' or 'day'.
+        """
+        binary_formats = OutputSink.columnar_formats + ('sqlite',)
+        if file_format in binary_formats and not (filename or out_dir):
+            OutputSink.__throw_error(
+                'Unable to write the %s format into STDOUT.' % file_format
+            )
+        if compress is not None:
+            if compress not in CompressedFile.extensions:
+                OutputSink.__throw_error('Unknown compression: %s' % compress)
+            if file_format in binary_formats:
+                OutputSink.__throw_error(
+                    'Unable to compress the %s format.' % file_format
+                )
+            if not (filename or out_dir):
+                OutputSink.__throw_error(
+                    'Unable to write compressed data into STDOUT.'
+                )
+        if rotate_size or rotate_records or rotate_interval:
+            if not (filename or out_dir):
+                OutputSink.__throw_error('Unable to rotate STDOUT.')
+            if file_format == 'sqlite':
+                OutputSink.__throw_error(
+                    'Unable to rotate the sqlite format.'
+                )
+            if rotate_interval is not None\
+            and rotate_interval not in RotatingFile.intervals:
+                OutputSink.__throw_error(
+                    'Unknown rotation interval: %s' % rotate_interval
+                )
+
+        self.filename = filename
+        self.out_dir = out_dir
+        self.file_format = file_format
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.columns = columns or {}
+        self.row_group_size = row_group_size
+        self.compress = compress
+        self.compress_level = compress_level
+        self.serializer = Serializer(serializer)
+        self.rotate_size = rotate_size
+        self.rotate_records = rotate_records
+        self.rotate_interval = rotate_interval
+        self.files = {}
+        self.last_flush = time.monotonic()
+
+    def write(self, item):
+        """
+        @param item: The scraped data, either a `ComponentLoader` or a
+                     dict.
+
+        Write the item into the file it belongs to. Returns True, like
+        `AsyncWriter.write`.
+        """
+        f, s = self.__prepare(item)
+        f.write(s)
+
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+        return True
+
+    def write_many(self, items):
+        """
+        @param items: A list of items (see `write`).
+
+        Write the items into the files they belong to. The items going
+        into the same file are written with a single call.
+        """
+        chunks = {}
+        for item in items:
+            f, s = self.__prepare(item)
+            chunk = chunks.get(f)
+            if chunk is None:
+                chunks[f] = [s]
+            else:
+                chunk.append(s)
+        for f, chunk in chunks.items():
+            f.writelines(chunk)
+
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Flush the buffers of all the open files.
+        """
+        for f in self.files.values():
+            f.flush()
+        self.last_flush = time.monotonic()
+
+    def sync(self):
+        """
+        Flush the buffers of all the open files, and have the operating
+        system write the files to the disk.
+        """
+        self.flush()
+        if self.filename or self.out_dir:
+            for f in self.files.values():
+                if isinstance(f, (SqliteFile, RotatingFile)):
+                    f.sync()
+                else:
+                    os.fsync(f.fileno())
+
+    def close(self):
+        """
+        Flush and close all the open files. The sink can still be written
+        into afterwards, in which case the files are opened again.
+        """
+        self.flush()
+        for f in self.files.values():
+            if f is not sys.stdout.buffer:
+                f.close() # A `CsvFile` leaves STDOUT open.
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __prepare(self, item):
+        """
+        @param item: See `write`.
+
+        Returns a tuple `(file, data)`: the file the item belongs to, and
+        what to write into it (bytes in the JSON formats, the dict for a
+        `CsvFile` or a `ColumnarFile`, or the component name and the dict
+        for a `SqliteFile`).
+        """
+        if isinstance(item, ComponentLoader):
+            name, data = item.name, item.data
+        else:
+            name, data = None, item
+        f = self.__file(name)
+        if self.file_format in ('json', 'jsonl'):
+            return f, self.__format(data)
+        if self.file_format == 'sqlite':
+            return f, (name, data)
+        return f, data
+
+    def __file(self, name):
+        """
+        @param name: The name of the component of the data to be written,
+                     or None if the data isn't a component.
+
+        Returns the file into which the data is written, which is opened
+        in append mode the first time it is needed (or a `RotatingFile`,
+        if the files are rotated).
+        """
+        key = name if self.out_dir else None
+        f = self.files.get(key)
+        if f is not None:
+            return f
+
+        if name is None and self.file_format == 'sqlite':
+            OutputSink.__throw_error(
+                'Unable to write a data into a table: the data is not a '\
+                'component.'
+            )
+        if self.out_dir:
+            if name is None:
+                OutputSink.__throw_error(
+                    'Unable to write a data into the directory \'%s\': '\
+                    'the data is not a component.' % self.out_dir
+                )
+            if not os.path.exists(self.out_dir):
+                os.makedirs(self.out_dir)
+            file_path = os.path.join(
+                os.path.realpath(self.out_dir), name + '.' + self.file_format
+            )
+        else:
+            file_path = self.filename
+
+        extension = '.' + self.file_format
+        if self.compress is not None:
+            extension += CompressedFile.extensions[self.compress]
+            if not file_path.endswith(extension):
+                file_path += CompressedFile.extensions[self.compress]
+
+        if self.rotate_size or self.rotate_records or self.rotate_interval:
+            f = RotatingFile(
+                file_path, extension, lambda path: self.__open(name, path),
+                self.rotate_size, self.rotate_records, self.rotate_interval
+            )
+        else:
+            f = self.__open(name, file_path)
+
+        self.files[key] = f
+        return f
+
+    def __open(self, name, file_path):
+        """
+        @param name: See `__file`.
+        @param file_path: The path of the file to open, or None for STDOUT.
+
+        Returns the file, opened in append mode, that takes the data
+        written in the sink's format. Every such file has the methods
+        `write`, `writelines`, `flush`, `fileno` and `close`.
+        """
+        has_records = None
+        if self.file_format == 'sqlite':
+            return SqliteFile(file_path, self.columns, self.row_group_size)
+        if self.file_format in OutputSink.columnar_formats:
+            f = ColumnarFile(
+                file_path, self.file_format, self.columns.get(name, ()),
+                self.row_group_size
+            )
+        elif self.compress is not None:
+            if self.file_format == 'json' and os.path.exists(file_path):
+                has_records = JsonArrayFile.repair(file_path, self.compress)
+            f = CompressedFile.Buffer(
+                CompressedFile(file_path, self.compress, self.compress_level),
+                self.buffer_size
+            )
+        elif file_path:
+            if self.file_format == 'json' and os.path.exists(file_path):
+                has_records = JsonArrayFile.repair(file_path)
+            f = open(file_path, 'ab', buffering=self.buffer_size)
+        else:
+            # What was printed so far goes first.
+            sys.stdout.flush()
+            f = sys.stdout.buffer
+
+        if self.file_format == 'json':
+            f = JsonArrayFile(f, has_records)
+        elif self.file_format == 'csv':
+            header = None
+            if file_path and os.path.exists(file_path):
+                header = CsvFile.read_header(file_path, self.compress)
+            f = CsvFile(f, self.columns.get(name, ()), header)
+        return f
+
+    def __format(self, data):
+        """
+        @param data: The dict to be written.
+
+        Returns the bytes to write for the data, in the JSON formats.
+        """
+        file_format = self.file_format
+        if file_format == 'json':
+            return self.serializer.dumps(data)
+        if file_format == 'jsonl':
+            return self.serializer.dumps_line(data)
+        OutputSink.__throw_error('Unknown file format: %s' % file_format)
+
+    def __throw_error(msg):
+        logging.error(msg)
+        raise ValueError(msg)
+
+class RotatingFile:
+    """
+    A file rotated into a sequence of shards, whenever the current shard
+    reaches a size, holds a number of records, or at the end of a time
+    window. The shards are named after the file, i.e. for the file
+    `comment.jsonl`:
+
+        comment-0001.jsonl, comment-0002.jsonl, ...
+        comment-2026-10-18T13.jsonl, comment-2026-10-18T14.jsonl, ...
+        comment-2026-10-18T13-0001.jsonl, ...
+
+    where the sequence number only shows up if the shards are rotated by
+    size or by record count, or if the shard's name is already taken.
+    The time windows are in UTC.
+
+    Each shard is a complete file of its own (i.e. a CSV shard has its
+    header). A shard is written under a temporary name, a dot file
+    ending with `.tmp`, and is only renamed (atomically) once it's
+    complete and closed: a file with the shard's name can be loaded
+    right away, while the spider goes on.
+    """
+
+    # The format of the shard names and the length in seconds of each
+    # time window.
+    intervals = {
+        'minute': ('%Y-%m-%dT%H-%M', 60),
+        'hour': ('%Y-%m-%dT%H', 3600),
+        'day': ('%Y-%m-%d', 86400),
+    }
+
+    # The size of a shard is checked every this many records.
+    size_check_records = 64
+
+    def __init__(
+            self, file_path, extension, open_file, max_size=None,
+            max_records=None, interval=None
+        ):
+        """
+        @param file_path: The path the shards are named after.
+        @param extension: The extension of the file (i.e. '.jsonl.gz'),
+                          which goes at the end of the shard names.
+        @param open_file: A function that takes a path, and returns the
+                          file (see `OutputSink`) opened at that path.
+        @param max_size: The size of a shard (in bytes) at which it is
+                         rotated, or None. In the JSON formats, it is the
+                         size of the records (before compression); in the
+                         others, the size on the disk, checked every
+                         `size_check_records` records, so the data still
+                         in the buffers isn't counted.
+        @param max_records: The number of records of a shard at which it
+                            is rotated, or None.
+        @param interval: The time window of each shard (a key of
+                         `RotatingFile.intervals`), or None.
+        """
+        if file_path.endswith(extension):
+            self.stem = file_path[:-len(extension)]
+        else:
+            self.stem, extension = os.path.splitext(file_path)
+        self.extension = extension
+        self.open_file = open_file
+        self.max_size = max_size
+        self.max_records = max_records
+        self.interval = interval
+        self.file = None
+        self.path = None        # The name of the current shard.
+        self.temp_path = None   # The name it's written under.
+        self.records = 0        # The number of records in the shard.
+        self.size = 0           # The size of the records, if in bytes.
+        self.window_end = None  # The end of the shard's time window.
+
+    def write(self, data):
+        """
+        @param data: The data to write into the current shard.
+        """
+        self.writelines([data])
+
+    def writelines(self, rows):
+        """
+        @param rows: A list of data to write. The list is split between
+                     shards as needed.
+        """
+        i = 0
+        while i < len(rows):
+            if self.file is None or self.__is_full():
+                self.__rotate()
+            n = len(rows) - i
+            if self.max_records:
+                n = min(n, self.max_records - self.records)
+            if self.max_size:
+                n = self.__fit(rows, i, n)
+            self.file.writelines(rows[i:i + n])
+            self.records += n
+            i += n
+
+    def flush(self):
+        """
+        Flush the current shard. A shard whose time window is over is
+        closed right away (see `close`), instead of once the next record
+        is written, which could be long after.
+        """
+        if self.file is None:
+            return
+        if self.window_end is not None and time.time() >= self.window_end:
+            self.close()
+        else:
+            self.file.flush()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def sync(self):
+        """
+        Have the operating system write the current shard, if any, to the
+        disk.
+        """
+        if self.file is not None:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        """
+        Close the current shard, and give it its name.
+        """
+        if self.file is not None:
+            self.file.close()
+            os.replace(self.temp_path, self.path)
+            self.file = None
+
+    def __is_full(self):
+        """
+        Returns True if the current shard has to be rotated.
+        """
+        if self.max_records and self.records >= self.max_records:
+            return True
+        if self.window_end is not None and time.time() >= self.window_end:
+            return True
+        if self.max_size and self.records > 0:
+            if self.size > 0:
+                return self.size >= self.max_size
+            if self.records % RotatingFile.size_check_records == 0:
+                return os.fstat(self.file.fileno()).st_size >= self.max_size
+        return False
+
+    def __fit(self, rows, i, n):
+        """
+        Returns how many of the `n` rows from `rows[i]` go into the
+        current shard before its size has to be checked, and counts the
+        size of those in bytes.
+        """
+        if not isinstance(rows[i], bytes):
+            return min(n, RotatingFile.size_check_records)
+        k = 0
+        while k < n and self.size < self.max_size:
+            self.size += len(rows[i + k])
+            k += 1
+        return max(k, 1)
+
+    def __rotate(self):
+        """
+        Close the current shard, if any, and open the next one.
+        """
+        self.close()
+
+        name = self.stem
+        if self.interval is not None:
+            fmt, length = RotatingFile.intervals[self.interval]
+            now = time.time()
+            name += '-' + time.strftime(fmt, time.gmtime(now))
+            self.window_end = (now // length + 1) * length
+
+        # Look for the first name that isn't taken.
+        sequence = self.max_size is not None or self.max_records is not None
+        n = 1 if sequence else 0
+        while True:
+            path = name
+            if n > 0:
+                path += '-%04d' % n
+            path += self.extension
+            directory, base = os.path.split(path)
+            temp_path = os.path.join(directory, '.' + base + '.tmp')
+            if not os.path.exists(path) and not os.path.exists(temp_path):
+                break
+            n += 1
+
+        self.path = path
+        self.temp_path = temp_path
+        self.file = self.open_file(temp_path)
+        self.records = 0
+        self.size = 0
+
+class JsonArrayFile:
+    """
+    A file holding a single JSON array, streamed one record at a time
+    into a binary file (i.e. a buffered file, or a `CompressedFile`):
+
+        [
+        {"post_id": "a", ...},
+        {"post_id": "b", ...}
+        ]
+
+    Each record is on its own line, which is what makes the file
+    recoverable: if the process dies before the file is closed, the file
+    only lacks its closing bracket, and perhaps the end of its last
+    record. `JsonArrayFile.repair` cuts the file right after its last
+    complete record, so that more records can be appended to the array
+    (which `OutputSink` does when a run writes into an existing file),
+    or it can be closed by simply appending a ']'. A compressed file is
+    cut at the start of the member (or frame) holding the end of its
+    last complete record, and the part of that member which comes before
+    the cut is compressed again, into a member of its own.
+    """
+
+    def __init__(self, file, has_records=None):
+        """
+        @param file: The binary file into which the array is written. It's
+                     closed along with this file, unless it's STDOUT.
+        @param has_records: None to start a new array. Otherwise, the file
+                            already holds an array, without its closing
+                            bracket, and `has_records` tells whether or
+                            not the array has any record in it.
+        """
+        self.file = file
+        if has_records is None:
+            file.write(b'[')
+        self.separator = b',\n' if has_records else b'\n'
+
+    def write(self, record):
+        """
+        @param record: The JSON of a record, as bytes.
+        """
+        self.file.write(self.separator)
+        self.file.write(record)
+        self.separator = b',\n'
+
+    def writelines(self, records):
+        """
+        @param records: A list of records (see `write`).
+        """
+        if records:
+            self.file.write(self.separator)
+            self.file.write(b',\n'.join(records))
+            self.separator = b',\n'
+
+    def flush(self):
+        self.file.flush()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.write(b'\n]\n')
+        if self.file is sys.stdout.buffer:
+            self.file.flush()
+        else:
+            self.file.close()
+
+    def repair(file_path, compress=None):
+        """
+        @param file_path: The path of a file written by a `JsonArrayFile`.
+        @param compress: The compression of the file (see
+                         `CompressedFile`), or None.
+
+        Cut the file right after its last complete record, dropping its
+        closing bracket (if it was closed) or the end of the record that
+        was being written (if it wasn't). Returns None if the file is
+        empty, True if the array has any record in it, and False
+        otherwise.
+        """
+        if compress is not None:
+            return JsonArrayFile.__repair_compressed(file_path, compress)
+        with open(file_path, 'r+b') as f:
+            end = f.seek(0, os.SEEK_END)
+            while end > 0:
+                start = JsonArrayFile.__line_start(f, end)
+                f.seek(start)
+                line = f.read(end - start)
+                record = line.rstrip().rstrip(b',')
+                if record == b'[':
+                    f.truncate(start + line.index(b'[') + 1)
+                    return False
+                if record and record != b']' and start > 0:
+                    try:
+                        json.loads(record.decode('utf-8'))
+                        f.truncate(start + len(record))
+                        return True
+                    except ValueError:
+                        pass
+                if start == 0 and line.strip():
+                    JsonArrayFile.__throw_error(
+                        'The file %s is not a JSON array written by dmine.'
+                        % file_path
+                    )
+                end = max(start - 1, 0)
+        return None
+
+    def __repair_compressed(file_path, compress):
+        """
+        @param file_path: See `repair`.
+        @param compress: Either 'gzip' or 'zstd'.
+
+        Like `repair`, for a compressed file. The file is decompressed
+        once, keeping only the offsets of its members and its last lines,
+        since only the end of the array can be incomplete.
+        """
+        members = []    # (offset in the file, offset in the data)
+        lines = collections.deque(maxlen=4) # (offset in the data, line)
+        line = b''      # The line being read.
+        line_start = 0  # The offset of that line in the data.
+        with open(file_path, 'rb') as f:
+            for offset, data in CompressedFile.read_members(f, compress):
+                if not members or members[-1][0] != offset:
+                    members.append((offset, line_start + len(line)))
+                i = 0
+                while True:
+                    j = data.find(b'\n', i)
+                    if j < 0:
+                        line += data[i:]
+                        break
+                    lines.append((line_start, line + data[i:j]))
+                    line_start += len(lines[-1][1]) + 1
+                    line = b''
+                    i = j + 1
+        if line:
+            lines.append((line_start, line))
+        if not lines:
+            return None
+
+        has_records = None
+        for start, line in reversed(lines):
+            record = line.rstrip().rstrip(b',')
+            if record == b'[':
+                cut, has_records = start + line.index(b'[') + 1, False
+                break
+            if record and record != b']' and start > 0:
+                try:
+                    json.loads(record.decode('utf-8'))
+                    cut, has_records = start + len(record), True
+                    break
+                except ValueError:
+                    pass
+        if has_records is None:
+            JsonArrayFile.__throw_error(
+                'The file %s is not a JSON array written by dmine.'
+                % file_path
+            )
+
+        # Compress the kept part of the last member again.
+        offset, member_start = [m for m in members if m[1] < cut][-1]
+        head = []
+        size = cut - member_start
+        with open(file_path, 'r+b') as f:
+            f.seek(offset)
+            for member, data in CompressedFile.read_members(f, compress):
+                if member != 0 or size <= 0:
+                    break
+                head.append(data[:size])
+                size -= len(data)
+            f.truncate(offset)
+        with CompressedFile(file_path, compress) as f:
+            f.write(b''.join(head))
+        return has_records
+
+    def __line_start(f, end):
+        """
+        @param f: A binary file.
+        @param end: The offset of the end of a line (i.e. of its newline).
+
+        Returns the offset of the start of the line.
+        """
+        pos = end
+        while pos > 0:
+            step = min(pos, 1 << 16)
+            f.seek(pos - step)
+            i = f.read(step).rfind(b'\n')
+            if i >= 0:
+                return pos - step + i + 1
+            pos -= step
+        return 0
+
+    def __throw_error(msg):
+        logging.error(msg)
+        raise ValueError(msg)
+
+class CsvFile:
+    """
+    A CSV file of rows, written with `csv.writer` into a binary file
+    (i.e. a buffered file, or a `CompressedFile`) in UTF-8.
+
+    The first row written is preceded by the header of the file: the
+    declared columns found in the row, followed by the other keys of
+    the row, in order. When appending to a file that already has a
+    header, that header is kept instead. The keys of later rows that
+    aren't in the header are ignored, and the missing ones are left
+    empty. Hence, all the rows of a file should be of the same
+    component.
+    """
+
+    columns = ()    # The declared column names.
+    header = None   # The column names of the file, once they're known.
+
+    def __init__(self, file, columns=(), header=None):
+        """
+        @param file: The binary file into which the rows are written.
+                     It's closed along with this file, unless it's
+                     STDOUT.
+        @param columns: The names of the columns that come first.
+        @param header: The header already in the file, if any.
+        """
+        self.file = file
+        self.columns = tuple(columns)
+        self.header = header
+        self.text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+        self.writer = csv.writer(self.text)
+
+    def write(self, data):
+        """
+        @param data: A dict, the row to write.
+        """
+        if self.header is None:
+            self.__write_header(data)
+        self.writer.writerow(map(data.get, self.header))
+
+    def writelines(self, rows):
+        """
+        @param rows: A list of rows to write.
+        """
+        if not rows:
+            return
+        if self.header is None:
+            self.__write_header(rows[0])
+        header = self.header
+        self.writer.writerows(map(data.get, header) for data in rows)
+
+    def flush(self):
+        self.text.flush()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        if self.file is sys.stdout.buffer:
+            self.text.flush()
+            self.text.detach()
+        else:
+            self.text.close()
+
+    def read_header(file_path, compress=None):
+        """
+        @param file_path: The path of an existing CSV file.
+        @param compress: The compression of the file (see
+                         `CompressedFile`), or None.
+
+        Returns the header of the file, or None if the file is empty.
+        """
+        if compress == 'gzip':
+            f = gzip.open(file_path, 'rt', encoding='utf-8', newline='')
+        elif compress == 'zstd' and zstandard is not None:
+            f = zstandard.open(file_path, 'rt', encoding='utf-8', newline='')
+        else:
+            f = open(file_path, 'r', encoding='utf-8', newline='')
+        with f:
+            try:
+                return tuple(next(csv.reader(f)))
+            except StopIteration:
+                return None
+
+    def __write_header(self, data):
+        """
+        @param data: The first row written into the file.
+        """
+        header = [c for c in self.columns if c in data]
+        header += [k for k in data if k not in header]
+        self.header = tuple(header)
+        self.writer.writerow(self.header)
+
+class CompressedFile(io.RawIOBase):
+    """
+    A binary file written as a stream of gzip members, or of zstd frames.
+
+    Flushing the file ends the current member (or frame), and the next
+    write starts a new one. A member holds everything written since the
+    previous flush, so everything written before the last flush can be
+    decompressed even if the file is cut short afterwards (i.e. the
+    spider crashes). Both `gzip -d` and `zstd -d` read the members (or
+    frames) of a file one after the other, as a single stream.
+
+    The file is opened in append mode: appending to an existing file
+    just adds more members to it. It isn't buffered, so it's meant to be
+    wrapped in a `CompressedFile.Buffer`: an `io.BufferedWriter` doesn't
+    flush its raw file when it's flushed, so the member would only be
+    ended once the file is closed.
+    """
+
+    # The extension of the files of each compression.
+    extensions = {'gzip': '.gz', 'zstd': '.zst'}
+
+    compress = ''
+    level = None
+
+    def __init__(self, file_path, compress, level=None):
+        """
+        @param file_path: The path of the file.
+        @param compress: Either 'gzip' or 'zstd'.
+        @param level: The compression level, or None for the default.
+        """
+        if compress == 'zstd' and zstandard is None:
+            CompressedFile.__throw_error(
+                'The zstd compression requires the zstandard package.'
+            )
+        super().__init__()
+        self.compress = compress
+        self.level = level
+        self.file = open(file_path, 'ab')
+        self.compressor = None # The compressor of the current member.
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.compressor is None:
+            self.compressor = self.__compressor()
+        self.file.write(self.compressor.compress(b))
+        return len(b)
+
+    def flush(self):
+        """
+        End the current member, and flush the file.
+        """
+        if self.compressor is not None:
+            self.file.write(self.compressor.flush())
+            self.compressor = None
+        self.file.flush()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close() # Flushes the file too.
+        finally:
+            self.file.close()
+
+    class Buffer(io.BufferedWriter):
+        """
+        The buffer of a `CompressedFile`, whose flush ends the member.
+        """
+
+        def flush(self):
+            super().flush()
+            self.raw.flush()
+
+    def read_members(f, compress):
+        """
+        @param f: A binary file of gzip members, or of zstd frames, read
+                  from its current offset.
+        @param compress: Either 'gzip' or 'zstd'.
+
+        Yields the decompressed data, in pieces, as tuples
+        `(offset, data)` where `offset` is the offset (from where the
+        file was read) of the member the data belongs to. A member cut
+        short (i.e. by a crash) ends the data.
+        """
+        errors = (zlib.error,)
+        if zstandard is not None:
+            errors += (zstandard.ZstdError,)
+        decompressor = None
+        start = 0   # The offset of the current member.
+        pos = 0     # The offset of the data left in `chunk`.
+        while True:
+            chunk = f.read(1 << 16)
+            if not chunk:
+                return
+            while chunk:
+                if decompressor is None:
+                    decompressor = CompressedFile.__decompressor(compress)
+                    start = pos
+                try:
+                    data = decompressor.decompress(chunk)
+                except errors:
+                    return
+                if data:
+                    yield start, data
+                if decompressor.eof:
+                    unused = decompressor.unused_data
+                    pos += len(chunk) - len(unused)
+                    chunk = unused
+                    decompressor = None
+                else:
+                    pos += len(chunk)
+                    chunk = b''
+
+    def __compressor(self):
+        """
+        Returns a new compressor, whose `flush()` ends the member.
+        """
+        if self.compress == 'gzip':
+            level = 6 if self.level is None else self.level
+            # wbits=31 asks zlib for a gzip header and trailer.
+            return zlib.compressobj(level, zlib.DEFLATED, 31)
+        level = 3 if self.level is None else self.level
+        return zstandard.ZstdCompressor(level=level).compressobj()
+
+    def __decompressor(compress):
+        """
+        Returns a new decompressor of a single member.
+        """
+        if compress == 'gzip':
+            return zlib.decompressobj(31)
+        if zstandard is None:
+            CompressedFile.__throw_error(
+                'The zstd compression requires the zstandard package.'
+            )
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    def __throw_error(msg):
+        logging.error(msg)
+        raise ValueError(msg)
+
+class ColumnarFile:
+    """
+    A file of rows in a columnar format, written with pyarrow: either
+    Parquet ('parquet'), or the Arrow IPC file format ('arrow').
+
+    The rows are buffered, and written as a row group (a record batch,
+    in the Arrow format) every `row_group_size` rows, so that no more
+    rows than that are held in memory, however long the spider runs.
+    Flushing the file doesn't write the buffered rows, which would make
+    for tiny row groups. The file can only be read once it's closed.
+
+    The schema of the file is inferred from the first row group: the
+    columns are the declared columns found in these rows, followed by
+    the other keys of the rows, in the order they show up. A column
+    without any value is a column of strings. The keys of later rows
+    that aren't in the schema are ignored, and the missing ones are
+    null.
+
+    A columnar file can't be appended to, so if the file already exists,
+    the rows are written into a new file next to it, i.e.
+    `comment.1.parquet` next to `comment.parquet`.
+    """
+
+    file_path = ''
+    file_format = ''
+    columns = ()        # The declared column names.
+    row_group_size = 0
+    schema = None       # The pyarrow schema, once it's inferred.
+    rows = []           # The buffered rows.
+
+    def __init__(
+            self, file_path, file_format, columns=(), row_group_size=1 << 16
+        ):
+        """
+        @param file_path: The path of the file.
+        @param file_format: Either 'parquet' or 'arrow'.
+        @param columns: The names of the columns that come first.
+        @param row_group_size: The number of rows in each row group.
+        """
+        if pyarrow is None:
+            ColumnarFile.__throw_error(
+                'The %s format requires the pyarrow package.' % file_format
+            )
+
+        base, ext = os.path.splitext(file_path)
+        i = 0
+        while os.path.exists(file_path):
+            i += 1
+            file_path = '%s.%d%s' % (base, i, ext)
+
+        self.file_path = file_path
+        self.file_format = file_format
+        self.columns = tuple(columns)
+        self.row_group_size = row_group_size
+        self.schema = None
+        self.rows = []
+        self.file = open(file_path, 'wb')
+        self.writer = None
+
+    def write(self, data):
+        """
+        @param data: A dict, the row to write.
+        """
+        self.rows.append(data)
+        if len(self.rows) >= self.row_group_size:
+            self.__write_rows()
+
+    def writelines(self, rows):
+        """
+        @param rows: A list of rows to write.
+        """
+        for data in rows:
+            self.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        """
+        Write the buffered rows, and close the file.
+        """
+        if self.file.closed:
+            return
+        if self.rows or self.writer is None:
+            self.__write_rows()
+        self.writer.close()
+        self.file.close()
+
+    def __write_rows(self):
+        """
+        Write the buffered rows as a row group.
+        """
+        if self.schema is None:
+            self.schema = self.__infer_schema()
+            if self.file_format == 'parquet':
+                self.writer = pyarrow.parquet.ParquetWriter(
+                    self.file, self.schema
+                )
+            else:
+                self.writer = pyarrow.ipc.new_file(self.file, self.schema)
+
+        try:
+            table = pyarrow.Table.from_pylist(self.rows, schema=self.schema)
+        except (pyarrow.ArrowException, TypeError, ValueError) as e:
+            ColumnarFile.__throw_error(
+                'Unable to write the rows into %s: %s' % (self.file_path, e)
+            )
+        self.writer.write_table(table)
+        self.rows = []
+
+    def __infer_schema(self):
+        """
+        Returns the schema of the buffered rows (see above).
+        """
+        names = [c for c in self.columns if any(c in r for r in self.rows)]
+        seen = set(names)
+        for data in self.rows:
+            for k in data:
+                if k not in seen:
+                    seen.add(k)
+                    names.append(k)
+
+        fields = []
+        for name in names:
+            try:
+                t = pyarrow.array([r.get(name) for r in self.rows]).type
+            except (pyarrow.ArrowException, TypeError, ValueError) as e:
+                ColumnarFile.__throw_error(
+                    'Unable to infer the type of the column \'%s\' '\
+                    'of %s: %s' % (name, self.file_path, e)
+                )
+            if pyarrow.types.is_null(t):
+                t = pyarrow.string()
+            fields.append(pyarrow.field(name, t))
+        return pyarrow.schema(fields)
+
+    def __throw_error(msg):
+        logging.error(msg)
+        raise ValueError(msg)
+
+class SqliteFile:
+    """
+    An SQLite database, with a table for each component written into it.
+    The table of a component is created the first time one of its rows
+    is written: its columns are the declared columns of the component,
+    followed by the other keys of the row. The columns have no type, so
+    the values are stored as they are. The keys of later rows that
+    aren't columns of the table yet are added to it.
+
+    The rows are buffered, and inserted in a single transaction every
+    `batch_size` rows, or whenever the file is flushed. The database is
+    in WAL mode, so it can be read while the spider writes into it.
+
+    The column `SqliteFile.key_columns` maps the component of a new table
+    to is its primary key, and a row whose key is already in the table
+    updates the row in the table (an upsert): crawling the same post
+    again updates its score, instead of adding another row. The key is
+    looked up by the component's name, not guessed from the columns of
+    its rows, as a row may carry the ids of other components too (a
+    comment carries the id of its video). The tables of the other
+    components, or whose rows don't have the key column, have no
+    primary key, and their rows are only inserted.
+    """
+
+    # Component name -> the column that identifies its rows.
+    key_columns = {
+        'post': 'post_id',
+        'comment': 'comment_id',
+        'comments': 'comment_id',
+        'tweet': 'tweet_id',
+        'tweet_user': 'user_id',
+        'video': 'vid_id',
+        'channel': 'channel_id',
+    }
+
+    file_path = ''
+    columns = {}        # Component name -> the declared column names.
+    batch_size = 0      # The number of rows inserted per transaction.
+    tables = {}         # Table name -> its column names.
+    keys = {}           # Table name -> its primary key column, or None.
+    rows = []           # The buffered (table name, row) pairs.
+
+    def __init__(self, file_path, columns=None, batch_size=1 << 16):
+        """
+        @param file_path: The path of the database.
+        @param columns: A dict of the component names to the names of the
+                        columns that come first in their tables.
+        @param batch_size: The number of rows inserted per transaction.
+        """
+        self.file_path = file_path
+        self.columns = columns or {}
+        self.batch_size = batch_size
+        self.tables = {}
+        self.keys = {}
+        self.rows = []
+        try:
+            # The transactions are begun and committed explicitly.
+            self.connection = sqlite3.connect(
+                file_path, isolation_level=None, check_same_thread=False
+            )
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+        except sqlite3.Error as e:
+            SqliteFile.__throw_error(
+                'Unable to open the database %s: %s' % (file_path, e)
+            )
+
+    def write(self, data):
+        """
+        @param data: A tuple `(name, row)` of the name of the component,
+                     and the row (a dict) to write into its table.
+        """
+        self.rows.append(data)
+        if len(self.rows) >= self.batch_size:
+            self.__insert_rows()
+
+    def writelines(self, rows):
+        """
+        @param rows: A list of `(name, row)` tuples to write.
+        """
+        self.rows.extend(rows)
+        if len(self.rows) >= self.batch_size:
+            self.__insert_rows()
+
+    def flush(self):
+        """
+        Insert the buffered rows.
+        """
+        if self.rows:
+            self.__insert_rows()
+
+    def sync(self):
+        """
+        Insert the buffered rows, and write the WAL into the database, on
+        the disk.
+        """
+        self.flush()
+        self.connection.execute('PRAGMA wal_checkpoint(FULL)')
+
+    def close(self):
+        """
+        Insert the buffered rows, and close the database.
+        """
+        if self.connection is None:
+            return
+        self.flush()
+        self.connection.close()
+        self.connection = None
+
+    def __insert_rows(self):
+        """
+        Insert the buffered rows in a single transaction.
+        """
+        # The rows of a table with the same keys are inserted at once.
+        groups = {}
+        for name, data in self.rows:
+            group = groups.setdefault((name, tuple(data)), [])
+            group.append(tuple(SqliteFile.__value(v) for v in data.values()))
+
+        try:
+            self.connection.execute('BEGIN')
+            for (name, names), values in groups.items():
+                self.__prepare_table(name, names)
+                self.connection.executemany(
+                    self.__statement(name, names), values
+                )
+            self.connection.execute('COMMIT')
+        except sqlite3.Error as e:
+            if self.connection.in_transaction:
+                self.connection.execute('ROLLBACK')
+            SqliteFile.__throw_error(
+                'Unable to write the rows into %s: %s' % (self.file_path, e)
+            )
+        self.rows = []
+
+    def __prepare_table(self, name, names):
+        """
+        @param name: The name of the table.
+        @param names: The names of the columns to be written.
+
+        Create the table if it doesn't exist yet, or add the columns it
+        doesn't have yet.
+        """
+        columns = self.tables.get(name)
+        if columns is None:
+            info = self.connection.execute(
+                'PRAGMA table_info(%s)' % SqliteFile.__quote(name)
+            ).fetchall()
+            columns = [c[1] for c in info]
+            keys = [c[1] for c in info if c[5] > 0]
+            self.tables[name] = columns
+            self.keys[name] = keys[0] if len(keys) == 1 else None
+
+        if not columns:
+            columns.extend(c for c in self.columns.get(name, ()))
+            columns.extend(n for n in names if n not in columns)
+            key = SqliteFile.key_columns.get(name)
+            if key not in columns:
+                key = None
+            definitions = [SqliteFile.__quote(c) for c in columns]
+            if key is not None:
+                definitions[columns.index(key)] += ' PRIMARY KEY'
+            self.connection.execute('CREATE TABLE %s (%s)' % (
+                SqliteFile.__quote(name), ', '.join(definitions)
+            ))
+            self.keys[name] = key
+            return
+
+        for n in names:
+            if n not in columns:
+                self.connection.execute('ALTER TABLE %s ADD COLUMN %s' % (
+                    SqliteFile.__quote(name), SqliteFile.__quote(n)
+                ))
+                columns.append(n)
+
+    def __statement(self, name, names):
+        """
+        Returns the statement that inserts (or updates) a row with the
+        columns `names` into the table `name`.
+        """
+        statement = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            SqliteFile.__quote(name),
+            ', '.join(SqliteFile.__quote(n) for n in names),
+            ', '.join('?' * len(names))
+        )
+        key = self.keys[name]
+        if key not in names:
+            return statement
+        updates = ', '.join(
+            '%s = excluded.%s' % (SqliteFile.__quote(n), SqliteFile.__quote(n))
+            for n in names if n != key
+        )
+        if not updates:
+            return statement + ' ON CONFLICT DO NOTHING'
+        return statement + ' ON CONFLICT (%s) DO UPDATE SET %s' % (
+            SqliteFile.__quote(key), updates
+        )
+
+    def __quote(name):
+        return '"%s"' % str(name).replace('"', '""')
+
+    def __value(value):
+        """
+        Returns the value as it's stored in the database: the lists and
+        dicts are stored as JSON, and the other values SQLite doesn't
+        store as they are, as strings.
+        """
+        if value is None or isinstance(value, (int, float, str, bytes)):
+            return value
+        if isinstance(value, (list, tuple, dict)):
+            return json.dumps(value, default=str)
+        return str(value)
+
+    def __throw_error(msg):
+        logging.error(msg)
+        raise ValueError(msg)
+
+class AsyncWriter:
+    """
+    The asynchronous writer takes the writing of the scraped data off the
+    thread running the spider: the items are put into a bounded queue,
+    from which a background thread takes them in batches and writes them
+    into an `OutputSink`. A slow disk then doesn't hold up the spider
+    until the queue is full.
+
+    When the queue is full, the spider either waits for some room in the
+    queue (the 'block' backpressure), or the item is dropped (the 'drop'
+    backpressure).
+
+    The writer has the same `write`, `flush` and `close` methods as the
+    sink. Closing the writer waits until every item in the queue is
+    written, and then syncs the files to the disk.
+    """
+
+    writers = [] # The writers that are not yet closed.
+
+    sink = None
+    backpressure = 'block'
+    batch_size = 0      # The maximum number of items written at once.
+    dropped = 0         # The number of items dropped so far.
+
+    __FLUSH = object()  # Asks the background thread to flush the sink.
+    __CLOSE = object()  # Asks the background thread to stop.
+
+    def __init__(
+            self, sink, queue_size=10000, backpressure='block',
+            batch_size=512
+        ):
+        """
+        @param sink: The `OutputSink` the items are written into. It must
+                     not be used by anything else until the writer is
+                     closed.
+        @param queue_size: The maximum number of items waiting to be
+                           written.
+        @param backpressure: Either 'block' or 'drop'. See above.
+        @param batch_size: The maximum number of items written at once.
+        """
+        if backpressure not in ('block', 'drop'):
+            AsyncWriter.__throw_error(
+                'Unknown backpressure: %s' % backpressure
+            )
+
+        self.sink = sink
+        self.backpressure = backpressure
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.error = None
+        self.closed = False
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(
+            target=self.__run, name='dmine-writer', daemon=True
+        )
+        self.thread.start()
+        AsyncWriter.writers.append(self)
+
+    def write(self, item):
+        """
+        @param item: The scraped data, either a `ComponentLoader` or a
+                     dict.
+
+        Put the item into the queue of items to be written. Returns True
+        if the item was put into the queue, or False if it was dropped.
+        """
+        self.__check_error()
+        if self.backpressure == 'block':
+            self.queue.put(item)
+            return True
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """
+        Have the background thread flush the sink, once the items already
+        in the queue are written.
+        """
+        self.__check_error()
+        self.queue.put(AsyncWriter.__FLUSH)
+
+    def close(self):
+        """
+        Wait until every item in the queue is written, then sync and close
+        the sink. This method can be called again (i.e. if it was
+        interrupted), in which case it goes on waiting.
+        """
+        if not self.closed:
+            self.closed = True
+            self.queue.put(AsyncWriter.__CLOSE)
+        self.thread.join()
+        if self in AsyncWriter.writers:
+            AsyncWriter.writers.remove(self)
+
+        if self.dropped > 0:
+            logging.warning('The writer dropped %d item(s) because its '\
+                            'queue was full.' % self.dropped)
+        self.__check_error()
+
+    def close_all():
+        """
+        Close every writer that is not yet closed.
+        """
+        for writer in list(AsyncWriter.writers):
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __run(self):
+        """
+        The loop of the background thread. The sink is flushed on the
+        sink's own schedule, even while no item is put into the queue.
+        """
+        sink = self.sink
+        closing = False
+        try:
+            while True:
+                try:
+                    item = self.queue.get(timeout=sink.flush_interval)
+                except queue.Empty:
+                    sink.flush()
+                    continue
+
+                batch = []
+                while True:
+                    if item is AsyncWriter.__CLOSE:
+                        closing = True
+                        sink.write_many(batch)
+                        sink.sync()
+                        return
+                    if item is AsyncWriter.__FLUSH:
+                        sink.write_many(batch)
+                        sink.flush()
+                        batch = []
+                    else:
+                        batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                sink.write_many(batch)
+        except Exception as e:
+            self.error = e
+            logging.error('The writer stopped: %s' % e)
+            # Keep emptying the queue, so that the spider's thread isn't
+            # blocked forever on a full queue.
+            while not closing:
+                closing = self.queue.get() is AsyncWriter.__CLOSE
+        finally:
+            sink.close()
+
+    def __check_error(self):
+        if self.error is not None:
+            AsyncWriter.__throw_error(
+                'Unable to write the scraped data: %s' % self.error
+            )
+
+    def __throw_error(msg):
+        logging.error(msg)
+        raise RuntimeError(msg)
+
+class Deduplicator:
+    """
+    The deduplicator suppresses the items a spider yields more than once,
+    i.e. the same post found in both the hot and the new listings. An
+    item is identified by its component name, and by the column the
+    component is keyed on in `SqliteFile.key_columns`, or else the first
+    of the `Deduplicator.id_keys` found in its data. The items without
+    any of these keys are never suppressed.
+
+    The keys of the items seen so far are kept in a bounded structure,
+    either:
+        - 'lru': the set of the `size` keys seen last. An item seen again
+          after `size` other items isn't suppressed.
+        - 'bloom': a Bloom filter for `size` keys, with a false positive
+          rate of `error_rate`: that many of the new items are wrongly
+          suppressed (more, once it holds more than `size` keys). It
+          takes much less memory than the LRU set (about 1.8 MB for a
+          million keys).
+
+    The keys can also be kept in a store (an SQLite database), so that
+    the items of a previous run aren't yielded again either.
+
+    An item is only remembered once it is added, i.e. once it is written,
+    so that an item that wasn't written (i.e. dropped by an `AsyncWriter`)
+    isn't suppressed later on.
+
+    Usage:
+        >> dedup = Deduplicator('lru', store_path='seen.db')
+        >> for item in spider.start(scrape_filter):
+        >>     if not dedup.is_duplicate(item) and sink.write(item):
+        >>         dedup.add(item)
+        >> dedup.close()
+    """
+
+    # The keys that identify the data of a component, in order of
+    # preference.
+    id_keys = (
+        'post_id', 'comment_id', 'tweet_id', 'vid_id', 'user_id',
+        'channel_id'
+    )
+
+    method = 'lru'
+    size = 0            # The number of keys the structure holds.
+    suppressed = 0      # The number of items suppressed so far.
+    seen = None         # The LRU set (an OrderedDict), or None.
+    bits = None         # The bits of the Bloom filter, or None.
+    hashes = 0          # The number of bits set per key in the filter.
+    store = None        # The connection to the store, or None.
+    pending = 0         # The number of keys not yet committed to the
+                        # store.
+
+    # The keys put into the store are committed every this many keys.
+    store_batch_size = 1024
+
+    def __init__(
+            self, method='lru', size=1000000, store_path=None,
+            error_rate=0.001
+        ):
+        """
+        @param method: Either 'lru' or 'bloom' (see above).
+        @param size: The number of keys the structure holds.
+        @param store_path: The path of the store, or None.
+        @param error_rate: The false positive rate of the Bloom filter.
+        """
+        if method not in ('lru', 'bloom'):
+            Deduplicator.__throw_error(
+                'Unknown deduplication method: %s' % method
+            )
+        self.method = method
+        self.size = size
+        self.suppressed = 0
+        if method == 'lru':
+            self.seen = collections.OrderedDict()
+        else:
+            # The optimal number of bits, and of bits set per key.
+            n = -size * math.log(error_rate) / math.log(2) ** 2
+            self.bits = bytearray(int(n) // 8 + 1)
+            self.hashes = max(1, round(n / size * math.log(2)))
+
+        self.store = None
+        self.pending = 0
+        if store_path is not None:
+            try:
+                self.store = sqlite3.connect(store_path, isolation_level=None)
+                self.store.execute('PRAGMA journal_mode = WAL')
+                self.store.execute(
+                    'CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY)'
+                )
+            except sqlite3.Error as e:
+                Deduplicator.__throw_error(
+                    'Unable to open the deduplication store %s: %s'
+                    % (store_path, e)
+                )
+
+    def is_duplicate(self, item):
+        """
+        @param item: The scraped data, either a `ComponentLoader` or a
+                     dict.
+
+        Returns True if the item was added before, and counts it as
+        suppressed.
+        """
+        key = Deduplicator.key(item)
+        if key is None:
+            return False
+
+        if self.__contains(key) or self.__stored(key):
+            self.suppressed += 1
+            return True
+        return False
+
+    def add(self, item):
+        """
+        @param item: See `is_duplicate`.
+
+        Remember the item, and put its key into the store.
+        """
+        key = Deduplicator.key(item)
+        if key is not None:
+            self.__add(key)
+
+    def key(item):
+        """
+        @param item: See `is_duplicate`.
+
+        Returns the key that identifies the item, or None if it has none.
+        """
+        if isinstance(item, ComponentLoader):
+            name, data = item.name, item.data
+        else:
+            name, data = '', item
+        k = SqliteFile.key_columns.get(name)
+        if k is not None and data.get(k) is not None:
+            return '%s:%s' % (name, data[k])
+        for k in Deduplicator.id_keys:
+            value = data.get(k)
+            if value is not None:
+                return '%s:%s' % (name, value)
+        return None
+
+    def close(self):
+        """
+        Commit the keys to the store, and close it.
+        """
+        if self.store is None:
+            return
+        if self.store.in_transaction:
+            self.store.execute('COMMIT')
+        self.store.close()
+        self.store = None
+
+    def __contains(self, key):
+        if self.seen is not None:
+            if key in self.seen:
+                self.seen.move_to_end(key)
+                return True
+            return False
+        return all(
+            self.bits[i >> 3] & (1 << (i & 7)) for i in self.__bit_indexes(key)
+        )
+
+    def __stored(self, key):
+        """
+        Returns True if the key is in the store. The key is then
+        remembered again, as it is likely to be seen again.
+        """
+        if self.store is None:
+            return False
+        found = self.store.execute(
+            'SELECT 1 FROM seen WHERE key = ?', (key,)
+        ).fetchone() is not None
+        if found:
+            self.__remember(key)
+        return found
+
+    def __add(self, key):
+        self.__remember(key)
+        if self.store is None:
+            return
+        if not self.store.in_transaction:
+            self.store.execute('BEGIN')
+        self.store.execute('INSERT OR IGNORE INTO seen VALUES (?)', (key,))
+        self.pending += 1
+        if self.pending >= Deduplicator.store_batch_size:
+            self.store.execute('COMMIT')
+            self.pending = 0
+
+    def __remember(self, key):
+        if self.seen is not None:
+            self.seen[key] = None
+            if len(self.seen) > self.size:
+                self.seen.popitem(last=False)
+            return
+        for i in self.__bit_indexes(key):
+            self.bits[i >> 3] |= 1 << (i & 7)
+
+    def __bit_indexes(self, key):
+        """
+        Returns the indexes of the bits of the key in the Bloom filter,
+        from two hashes of the key (double hashing).
+        """
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        m = len(self.bits) * 8
+        return [(h1 + i * h2) % m for i in range(self.hashes)]
+
+    def __throw_error(msg):
+        logging.error(msg)
+        raise ValueError(msg)
+
+class ListingScheduler:
+    """
+    The listing scheduler interleaves the items of several listings (any
+    iterables, i.e. the hot and the new listings of a subreddit): it
+    takes up to `batch_size` items from each listing in turn, round-
+    robin, until every listing is exhausted.
+
+    Each listing is iterated in a thread of its own, which puts its items
+    into a bounded queue. A listing waiting on a slow request (i.e. a top
+    listing paging deep into its results) doesn't hold up the others: it
+    is skipped in its turn, until its items come. Since the thread of a
+    listing stops once its queue is full, a listing can't take more than
+    its share of the requests either.
+
+    Usage:
+        >> for item in ListingScheduler([hot, new, top]):
+        >>     print(item)
+    """
+
+    listings = []
+    batch_size = 1      # The number of items taken from a listing in
+                        # its turn.
+    queue_size = 100    # The number of items a listing fetches ahead.
+
+    __END = object()    # Put into the queue of a listing once it's
+                        # exhausted.
+
+    # How long (in seconds) the threads wait before checking if the
+    # scheduler is stopped.
+    poll_interval = 0.1
+
+    def __init__(self, listings, batch_size=1, queue_size=100):
+        """
+        @param listings: The iterables to interleave.
+        @param batch_size: The number of items taken from a listing in
+                           its turn.
+        @param queue_size: The number of items fetched ahead from each
+                           listing.
+        """
+        self.listings = list(listings)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+    def __iter__(self):
+        """
+        Yields the items of the listings, interleaved. An error raised
+        while iterating a listing is raised here, in its turn.
+        """
+        stopped = threading.Event()
+        ready = threading.Event() # Set whenever an item is put.
+        queues = [queue.Queue(self.queue_size) for _ in self.listings]
+        for listing, q in zip(self.listings, queues):
+            threading.Thread(
+                target=ListingScheduler.__fetch,
+                args=(listing, q, ready, stopped),
+                name='listing', daemon=True
+            ).start()
+
+        try:
+            active = list(queues)
+            while active:
+                ready.clear()
+                taken = False
+                for q in list(active):
+                    for _ in range(self.batch_size):
+                        try:
+                            item = q.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is ListingScheduler.__END:
+                            active.remove(q)
+                            break
+                        if isinstance(item, ListingScheduler.__Error):
+                            raise item.error
+                        taken = True
+                        yield item
+                if not taken:
+                    ready.wait(ListingScheduler.poll_interval)
+        finally:
+            stopped.set()
+
+    def __fetch(listing, q, ready, stopped):
+        """
+        Put the items of the listing into the queue, until the listing is
+        exhausted or the scheduler is stopped.
+        """
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    q.put(item, timeout=ListingScheduler.poll_interval)
+                    ready.set()
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for item in listing:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(ListingScheduler.__Error(e))
+            return
+        put(ListingScheduler.__END)
+
+    class __Error:
+        """
+        An error raised while iterating a listing.
+        """
+
+        def __init__(self, error):
+            self.error = error
+
+class RateLimiter:
+    """
+    A token bucket limiting the rate of the requests made by a spider to
+    `rate` requests per `period` seconds, with bursts of up to `burst`
+    requests. Every request takes a token from the bucket first, and
+    waits for it if the bucket is empty. Unlike the rate limiters of the
+    API clients (i.e. prawcore's), which each assume they have the whole
+    rate limit to themselves, a single bucket is shared by all the
+    requests, whatever makes them:
+        - 'thread': the bucket is kept in memory, and shared by the
+          threads of the process (i.e. the workers of a spider).
+        - 'file': the bucket is kept in a file, locked while a token is
+          taken, and shared by the processes using the same file (i.e.
+          several spiders run with the same credentials).
+
+    A request that has to wait reserves its token right away, so the
+    waiting requests go in turn, one every `period / rate` seconds.
+
+    Usage:
+        >> limiter = RateLimiter(600, 600)
+        >> session = limiter.session()      # A requests session.
+        >> limiter.acquire()                # Before any other request.
+        >> logging.info(limiter.stats())
+    """
+
+    rate = 0
+    period = 0
+    burst = 1
+    backend = 'thread'
+    file_path = None    # The file of the bucket, in the 'file' backend.
+
+    # The metrics of the requests of this process.
+    requests = 0        # The number of tokens taken.
+    waits = 0           # The number of requests that had to wait.
+    wait_time = 0.0     # The time (in seconds) spent waiting.
+    max_wait = 0.0      # The longest wait.
+
+    def __init__(
+            self, rate, period=1.0, burst=1, backend='thread', file_path=None
+        ):
+        """
+        @param rate: The number of requests per `period`.
+        @param period: The period of the rate, in seconds.
+        @param burst: The number of requests that can be made at once,
+                      i.e. the size of the bucket.
+        @param backend: Either 'thread' or 'file' (see above).
+        @param file_path: The file of the bucket, in the 'file' backend.
+        """
+        if rate <= 0 or period <= 0 or burst < 1:
+            RateLimiter.__throw_error(
+                'Invalid rate limit: %s requests per %s seconds, in bursts '\
+                'of %s.' % (rate, period, burst)
+            )
+        if backend == 'file':
+            if fcntl is None:
+                RateLimiter.__throw_error(
+                    'The file backend of the rate limiter requires fcntl.'
+                )
+            if not file_path:
+                RateLimiter.__throw_error(
+                    'The file backend of the rate limiter requires a file.'
+                )
+        elif backend != 'thread':
+            RateLimiter.__throw_error(
+                'Unknown rate limiter backend: %s' % backend
+            )
+
+        self.rate = rate
+        self.period = period
+        self.burst = burst
+        self.backend = backend
+        self.file_path = file_path
+        self.requests = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+        # The threads of the process take turns, in both backends (the
+        # lock of the file doesn't keep them apart).
+        self.lock = threading.Lock()
+        self.tokens = float(burst)
+        self.last_time = time.monotonic()
+        self.fd = None
+        if backend == 'file':
+            self.fd = os.open(file_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def acquire(self, tokens=1):
+        """
+        @param tokens: The number of tokens to take.
+
+        Take tokens from the bucket, waiting until they are there.
+        Returns the time waited, in seconds.
+        """
+        with self.lock:
+            if self.backend == 'file':
+                wait = self.__reserve_file(tokens)
+            else:
+                now = time.monotonic()
+                self.tokens, wait = self.__reserve(
+                    self.tokens, now - self.last_time, tokens
+                )
+                self.last_time = now
+
+            self.requests += tokens
+            if wait > 0:
+                self.waits += 1
+                self.wait_time += wait
+                self.max_wait = max(self.max_wait, wait)
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def wrap(self, func):
+        """
+        Returns the function, taking a token before each call.
+        """
+        def limited(*args, **kwargs):
+            self.acquire()
+            return func(*args, **kwargs)
+        return limited
+
+    def session(self, session=None):
+        """
+        @param session: A requests session, or None for a new one.
+
+        Returns the session, whose requests each take a token first.
+        """
+        if requests is None:
+            RateLimiter.__throw_error(
+                'A rate limited session requires the requests package.'
+            )
+        if session is None:
+            session = requests.Session()
+        session.request = self.wrap(session.request)
+        return session
+
+    def stats(self):
+        """
+        Returns the metrics of the rate limiter, in a printable string.
+        """
+        return 'Rate limiter: %d requests, %d waited %.1fs in total '\
+               '(%.3fs per request, %.1fs at most).' % (
+                   self.requests, self.waits, self.wait_time,
+                   self.wait_time / max(self.requests, 1), self.max_wait
+               )
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __reserve(self, tokens, elapsed, n):
+        """
+        @param tokens: The tokens in the bucket (negative if the coming
+                       tokens are already reserved).
+        @param elapsed: The time since the tokens were counted.
+        @param n: The number of tokens to take.
+
+        Returns a tuple `(tokens, wait)`: the tokens left in the bucket
+        once `n` are taken, and how long to wait for them.
+        """
+        refill = self.rate / self.period
+        tokens = min(self.burst, tokens + elapsed * refill) - n
+        return tokens, max(0.0, -tokens / refill)
+
+    def __reserve_file(self, n):
+        """
+        Take the tokens from the bucket in the file (see `__reserve`).
+        The file holds the tokens and the time they were counted.
+        """
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            # The processes share the wall clock, not the monotonic one.
+            now = time.time()
+            data = os.pread(self.fd, 16, 0)
+            if len(data) == 16:
+                tokens, last_time = struct.unpack('<dd', data)
+            else:
+                tokens, last_time = float(self.burst), now
+            tokens, wait = self.__reserve(
+                tokens, max(0.0, now - last_time), n
+            )
+            os.pwrite(self.fd, struct.pack('<dd', tokens, now), 0)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        return wait
+
+    def __throw_error(msg):
+        logging.error(msg)
+        raise ValueError(msg)
+
 class Utils:
     """
     This class contains utility methods, and should not be instantiated.
@@ -501,36 +2776,12 @@ class Utils:
         If no filename is specified, then print to stdout.
         Otherwise, print to specified file. The default output
         format is JSON.
-        """
-
-        # Store in JSON format.
-        if file_format == 'json':
-            if filename:
-                with open(filename, 'a') as f:
-                    s = json.dumps(data)
-                    f.write(s)
-            else:
-                s = json.dumps(data)
-                sys.stdout.write(s)
 
-        # Store in JSONL format.
-        if file_format == 'jsonl':
-            if filename:
-                with jsonlines.open(filename, mode='a') as w:
-                    w.write(data)
-            else:
-                s = json.dumps(data)
-                sys.stdout.write(s + '\n')
-
-        # Store in CSV format.
-        elif file_format == 'csv':
-            if filename:
-                with open(filename, 'a') as f:
-                    row = ','.join(list(data.values()))
-                    f.write(row)
-            else:
-                row = ','.join(['\"' + v + '\"' for v in list(data.values())])
-                sys.stdout.write(row)
+        The file is opened and closed again for this single dict; use an
+        `OutputSink` to write many of them.
+        """
+        with OutputSink(filename, file_format=file_format) as sink:
+            sink.write(data)
 
     def component_loader_to_file(\
             component_loader, out_dir, file_format='json'\
@@ -546,24 +2797,12 @@ class Utils:
         The name of each file should have a basename corresponding
         to `component_loader.name`, and its extension should be
         `file_format`.
-        """
-        
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
-        path = os.path.realpath(out_dir)
 
-        file_path = path + '/' + component_loader.name + '.' + file_format
-        data = component_loader.data
-        
-        if file_format == 'json':
-            with open(file_path, 'a') as f:
-                s = json.dumps(data)
-                f.write(s)
-
-        elif file_format == 'jsonl':
-            with open(file_path, 'a') as f:
-                s = json.dumps(data)
-                f.write(s + '\n')
+        The file is opened and closed again for this single component; use
+        an `OutputSink` to write many of them.
+        """
+        with OutputSink(out_dir=out_dir, file_format=file_format) as sink:
+            sink.write(component_loader)
 
     def sfl_file_to_string(sfl_file):
         """
@@ -585,6 +2824,9 @@ class Spider:
     __metaclass__ = ABCMeta 
     name = ''
     args = None
+    state = None # The `SpiderState` kept between runs, or None.
+    rate_limiter = None # The `RateLimiter` of the spider's requests, or
+                        # None.
 
     def __init__(self):
         """
@@ -595,6 +2837,8 @@ class Spider:
         self.input_group = None
         self.name = ''
         self.args = None
+        self.state = None
+        self.rate_limiter = None
 
         # Check for duplicate name.
         for c in Spider.__subclasses__():
@@ -609,6 +2853,26 @@ class Spider:
                 )
                 raise
 
+    def session(self):
+        """
+        Returns a requests session for the requests of the spider, which
+        wait for the spider's rate limiter, if any.
+        """
+        if self.rate_limiter is not None:
+            return self.rate_limiter.session()
+        if requests is None:
+            logging.error('A session requires the requests package.')
+            raise ImportError('requests')
+        return requests.Session()
+
+    def acquire(self):
+        """
+        Wait for the spider's rate limiter (if any) before a request made
+        by other means than `session`, i.e. through an API client.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
     @abstractmethod
     def setup_filter(self, scrape_filter):
         """
@@ -629,6 +2893,65 @@ class Spider:
         # Spider do job.
         pass
 
+class SpiderState:
+    """
+    The state a spider keeps from one run to the next, i.e. the newest
+    post seen in each listing, so that the next run only fetches the
+    posts that came after it. The state is a dict of JSON values, stored
+    in the file `<spider name>.json` inside the state directory.
+
+    Usage:
+        >> state = SpiderState('state_dir', 'reddit')
+        >> mark = state.get('r/gaming/new')
+        >> state.set('r/gaming/new', {'created_utc': 1760792400.0})
+        >> state.save()
+    """
+
+    file_path = ''
+    values = {}
+
+    def __init__(self, state_dir, spider_name):
+        """
+        @param state_dir: The directory of the state files.
+        @param spider_name: The name of the spider.
+        """
+        if not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+        self.file_path = os.path.join(state_dir, spider_name + '.json')
+        self.values = {}
+        try:
+            with open(self.file_path, 'r') as f:
+                self.values = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            SpiderState.__throw_error(
+                'Unable to read the state file %s: %s' % (self.file_path, e)
+            )
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    def save(self):
+        """
+        Write the state into its file. The file is replaced atomically,
+        so it is never left half written.
+        """
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            # A copy, as the listings may still be scanned in threads.
+            json.dump(dict(self.values), f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.file_path)
+
+    def __throw_error(msg):
+        logging.error(msg)
+        raise ValueError(msg)
+
 class ComponentLoader:
     """
     This class used to pass the scraped data as components instead
@@ -10,7 +10,9 @@ import logging
 import time
 import math
 import re
-from dmine import Utils, Spider, ScrapeFilter, ComponentLoader, Project
+from dmine import Utils, Spider, ScrapeFilter, ComponentLoader, Project,\
+                  FilterCache, OutputSink, AsyncWriter,\
+                  Deduplicator, SpiderState, RateLimiter
 from spiders import *
 
 def main():
@@ -59,15 +61,171 @@ def main():
                              'valid verbosity level is either DEBUG, INFO, '\
                              'WARNING, ERROR or CRITICAL.')
 
+    parser.add_argument('--no-filter-cache', action='store_false',
+                        dest='filter_cache',
+                        help='Always parse the SFL script, instead of '\
+                             'loading it from the cache of previously '\
+                             'parsed scripts. The hits and misses of the '\
+                             'cache are logged with -v INFO.')
+
     parser.add_argument('-w', '--format', default='json',
                         metavar='<file_format>',
-                        choices=['json', 'jsonl', 'csv'],
+                        choices=['json', 'jsonl', 'csv', 'parquet', 'arrow',
+                                 'sqlite'],
                         dest='file_format',
                         help='The format of the output. The supported '\
-                             'file formats are JSON, JSONL, and CSV. '\
+                             'file formats are JSON, JSONL, CSV, Parquet '\
+                             'and Arrow (the last two require pyarrow), '\
+                             'and SQLite (a table per component). The '\
+                             'last three require an output file or '\
+                             'directory. '\
                              'By default, output will be written in '\
                              'JSON format.')
 
+    parser.add_argument('--serializer', default='auto',
+                        choices=['auto', 'orjson', 'ujson', 'json'],
+                        metavar='<library>',
+                        dest='serializer',
+                        help='The JSON library used to write the JSON and '\
+                             'JSONL formats: orjson, ujson or json (the '\
+                             'standard library). By default, the fastest '\
+                             'one installed is used.')
+
+    parser.add_argument('--compress', default=None,
+                        choices=['gzip', 'zstd'],
+                        metavar='<compression>',
+                        dest='compress',
+                        help='Compress the output files with either gzip '\
+                             'or zstd (which requires zstandard). The '\
+                             'data written before each flush (see '\
+                             '--flush-interval) stays readable even if '\
+                             'the spider is killed.')
+
+    parser.add_argument('--compress-level', default=None, type=int,
+                        metavar='<level>',
+                        dest='compress_level',
+                        help='The compression level of --compress.')
+
+    parser.add_argument('--row-group-size', default=65536, type=int,
+                        metavar='<rows>',
+                        dest='row_group_size',
+                        help='The number of rows written at once in the '\
+                             'Parquet, Arrow and SQLite formats. The '\
+                             'default is 65536.')
+
+    parser.add_argument('--rotate-size', default=None, type=int,
+                        metavar='<bytes>',
+                        dest='rotate_size',
+                        help='Rotate the output files when they reach '\
+                             'this size. Each output file is then split '\
+                             'into numbered files, each renamed from a '\
+                             'temporary name once it is complete.')
+
+    parser.add_argument('--rotate-records', default=None, type=int,
+                        metavar='<records>',
+                        dest='rotate_records',
+                        help='Rotate the output files when they hold '\
+                             'this many records.')
+
+    parser.add_argument('--rotate-interval', default=None,
+                        choices=['minute', 'hour', 'day'],
+                        metavar='<interval>',
+                        dest='rotate_interval',
+                        help='Rotate the output files every minute, hour '\
+                             'or day (UTC), e.g. into '\
+                             'comment-2026-10-18T13.jsonl.')
+
+    parser.add_argument('--flush-interval', default=1.0, type=float,
+                        metavar='<seconds>',
+                        dest='flush_interval',
+                        help='The maximum time the scraped data is kept '\
+                             'in the output buffers before it is written. '\
+                             'The default is 1 second.')
+
+    parser.add_argument('--dedup', default=None,
+                        choices=['lru', 'bloom'],
+                        metavar='<method>',
+                        dest='dedup',
+                        help='Suppress the items the spider yields more '\
+                             'than once (i.e. the same post in several '\
+                             'listings), keyed by their ids. The ids seen '\
+                             'are kept either in an LRU set (lru) or in a '\
+                             'Bloom filter (bloom), which takes less '\
+                             'memory but wrongly suppresses about 0.1%% '\
+                             'of the items.')
+
+    parser.add_argument('--dedup-size', default=1000000, type=int,
+                        metavar='<ids>',
+                        dest='dedup_size',
+                        help='The number of ids kept by --dedup. The '\
+                             'default is 1000000.')
+
+    parser.add_argument('--dedup-store', default=None,
+                        metavar='<file>',
+                        dest='dedup_store',
+                        help='An SQLite database in which the ids seen '\
+                             'by --dedup are kept, so that items written '\
+                             'in previous runs are suppressed too.')
+
+    parser.add_argument('--state-dir', default=None,
+                        metavar='<directory>',
+                        dest='state_dir',
+                        help='The directory in which the spider keeps '\
+                             'its state between runs, i.e. the newest '\
+                             'post seen in each listing, so that the '\
+                             'next run only scrapes the newer posts. The '\
+                             'state is saved when the spider runs to its '\
+                             'end or times out (not if it is '\
+                             'interrupted), and only holds the listings '\
+                             'scanned in full.')
+
+    parser.add_argument('--rate-limit', default=None,
+                        type=arg_rate_limit,
+                        metavar='<requests>/<seconds>',
+                        dest='rate_limit',
+                        help='Limit the requests of the spider to a '\
+                             'number of requests per number of seconds, '\
+                             'i.e. 600/600. The limit is shared by all '\
+                             'the threads of the spider (and by all the '\
+                             'processes using the same --rate-limit-file).')
+
+    parser.add_argument('--rate-limit-burst', default=1, type=int,
+                        metavar='<requests>',
+                        dest='rate_limit_burst',
+                        help='The number of requests that can be made at '\
+                             'once under --rate-limit. By default, the '\
+                             'requests are evenly spaced.')
+
+    parser.add_argument('--rate-limit-file', default=None,
+                        metavar='<file>',
+                        dest='rate_limit_file',
+                        help='Share the --rate-limit with the other '\
+                             'processes using this file (i.e. spiders '\
+                             'run with the same credentials).')
+
+    parser.add_argument('--async-writer', action='store_true',
+                        dest='async_writer',
+                        help='Write the scraped data from a background '\
+                             'thread, so that writing it never holds up '\
+                             'the spider.')
+
+    parser.add_argument('--writer-queue-size', default=10000, type=int,
+                        metavar='<size>',
+                        dest='writer_queue_size',
+                        help='The maximum number of scraped items waiting '\
+                             'to be written by the background writer. '\
+                             'The default is 10000.')
+
+    parser.add_argument('--writer-backpressure', default='block',
+                        choices=['block', 'drop'],
+                        metavar='<policy>',
+                        dest='writer_backpressure',
+                        help='What to do when the queue of the background '\
+                             'writer is full: either \'block\' the spider '\
+                             'until there is room in the queue, or '\
+                             '\'drop\' the scraped item. The default is '\
+                             '\'block\'.')
+
     parser.add_argument('-t', '--timeout', default=math.inf,
                         type=arg_timeout,
                         metavar='<duration>',
@@ -171,19 +329,35 @@ def run_spider(instance, args):
 
     # If args.filter value is an sfl file, then use the utility method
     # to read the file.
+    # The list files of the script are found next to the script's file.
     sfl_script = args.filter
+    script_dir = None
     if re.match('^.+\.sfl$', args.filter):
         sfl_script = Utils.sfl_file_to_string(args.filter)
+        script_dir = os.path.dirname(os.path.abspath(args.filter))
 
     # Set up scrape filter.
+    FilterCache.enabled = args.filter_cache
     scrape_filter = ScrapeFilter(
                           sfl_script,
-                          spider_name=instance.name
+                          spider_name=instance.name,
+                          script_dir=script_dir
                       )
+    logging.info(FilterCache.stats())
     instance.setup_filter(scrape_filter)
     scrape_filter.run_interpreter()
 
-    # Start spider.
+    # Start spider. The state of the spider is saved once it's done or
+    # timed out, if every item it yielded is written.
+    if args.state_dir:
+        instance.state = SpiderState(args.state_dir, type(instance).name)
+    if args.rate_limit:
+        rate, period = args.rate_limit
+        instance.rate_limiter = RateLimiter(
+            rate, period, burst=args.rate_limit_burst,
+            backend='file' if args.rate_limit_file else 'thread',
+            file_path=args.rate_limit_file
+        )
     results = instance.start(scrape_filter)
 
     if results is None:
@@ -200,27 +374,71 @@ def run_spider(instance, args):
     # some spiders yield ComponentLoader object instead of dict object).
     #
     # The iteration stops when there's nothing more to iterate or when
-    # a timeout forces it to stop.
-    for r in results:
-        if time.time() > timeout:
-            break
+    # a timeout forces it to stop. Either way (or if the run is
+    # interrupted), the output files are flushed and closed.
+    #
+    # In the CSV and columnar formats, the attributes of each component
+    # come first in its file.
+    sink = OutputSink(
+        args.output_file, args.output_dir,
+        file_format=args.file_format, flush_interval=args.flush_interval,
+        columns={name: list(comp.attr)
+                 for name, comp in scrape_filter.comp.items()},
+        row_group_size=args.row_group_size,
+        compress=args.compress, compress_level=args.compress_level,
+        serializer=args.serializer, rotate_size=args.rotate_size,
+        rotate_records=args.rotate_records,
+        rotate_interval=args.rotate_interval
+    )
+    if args.async_writer:
+        sink = AsyncWriter(
+            sink, queue_size=args.writer_queue_size,
+            backpressure=args.writer_backpressure
+        )
+    # The duplicated items are suppressed before they are written.
+    dedup = None
+    if args.dedup:
+        dedup = Deduplicator(
+            args.dedup, size=args.dedup_size, store_path=args.dedup_store
+        )
+    finished = False
+    try:
+        for r in results:
+            if time.time() > timeout:
+                break
 
-        if args.output_dir:
-            if not isinstance(r, ComponentLoader):
+            if args.output_dir and not isinstance(r, ComponentLoader):
                 msg = 'Unable to use -O option for spider \'%s\': '\
                       '(scraped data is not return as ComponentLoader '\
                       'object).'\
                       % (type(instance).name)
                 logging.error(msg)
                 raise RuntimeError(msg)
-            Utils.component_loader_to_file(
-                r, args.output_dir, file_format=args.file_format
-            )
-        else:
-            if isinstance(r, ComponentLoader):
-                data = r.data
-            Utils.dict_to_file(data, args.output_file, 
-                          file_format=args.file_format)
+            if dedup is not None and dedup.is_duplicate(r):
+                continue
+            # The item is only remembered once the writer accepts it, so
+            # that an item dropped by the writer isn't suppressed later.
+            if sink.write(r) and dedup is not None:
+                dedup.add(r)
+        # Stopped by a timeout, or finished.
+        finished = True
+    finally:
+        sink.close()
+        if instance.state is not None:
+            if finished and getattr(sink, 'dropped', 0) == 0:
+                instance.state.save()
+            else:
+                logging.warning('The state of the spider is not saved, as '\
+                                'the run was interrupted, or some items '\
+                                'were not written.')
+        if dedup is not None:
+            dedup.close()
+            logging.info('Suppressed %d duplicated items.' % dedup.suppressed)
+        if instance.rate_limiter is not None:
+            instance.rate_limiter.close()
+            logging.info(instance.rate_limiter.stats())
+
+    logging.info('SFL term decisions:\n%s' % scrape_filter.filter_stats())
 
 ##################################################
 # Args parsing methods
@@ -277,6 +495,24 @@ def arg_timeout(string):
     # Return the time in seconds.
     return sum([time_list[i] * convert[i] for i in range(len(time_list))])
 
+# @param string: The string obtained from argparse.
+#
+# The string is expected to be of pattern r/s, where r is a number of
+# requests and s a number of seconds. Returns the tuple (r, s).
+def arg_rate_limit(string):
+    try:
+        rate, period = string.split('/')
+        rate, period = float(rate), float(period)
+    except ValueError:
+        msg = 'The rate limit should be in the format R/S, where R is '\
+              'a number of requests and S a number of seconds.'
+        raise argparse.ArgumentTypeError(msg)
+
+    if rate <= 0 or period <= 0:
+        msg = 'Invalid rate limit: \'%s\'' % string
+        raise argparse.ArgumentTypeError(msg)
+    return rate, period
+
 ##################################################
 # Helper methods
 ##################################################
@@ -336,5 +572,8 @@ if __name__ == '__main__':
         main() 
     except KeyboardInterrupt:
         print('\nProgram terminated by user.')
+        # Write the scraped data still waiting in the queue of the
+        # background writer, if any, instead of dropping it.
+        AsyncWriter.close_all()
         sys.exit(0)
 
@@ -16,119 +16,98 @@ Reference materials:
 
 """
 
+import os
 import re
-import copy
 import logging
+import itertools
+
+# NumPy is optional. Without it, a batch of records is filtered one
+# record at a time (see `Interpreter.output_batch`).
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class Lexer:
+    """
+    The lexer is driven by the `Lexer.patterns` table: all of the token
+    patterns are joined into a single compiled regular expression, which
+    is used to scan the input stream in one pass.
+    """
+
+    # The name and the regex pattern of each kind of token, in the order
+    # they are tried at each position of the input stream.
+    #
+    # A word may be a boolean, an operator (i.e. `and`) or an identifier;
+    # see `Lexer.words`. A number must not be directly followed by a word
+    # char, so 123abc is not an integer. A string directly preceded by
+    # `file` is the path of a list file, whereas `file` alone is just a
+    # word. The last pattern matches any char that doesn't start a valid
+    # token.
+    patterns = (
+        ('whitespace', r'\s+'),
+        ('string', r'"[^"]*"|\'[^\']*\''),
+        ('file', r'file(?:"[^"]*"|\'[^\']*\')'),
+        ('storable', r'@[a-zA-Z0-9_]+'),
+        ('number', r'-?\d+(?:\.\d+)?(?![\w.])'),
+        ('word', r'[_a-zA-Z][_a-zA-Z0-9]*'),
+        ('operator', r'<=|>=|==|!=|[<>=(){}\[\],]'),
+        ('error', r'.'),
+    )
+
+    # The words that aren't identifiers.
+    words = {
+        'True': ('boolean', 'True'),
+        'False': ('boolean', 'False'),
+        'and': ('and', ''),
+        'or': ('or', ''),
+        'not': ('not', ''),
+        'in': ('in', ''),
+        'search': ('search', ''),
+    }
+
+    regex = re.compile(
+        '|'.join('(?P<%s>%s)' % pattern for pattern in patterns), re.DOTALL
+    )
 
     # @param line: The input line.
     #
-    # Returns a generator of tokens taken from the input line.
+    # Returns a list of tokens taken from the input line.
     def lexer(line):
         logging.info('Starting lexical analyzing  the input stream...')
 
         # A list of token (a tuple with an type of token and the value
         # of the token itself).
         tokens = []
-    
-        i = 0
-        c = ''
-        opt_chars = '[(){}<>!=andornotin\[\]\,search]'
-        while i < len(line):
-            errored_token = line[i]
-            # Ignore whitespace.
-            if Lexer.__is_whitespace(line[i]):
-                i += 1
+        append = tokens.append
+        words = Lexer.words
 
-            # Ignore new lines.
-            elif Lexer.__is_newline(line[i]):
-                i += 1
+        for match in Lexer.regex.finditer(line):
+            kind = match.lastgroup
+            if kind == 'whitespace':
+                continue
 
-            # TYPE: identifier, operator, or boolean.
-            #
-            # Since there exists some operators with alphabetical
-            # character, the starting char of an identifier may
-            # be confused with an operator's.
-            #
-            # Boolean is also consists of alphabetical chars, 
-            # similar to identifier.
-            elif re.match('[_a-zA-Z]', line[i])\
-            or   re.match(opt_chars, line[i]):
-
-                operator = ''
-                identifier = ''
-                boolean = ''
-
-                # Assume it's a boolean value.
-                boolean, i = Lexer.__scan(
-                    i, line, '[TrueFalse]', '^(True|False)$'
-                )
-                if boolean:
-                    tokens.append(('boolean', boolean))
-                    continue
-
-                # Assume it's an operator.
-                opts = '^(\(|\)|\{|\}|<|<=|>|>=|=='\
-                       '|!=|=|and|or|not|in|search|\[|\]|,)$'
-                operator, i = Lexer.__scan(
-                    i, line, opt_chars, opts
-                )
-                if operator:
-                    tokens.append((operator, ''))
-                    continue
-                
-                # Assume it's an identifier.
-                identifier, i = Lexer.__scan(
-                    i, line, '[_a-zA-Z0-9]', '^[a-zA-Z0-9_]+$', last=True
-                )
-                if identifier:
-                    tokens.append(('identifier', identifier))
-                    continue
-
-            # TYPE: string
-            #
-            # A token of type string starts with a quote character.
-            # Either a single-quote char (') or a double-quote char
-            # ("). The opening and closing quote of the string must
-            # be a matching pair of chars.
-            elif line[i] == '\"' or line[i] == '\'':
-                string, i = Lexer.__scan_str(i, line, line[i])
-                if string:
-                    tokens.append(('string', string))
-                else:
-                    Lexer.__throw_token_error(string)
-
-            # TYPE: number
-            #
-            # A token of type number have all digits for its
-            # chars. So, 123abc is not an integer.
-            elif re.match('[\-0-9]', line[i]):
-                number, i = Lexer.__scan(i, line, '[\-\.0-9]', '-?\d+(\.\d+)?') 
-                if number:
-                    tokens.append(('number', number))
-                else:
-                    Lexer.__throw_token_error(number)
-
-            # TYPE: storable
-            #
-            # A token of type storable must starts with the
-            # `$` character. Then the following characters
-            # follows the identifier pattern rule.
-            elif line[i] == '@':
-                storable, i = Lexer.__scan(
-                    i, line, '[\_\@a-zA-Z0-9]', '\@[a-zA-Z0-9_]+'
-                )
-                if storable:
-                    tokens.append(('storable', storable))
-                else:
-                    Lexer.__throw_token_error(storable)
+            value = match.group()
+            if kind == 'word':
+                append(words.get(value) or ('identifier', value))
+
+            # The opening and closing quote of the string must be a
+            # matching pair of chars, and aren't part of the string.
+            elif kind == 'string':
+                append(('string', value[1:-1]))
+
+            # The path of a list file, without the `file` prefix.
+            elif kind == 'file':
+                append(('file', value[5:-1]))
+
+            elif kind == 'operator':
+                append((value, ''))
+
+            elif kind == 'error':
+                Lexer.__throw_token_error(line[match.start():].split()[0])
 
-            # Weird token.
             else:
-                Lexer.__throw_token_error(errored_token)
-                logging.error(msg)
-                raise ValueError(msg)
+                append((kind, value))
 
         tokens.append(('EOF', ''))
         logging.info('Finished lexical analyzing.')
@@ -139,67 +118,6 @@ class Lexer:
         logging.error(msg)
         raise ValueError(msg)
 
-    def __is_whitespace(c):
-        return c == ' ' or c == '\t'
-
-    def __is_newline(c):
-        return c == '\n'
-
-    def __scan(i, line, chars_pattern, token_pattern, last=False):
-        """
-        @param i: The position of the char in the string line
-                  to start scan.
-        @param line: The input stream string.
-        @param chars_pattern: The chars' regex pattern e.g. [a-zA-Z0-9]
-        @param token_pattern: The token's regex pattern e.g. ^(True|False)$
-        @param last: If set to True, then a non-match will result in error
-                     being thrown instead of returning None and the
-                     index.
-        """
-        s = ''
-        j = i
-
-        # Special characters: delimiters that indicate
-        # a token's boundary.
-        if line[i] in ('{', '}', '(', ')', '[', ']', ','):
-            if re.match(token_pattern, line[i]):
-                return line[i], j + 1
-            else:
-                return None, i
-
-        # Scan and append chars in the line from j-th index
-        # until an unwanted char is reached.
-        delimiter = '(\s|{|}|\(|\)|\[|\]|,)'
-        while j < len(line) and not re.match(delimiter, line[j]):
-            s += line[j]
-            j += 1
-
-        # Try to match the scanned string `s` with the `token_pattern`
-        # regex string. If it doesn't match, then return None and 
-        # restore the current index (by returning `i`).
-        match = re.match(token_pattern, s)
-        if not match:
-            if last:
-                Lexer.__throw_token_error(s)
-            else:
-                return None, i
-        return s, j
-
-    def __scan_str(i, line, delim):
-        s = ''
-        j  = i + 1
-        while j < len(line) and line[j] != delim:
-            s += line[j]
-            j += 1
-
-        # Ensure that an end quote char exists.
-        try:
-            if not line[j] == delim:
-                Lexer.__throw_token_error(delim + s)
-        except IndexError:
-                Lexer.__throw_token_error(delim + s)
-        return s, j + 1 # +1 because of the end quote char.
-
 class Parser:
     """
     This Parser class accepts a list of tokens generated from
@@ -414,6 +332,8 @@ class Parser:
             | "(" eval ")"
             | "storable"
             | "[" { factor {"," factor} } "]" <-- python-like list.
+            | "file"                          <-- list read from a file,
+                                                  written file'path'.
         """
         csym, cval = self.curr
 
@@ -443,6 +363,9 @@ class Parser:
                 self.__expect(']')
                 node.add_child(self.prev[0], self.prev[1])
 
+        elif self.__accept('file'):
+            node.add_child(self.prev[0], self.prev[1])
+
         elif self.__accept('('):
             node.add_child(self.prev[0], self.prev[1])
             self.__eval(node.add_child('EVAL', 'NODE'))
@@ -467,381 +390,800 @@ class Parser:
         logging.error(msg)
         raise SyntaxError(msg)
 
-class Evaluator:
+class Compiler:
+    """
+    This Compiler class turns the parse tree generated from the method
+    `Parser.parse()` into a `Program` object, in two stages.
+
+    First, `Compiler.lower(parse_tree)` reduces the parse tree into its
+    code: plain nested tuples, lists and dicts of python literals (see
+    `Compiler.lower` for its layout). The code doesn't depend on anything
+    but the SFL script, so it can be stored (see `dmine.FilterCache`).
+
+    Then, `Compiler(code).compile()` turns each scrape component block in
+    the code into a predicate, a python closure that takes a mapping of
+    the component's attribute names to their values, and returns True if
+    the component should be scraped. This is only done once, instead of
+    rewriting (a copy of) the parse tree every time the script is run.
+
+    The expressions are compiled with the usual boolean semantics: `and`
+    binds tighter than `or`, both short-circuit, and comparisons chain the
+    way python's do (i.e. `0 < score < 100`). A `not` negates the term it
+    precedes, and a parenthesized expression is a term of its own. A
+    comparison with an operand that has no value assigned (None) is
+    ignored (i.e. it holds).
+
+    If numpy is available, each block is also compiled into a batch
+    predicate, which takes the attribute values of many components as
+    columns and tests them all at once (see `Interpreter.output_batch`).
+    """
 
-    def eval(pt, idns, stors):
+    # The functions implementing each comparison operator. An operator
+    # made up of more than one token (i.e. "not in") is keyed by the
+    # concatenation of its tokens.
+    operators = {
+        '<': lambda x, y: x < y,
+        '<=': lambda x, y: x <= y,
+        '>': lambda x, y: x > y,
+        '>=': lambda x, y: x >= y,
+        '==': lambda x, y: x == y,
+        '!=': lambda x, y: x != y,
+        'in': lambda x, y: x in y,
+        'notin': lambda x, y: x not in y,
+        'search': lambda x, y: re.search(x, y) is not None,
+    }
+
+    # The relative cost of testing each comparison operator. A membership
+    # test costs more unless its right operand is a set.
+    operator_costs = {
+        '<': 1, '<=': 1, '>': 1, '>=': 1, '==': 1, '!=': 1,
+        'in': 4, 'notin': 4,
+        'search': 8,
+    }
+
+    def __init__(self, code, script_dir=None):
         """
-        @param pt: The parse tree object that is obtained 
-                   from the parser.
-        @param idns: The list of dict of identifiers.
+        @param code: The code returned by `Compiler.lower(parse_tree)`.
+        @param script_dir: The directory against which the relative paths
+                           of the list files are resolved, or None for
+                           the current directory.
+
+        Initialize a new instance of the Compiler class.
         """
-        logging.info('Evaluating SFL parse tree...')
-        out = Evaluator.parse_node(pt, idns, stors)
-        logging.info('Finsihed evaluating. Result: %s' % out)
-        if out is None:
-            out = {}
-        return out
+        self.code = code
+        self.script_dir = script_dir
+        self.costs = {}     # Predicate -> its cost.
+        self.decisions = [] # The decision counts of the terms of the
+                            # scrape component being compiled.
 
-    def parse_node(node, idns, stors, scope=''):
+    def lower(parse_tree):
         """
-        @param node: A node in a parse tree.
-        @param idns: The list of Component class from sfl module.
-        @param scope: This should be left untouched at first called.
-                      This parameter is used internally in this method
-                      to keep track and check the scope of the scrap 
-                      attributes.
+        @param parse_tree: The parse tree object that is obtained from
+                           the parser.
 
-        This method recursively evaluate a node in the parse tree.
+        Returns the code of the parse tree, which is a dict of the form
 
-        Simply put, given parse tree from the following scrap filter input:
-        
-            post { score > 0 } comment { 0 < score < 100 } $my_var = 123
+            {'components': {name: eval, ...}, 'storables': {name: operand}}
 
-        If the post's score is greater than zero, but the comment's score
-        is greater than 100, this method will returns the following 
-        dictionary object:
+        where
 
-            {post: True, comment: False, $my_var: 123}
+            eval    ::= ('eval', [term, ...], ["and" | "or", ...])
+            term    ::= ('term', negate, [operand, ...], [opt, ...], source)
+            operand ::= ('const', value) | ('file', filename)
+                      | ('attr', name) | eval
+        """
+        code = {'components': {}, 'storables': {}}
 
+        # The root PROG node has a single EXPR child, whose children
+        # are sequences of either `identifier { EVAL }` or
+        # `storable = FACTOR`.
+        children = parse_tree.children[0].children
+        i = 0
+        while i < len(children):
+            n = children[i]
+            if n.symbol == 'identifier':
+                code['components'][n.value] = Compiler.__lower_eval(
+                    children[i + 2]
+                )
+                i += 4
+            elif n.symbol == 'storable':
+                code['storables'][n.value[1:]] = Compiler.__lower_factor(
+                    children[i + 2]
+                )
+                i += 3
+            else:
+                i += 1
+        return code
+
+    def __lower_eval(node):
         """
+        @param node: An EVAL node.
 
+        Returns the code for the `term { ("and" | "or") term }` chain.
+        """
+        terms = [Compiler.__lower_term(node.children[0])]
+        opts = []
+        for i in range(1, len(node.children), 2):
+            opts.append(node.children[i].symbol)
+            terms.append(Compiler.__lower_term(node.children[i + 1]))
+        return ('eval', terms, opts)
+
+    def __lower_term(node):
+        """
+        @param node: A TERM node.
+
+        Returns the code for the `["not"] factor { opt factor }` chain.
+        """
+        negate = False
+        operands = []
+        opts = []
+        opt = ''
         for n in node.children:
-            if n.symbol == 'string':
-                if n.parent.symbol != 'EXPR':
-                    n.parent.children = []
-                    n.parent.symbol, n.parent.value = n.symbol, n.value
-
-            elif n.symbol == 'number':
-                if n.parent.symbol != 'EXPR':
-                    n.parent.children = []
-                    n.parent.symbol, n.parent.value = n.symbol, int(n.value)
-
-            elif n.symbol == 'boolean':
-                if n.parent.symbol != 'EXPR':
-                    n.parent.children = []
-                    if n.value == 'True':
-                        n.value = True
-                    else:
-                        n.value = False
-                    n.parent.symbol, n.parent.value = n.symbol, n.value
-
-            elif n.symbol == '[':
-                li = []
-                Evaluator.__to_list(n.parent, li)
-                if n.parent.symbol != 'EXPR':
-                    n.parent.children = []
-                    n.parent.symbol, n.parent.value = 'list', li
-
-            elif n.symbol == 'identifier':
-                if scope == '':
-                    # Update the new scope, and check if it's defined.
-                    scope = n.value
-                    if not Evaluator.__is_comp_defined(idns, scope):
-                        Evaluator.__throw_eval_error(
-                            'Undefined scrape component: %s' % scope
-                        )
-                else:
-                    # Check if the identifier is defined within the scope.
-                    # (i.e. if the component contains the attribute.)
-                    if not Evaluator.__is_comp_defined(idns, scope, n.value):
-                        Evaluator.__throw_eval_error(
-                            'In the scrape component \'%s\', '\
-                            'there\'s undefined attribute: %s'\
-                            % (scope, n.value)
-                        )
-                    # If it is, then move the value up a node.
-                    n.value = Evaluator.__get_idn_val(idns, scope, n.value)
-                    n.parent.children = []
-                    n.parent.symbol, n.parent.value = n.symbol, n.value
-
-            elif n.symbol == 'EXPR':
-                Evaluator.parse_node(n, idns, scope)
-
-                # Once we finished parsing each nodes in EXPR,
-                # create the output dict and return it.
-                out = {}
-                for i in range(len(n.children)):
-                    m = n.children[i]
-                    if m.symbol == 'identifier':
-                        out[(m.symbol, m.value)] = n.children[i + 2].value
-                    elif m.symbol == 'storable':
-                        if not Evaluator.__is_stor_defined(stors, m.value):
-                            Evaluator.__throw_eval_error(
-                                'Undefined storable: %s' % m.value
-                            )
-                        val_token = n.children[i + 2]
-                        val = val_token.value
-                        if val_token.symbol == 'number':
-                            val = int(val)
-                        out[(m.symbol, m.value[1:])] = val
-                return out
-
-            elif n.symbol == 'EVAL':
-                Evaluator.parse_node(n, idns, stors, scope)
-                Evaluator.__operate(n)
-
-            elif n.symbol == 'TERM':
-                Evaluator.parse_node(n, idns, stors, scope)
-                Evaluator.__operate(n)
-
-            elif n.symbol == 'FACTOR':
-                Evaluator.parse_node(n, idns, stors, scope)
-
-                # Every operated node has its children emptied.
-                # Therefore, we only operate a FACTOR node 
-                # if it has at least 1 child.
-                if len(n.children) > 0:
-                    Evaluator.__operate(n)
-                    n.parent.value = n.value
+            if n.symbol == 'FACTOR':
+                if opt:
+                    opts.append(opt)
+                    opt = ''
+                operands.append(Compiler.__lower_factor(n))
+            elif not operands:
+                # A "not" preceding the first factor negates the term.
+                negate = not negate
+            else:
+                opt += n.symbol
+        return ('term', negate, operands, opts, Compiler.__source(node))
+
+    def __lower_factor(node):
+        """
+        @param node: A FACTOR node.
 
+        Returns the code for the factor. A list file is only named in the
+        code, and is read when the code is compiled.
+        """
+        n = node.children[0]
+        if n.symbol == 'identifier':
+            return ('attr', n.value)
+        if n.symbol == 'file':
+            return ('file', n.value)
+        if n.symbol == '(':
+            return Compiler.__lower_eval(node.children[1])
+        return ('const', Compiler.__literal(node))
+
+    def compile(self):
+        """
+        Compile the code. This method returns a `Program` object.
+        """
+        logging.info('Compiling SFL code...')
+        program = Program()
+
+        for name, code in self.code['components'].items():
+            attributes = set()
+            self.decisions = []
+            program.predicates[name] = self.__eval(code, attributes)
+            program.attributes[name] = attributes
+            program.decisions[name] = self.decisions
+            if numpy is not None:
+                program.batch_predicates[name] = self.__batch_eval(code)
+
+        for name, code in self.code['storables'].items():
+            is_const, value = self.__operand(code, None)
+            if not is_const:
+                Compiler.__throw_assignment_error('@' + name)
+            program.storables[name] = value
+
+        logging.info('Finished compiling.')
+        return program
+
+    def __eval(self, code, attributes):
+        """
+        @param code: The code of an EVAL node.
+        @param attributes: The set of attribute names referred to in the
+                           scrape component's block. Filled by this method.
+
+        Returns a predicate for the `term { ("and" | "or") term }` chain.
+
+        The terms of each `and` chain are reordered so that the cheapest
+        are tested first (see `Compiler.operator_costs`), and so are the
+        `and` chains themselves. The result of a chain doesn't depend on
+        the order, but whether a term raises an error does: a term that
+        can't be tested on a record (i.e. comparing a string to a number)
+        only raises the error if it is reached, which may now be before,
+        or instead of, the terms written ahead of it.
+        """
+        _, terms, opts = code
+        groups = [[self.__term(terms[0], attributes)]]
+        for opt, term_code in zip(opts, terms[1:]):
+            term = self.__term(term_code, attributes)
+            if opt == 'and':
+                groups[-1].append(term)
             else:
-                # This node should be an operator, if it's non
-                # of the above.
-                
-                # Reset the scope when '}' end of scope.
-                if n.symbol == '}':
-                    scope = ''
+                groups.append([term])
+
+        conjunctions = []
+        for group in groups:
+            group.sort(key=lambda term: self.costs[term[0]])
+            conjunction = self.__conjunction(group)
+            self.costs[conjunction] = sum(self.costs[t[0]] for t in group)
+            conjunctions.append(conjunction)
+        conjunctions.sort(key=lambda c: self.costs[c])
+
+        if len(conjunctions) == 1:
+            return conjunctions[0]
+
+        conjunctions = tuple(conjunctions)
+        def disjunction(attrs):
+            for conjunction in conjunctions:
+                if conjunction(attrs):
+                    return True
+            return False
+        self.costs[disjunction] = sum(self.costs[c] for c in conjunctions)
+        return disjunction
 
-    def __operate(n):
+    def __conjunction(self, group):
         """
-        @param n: A node of a parse tree.
+        @param group: A list of `(predicate, decision)` tuples of the terms
+                      of an `and` chain, as returned by `__term`.
+
+        Returns a predicate that holds if all the terms hold. The term that
+        ends the evaluation of the chain (the first one that doesn't hold,
+        or the last one if all of them hold) has its decision count
+        incremented. The counts aren't guarded by a lock, so they're only
+        approximate when the predicate runs in several threads at once.
+        """
+        group = tuple(group)
+        last = group[-1][1]
+        def conjunction(attrs):
+            for predicate, decision in group:
+                if not predicate(attrs):
+                    decision[1] += 1
+                    return False
+            last[1] += 1
+            return True
+        return conjunction
 
-        Do the operations pernaining the children of the node n.
-        This method only changes the structure of node n, and does not
-        return anything.
+    def __term(self, code, attributes):
+        """
+        @param code: The code of a TERM node.
+        @param attributes: See `__eval`.
 
-        The changes in structure of node n is as follows:
-          - The children list of node n will be "removed" (i.e 
-            simply ovewritten by an empty list)
-          - n's symbol and value will be changed accordingly.
+        Returns a tuple `(predicate, decision)` for the
+        `["not"] factor { opt factor }` chain, where `decision` is the
+        list `[source, count]` counting how many times the term decided
+        the result of its `and` chain.
         """
+        _, negate, operand_codes, opts, source = code
+        operands = [self.__operand(c, attributes) for c in operand_codes]
+
+        if not opts:
+            is_const, value = operands[0]
+            if is_const:
+                value = bool(value)
+                predicate = lambda attrs: value
+            else:
+                predicate = lambda attrs: bool(value(attrs))
+            cost = 1 if is_const else self.costs.get(value, 1)
+        else:
+            comparisons = [
+                self.__compare(opts[k], operands[k], operands[k + 1])
+                for k in range(len(opts))
+            ]
+            cost = sum(self.costs[c] for c in comparisons)
+            predicate = Compiler.__all(tuple(comparisons))
+
+        if negate:
+            positive = predicate
+            predicate = lambda attrs: not positive(attrs)
+
+        self.costs[predicate] = cost
+        decision = [source, 0]
+        self.decisions.append(decision)
+        return predicate, decision
+
+    def __operand(self, code, attributes):
+        """
+        @param code: The code of a FACTOR node.
+        @param attributes: See `__eval`. None if the factor isn't in the
+                           scope of a scrape component.
+
+        Returns a tuple `(is_const, value)`. If the factor is a literal,
+        `value` is the literal's python value. Otherwise, `value` is a
+        function that takes the attribute mapping and returns the
+        factor's value.
+        """
+        kind = code[0]
+        if kind == 'const':
+            return True, code[1]
+        if kind == 'file':
+            filename = code[1]
+            if self.script_dir is not None:
+                filename = os.path.join(self.script_dir, filename)
+            return True, Compiler.__list_file(filename)
+
+        if attributes is None:
+            return False, None
+
+        if kind == 'attr':
+            name = code[1]
+            attributes.add(name)
+            return False, lambda attrs: attrs[name]
+
+        # Parenthesized evaluation: "(" eval ")".
+        return False, self.__eval(code, attributes)
+
+    def __compare(self, opt, left, right):
+        """
+        @param opt: The operator, a key of `Compiler.operators`.
+        @param left: The left operand, as returned by `__operand`.
+        @param right: The right operand, as returned by `__operand`.
 
-        # If a node has only one child (i.e. no evaluation takes place),
-        # then just take the child's value.
-        if len(n.children) == 1:
-            n.value = n.children[0].value
-            n.children = []
-            return
-    
-        # Append a sentry node to the children list to allow
-        # left-only operand (i.e boolean).
-        n.add_child('SENTRY', 'SENTRY')
+        Returns a predicate that applies the operator to both operands.
+        """
+        operate, left, right, cost = self.__operation(opt, left, right)
+        lconst, lval = left
+        rconst, rval = right
 
-        i = 0
-        opts = ('<', '<=', '>', '>=', '==', '!=',\
-                'and', 'or', 'not', 'in', 'search', '(', 'boolean')
-        negate = False
-        while i < len(n.children):
+        get_left = (lambda attrs: lval) if lconst else lval
+        get_right = (lambda attrs: rval) if rconst else rval
+
+        def compare(attrs):
+            x = get_left(attrs)
+            y = get_right(attrs)
+            if x is None or y is None:
+                return True
+            try:
+                return operate(x, y)
+            except TypeError as e:
+                Compiler.__throw_operand_error(e, x, y)
+        self.costs[compare] = cost
+        return compare
+
+    def __operation(self, opt, left, right):
+        """
+        @param opt: The operator, a key of `Compiler.operators`.
+        @param left: The left operand, as returned by `__operand`.
+        @param right: The right operand, as returned by `__operand`.
+
+        Returns a tuple `(operate, left, right, cost)`, where `operate` is
+        the function applying the operator, and `left` and `right` are the
+        operands, with their literals prepared for the operator.
+        """
+        try:
+            operate = Compiler.operators[opt]
+        except KeyError:
+            Compiler.__throw_compile_error('Invalid operator: %s' % opt)
+
+        lconst, lval = left
+        rconst, rval = right
+        cost = Compiler.operator_costs[opt]
+        for is_const, value in (left, right):
+            if not is_const:
+                cost += self.costs.get(value, 0)
+
+        # A list literal on the right side of `in` is folded into a
+        # frozenset (if all of its elements are hashable), so that the
+        # membership test doesn't need to scan the list.
+        if opt in ('in', 'notin') and rconst and isinstance(rval, list):
+            try:
+                rval = frozenset(rval)
+                cost -= Compiler.operator_costs[opt] - 2
+            except TypeError:
+                pass
+
+        # A string literal on either side of `search` is the pattern, so
+        # it is compiled (and validated) only once, here.
+        if opt == 'search':
+            if rconst and isinstance(rval, str):
+                rval = Compiler.__regex(rval)
+                operate = lambda x, y: y.search(x) is not None
+            elif lconst and isinstance(lval, str):
+                lval = Compiler.__regex(lval)
+                operate = lambda x, y: x.search(y) is not None
+
+        return operate, (lconst, lval), (rconst, rval), cost
+
+    def __batch_eval(self, code):
+        """
+        @param code: The code of an EVAL node.
 
-            opt = ''
-            j = 0 # Used to calculate the char-length of the operator.
-            res = True
+        Returns the batch predicate for the `term { ("and" | "or") term }`
+        chain: a function that takes a dict of the attribute names to
+        their columns (numpy arrays of equal length) and the number of
+        rows, and returns a numpy array of booleans, one per row.
 
-            while n.children[i].symbol in opts:
-                if n.children[i].symbol == 'boolean':
+        The terms are reordered just like in `__eval`, and they
+        short-circuit too: a term is only tested on the rows that the
+        terms before it haven't decided yet. The decision counts aren't
+        incremented, though.
+        """
+        _, terms, opts = code
+        groups = [[self.__batch_term(terms[0])]]
+        for opt, term_code in zip(opts, terms[1:]):
+            term = self.__batch_term(term_code)
+            if opt == 'and':
+                groups[-1].append(term)
+            else:
+                groups.append([term])
+
+        conjunctions = []
+        for group in groups:
+            group.sort(key=lambda term: self.costs[term])
+            conjunction = Compiler.__batch_conjunction(tuple(group))
+            self.costs[conjunction] = sum(self.costs[t] for t in group)
+            conjunctions.append(conjunction)
+        conjunctions.sort(key=lambda c: self.costs[c])
+
+        if len(conjunctions) == 1:
+            return conjunctions[0]
+
+        first = conjunctions[0]
+        rest = tuple(conjunctions[1:])
+        def disjunction(columns, n):
+            mask = first(columns, n)
+            for conjunction in rest:
+                rows = (~mask).nonzero()[0]
+                if len(rows) == 0:
                     break
-                opt += n.children[i].symbol
-                i += 1
-                j += 1
-                
-                if i >= len(n.children):
+                mask = mask.copy()
+                mask[rows] = Compiler.__batch_rows(conjunction, columns, rows)
+            return mask
+        self.costs[disjunction] = sum(self.costs[c] for c in conjunctions)
+        return disjunction
+
+    def __batch_conjunction(group):
+        """
+        @param group: A tuple of the batch predicates of the terms of an
+                      `and` chain.
+
+        Returns a batch predicate that holds on the rows where all the
+        terms hold.
+        """
+        first = group[0]
+        rest = group[1:]
+        def conjunction(columns, n):
+            mask = first(columns, n)
+            for term in rest:
+                rows = mask.nonzero()[0]
+                if len(rows) == 0:
                     break
+                if len(rows) == n:
+                    mask = term(columns, n)
+                else:
+                    mask = mask.copy()
+                    mask[rows] = Compiler.__batch_rows(term, columns, rows)
+            return mask
+        return conjunction
 
-            if opt != '':
-                
-                # If the operation is a negation, we set the negation
-                # flag and continue to be used against the next operation's
-                # result.
-                if opt == 'not':
-                    negate = not negate
-                    continue
-
-                left = None
-                if i - j - 1 >= 0:
-                    left = n.children[i - j - 1].value
-                right = n.children[i].value
-
-                # Handling the occurence when left or right operand
-                # has not been assigned any value.
-                if right is None or left is None:
-                    # This is the side effect of calling
-                    # to evaluate the parse tree before assigning
-                    # values to the components' attributes.
-                    msg = 'An operand has no value assigned. Ignoring '\
-                          'the \'<%s> %s <%s>\' operation.'\
-                          % (n.children[i - j - 1].symbol, 
-                             opt, n.children[i].symbol)
-                    logging.debug(msg)
-                    continue
-
-                operate = {
-                    '<': lambda x, y: x < y,
-                    '<=': lambda x, y: x <= y,
-                    '>': lambda x, y: x > y,
-                    '>=': lambda x, y: x >= y,
-                    '==': lambda x, y: x == y,
-                    '!=': lambda x, y: x != y,
-                    'in': lambda x, y: x in y,
-                    'notin': lambda x, y: x not in y,
-                    'and': lambda x, y: x and y,
-                    'or': lambda x, y: x or y,
-                    'search': lambda x, y: re.search(x, y) is not None,
-                    '(': lambda x, y: y,
-                    'boolean': lambda x, y: x
-                }
-                try:
-                    res = operate[opt](left, right)
-                    if negate:
-                        res = not res
-                        negate = not negate
-                except TypeError as e:
-                    Evaluator.__throw_eval_error(
-                        str(e) + '. left operand is \'%s\', and '\
-                        'the right operand is \'%s\'.'\
-                        % (left, right)
-                    )
+    def __batch_rows(predicate, columns, rows):
+        """
+        @param predicate: A batch predicate.
+        @param columns: The columns the batch predicate is tested on.
+        @param rows: A numpy array of the indices of some of the rows.
 
-            if res:
-                i += 1
+        Returns the batch predicate tested on the given rows only.
+        """
+        subset = {k: column[rows] for k, column in columns.items()}
+        return predicate(subset, len(rows))
+
+    def __batch_term(self, code):
+        """
+        @param code: The code of a TERM node.
+
+        Returns the batch predicate (see `__batch_eval`) for the
+        `["not"] factor { opt factor }` chain.
+        """
+        _, negate, operand_codes, opts, _ = code
+        operands = [self.__batch_operand(c) for c in operand_codes]
+
+        if not opts:
+            is_const, value = operands[0]
+            if is_const:
+                value = bool(value)
+                term = lambda columns, n: numpy.full(n, value)
             else:
-                break
+                term = lambda columns, n: Compiler.__truth(value(columns, n))
+            cost = 1 if is_const else self.costs.get(value, 1)
+        else:
+            comparisons = tuple(
+                self.__batch_compare(opts[k], operands[k], operands[k + 1])
+                for k in range(len(opts))
+            )
+            cost = sum(self.costs[c] for c in comparisons)
+            term = Compiler.__batch_conjunction(comparisons)
+
+        if negate:
+            positive = term
+            term = lambda columns, n: ~positive(columns, n)
 
-        n.children = []
-        n.value = res
+        self.costs[term] = cost
+        return term
 
-    def __to_list(node, li):
+    def __batch_operand(self, code):
         """
-        Create a python list object from the given node.
-        The node must has its first child as a token with
-        the symbol '['.
+        @param code: The code of a FACTOR node.
 
-        In other words, if node n is parent of a factor node
-        whose children represents a list, this list will modify
-        node n into a node whose symbol is 'list' and whose value
-        is the python list object.
+        Returns a tuple `(is_const, value)` like `__operand`, except that a
+        non-literal `value` is a function that takes the columns and the
+        number of rows (see `__batch_eval`), and returns a numpy array.
         """
-        for n in node.children:
-            inner_li = []
-            if n.symbol == 'number':
-                li.append(int(n.value))
-            elif n.symbol == 'string':
-                li.append(str(n.value))
-            elif n.symbol == 'boolean':
-                if n.value == 'True':
-                    li.append(True)
-                else:
-                    li.append(False)
-            elif n.symbol == ',':
-                continue
-            elif n.symbol == ']':
-                continue
-            elif n.symbol == 'FACTOR':
-                if n.children[0].symbol == '[':
-                    li.append(inner_li)
-                    Evaluator.__to_list(n, inner_li)
-                else:
-                    Evaluator.__to_list(n, li)
-                n.children = []
-            
-    def __get_idn_val(idns, comp, attr):
-        for idn in idns:
-            if idn.name == comp:
-                return idn[attr]
-        Evaluator.__throw_eval_error(
-            'Attribute not found: %s' % attr
+        kind = code[0]
+        if kind in ('const', 'file'):
+            return self.__operand(code, None)
+        if kind == 'attr':
+            name = code[1]
+            return False, lambda columns, n: columns[name]
+        return False, self.__batch_eval(code)
+
+    def __batch_compare(self, opt, left, right):
+        """
+        @param opt: The operator, a key of `Compiler.operators`.
+        @param left: The left operand, as returned by `__batch_operand`.
+        @param right: The right operand, as returned by `__batch_operand`.
+
+        Returns a batch predicate (see `__batch_eval`) that applies the
+        operator to both operands, row by row.
+
+        An ordering or equality operator is applied to whole columns at
+        once by numpy if both operands are numbers. Otherwise (i.e. a
+        column holds strings, or a None), the operator is applied to each
+        row in turn, with the same semantics as the predicate made by
+        `__compare`.
+        """
+        operate, left, right, cost = self.__operation(opt, left, right)
+        lconst, lval = left
+        rconst, rval = right
+        vectorize = opt in ('<', '<=', '>', '>=', '==', '!=')
+
+        def compare(columns, n):
+            x = lval if lconst else lval(columns, n)
+            y = rval if rconst else rval(columns, n)
+            if vectorize and Compiler.__is_number(x)\
+            and Compiler.__is_number(y):
+                mask = operate(x, y)
+                if isinstance(mask, numpy.ndarray):
+                    return mask
+                return numpy.full(n, bool(mask))
+
+            xs = itertools.repeat(x, n) if lconst else x
+            ys = itertools.repeat(y, n) if rconst else y
+            try:
+                return numpy.fromiter(
+                    (a is None or b is None or operate(a, b)
+                     for a, b in zip(xs, ys)),
+                    dtype=bool, count=n
+                )
+            except TypeError as e:
+                Compiler.__throw_operand_error(e, x, y)
+        self.costs[compare] = cost
+        return compare
+
+    def __is_number(value):
+        """
+        @param value: A literal, or a numpy array.
+
+        Returns True if the value is a number, or a column of numbers.
+        """
+        if isinstance(value, numpy.ndarray):
+            return value.dtype.kind in 'biuf'
+        return isinstance(value, (bool, int, float))
+
+    def __truth(column):
+        """
+        @param column: A numpy array.
+
+        Returns the truth value of each element of the column.
+        """
+        if column.dtype == bool:
+            return column
+        return numpy.fromiter(
+            (bool(v) for v in column), dtype=bool, count=len(column)
         )
-  
-    def __is_comp_defined(idns, component, attribute=None):
+
+    def __literal(node):
         """
-        @param idns: A list of sfl.Component object.
-        @param component: The supposed component.
-        @param attribute: The supposed attribute the component.
+        @param node: A FACTOR node (or a child of a list factor) holding
+                     a string, number, boolean or list.
 
-        Check if the identifier (the scrape component or its attribute) 
-        is defined or not. Returns True if defined. Otherwise, 
-        returns False.
+        Returns the python value of the literal.
         """
-        
-        # The attribute is None, so we're only
-        # checking whether the component is defined.
-        if attribute is None:
-            for idn in idns:
-                if component == idn.name:
-                    return True
-            return False
+        n = node.children[0] if node.symbol == 'FACTOR' else node
+        if n.symbol == 'string':
+            return str(n.value)
+        if n.symbol == 'number':
+            return Compiler.__number(n.value)
+        if n.symbol == 'boolean':
+            return n.value == 'True'
+        if n.symbol == '[':
+            return [Compiler.__literal(m)
+                    for m in node.children if m.symbol == 'FACTOR']
+        Compiler.__throw_compile_error(
+            'Expected a literal but got \'%s\' instead.' % n.symbol
+        )
 
-        # The attribute is not None, so we're checking
-        # whether the attribute is defined under the component.
-        else:
-            for idn in idns:
-                if idn.has_attr(attribute):
-                    return True
-            return False
-    
-    def __is_stor_defined(stors, sname):
+    def __list_file(filename):
         """
-        @param stors: The list of sfl.Storable object. 
-        @param sname: The supposed storable's name.
+        @param filename: The path of a plain text file.
 
-        Check if the storable is defined or not. Returns true if defined.
-        Otherwise, returns False.
+        Returns the list of strings in the file, one per line. Leading
+        and trailing whitespaces are ignored, and so are blank lines.
         """
-        for s in stors:
-            if s.fname == sname:
-                return True
-        return False
+        try:
+            with open(filename, 'r') as f:
+                return [line.strip() for line in f if line.strip()]
+        except (IOError, OSError) as e:
+            Compiler.__throw_compile_error(
+                'Unable to read the list file \'%s\': %s' % (filename, e)
+            )
+
+    def __source(node, limit=60):
+        """
+        @param node: A node of the parse tree.
+        @param limit: The maximum length of the returned string.
+
+        Returns the SFL source code the node was parsed from (more or
+        less, since whitespaces are lost), shortened to `limit` chars.
+        """
+        tokens = []
+        def walk(n):
+            if n.children:
+                for child in n.children:
+                    walk(child)
+            elif n.symbol == 'string':
+                tokens.append('\'%s\'' % n.value)
+            elif n.symbol == 'file':
+                tokens.append('file\'%s\'' % n.value)
+            elif n.symbol in ('identifier', 'number', 'boolean'):
+                tokens.append(str(n.value))
+            else:
+                tokens.append(n.symbol)
+        walk(node)
+
+        source = ' '.join(tokens)
+        for a, b in (('( ', '('), (' )', ')'), ('[ ', '['), (' ]', ']'),
+                     (' ,', ',')):
+            source = source.replace(a, b)
+        if len(source) > limit:
+            source = source[:limit - 3] + '...'
+        return source
+
+    def __regex(pattern):
+        """
+        @param pattern: A regular expression string.
+
+        Returns the compiled regular expression. An invalid pattern is
+        reported as a syntax error of the SFL script.
+        """
+        try:
+            return re.compile(pattern)
+        except re.error as e:
+            Compiler.__throw_compile_error(
+                'Invalid regular expression \'%s\': %s' % (pattern, e)
+            )
+
+    def __number(value):
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+
+    def __all(predicates):
+        """
+        @param predicates: A tuple of predicates.
+
+        Returns a predicate that holds if all of the given predicates hold.
+        """
+        if len(predicates) == 1:
+            return predicates[0]
 
-    def __throw_eval_error(msg):
+        def conjunction(attrs):
+            for predicate in predicates:
+                if not predicate(attrs):
+                    return False
+            return True
+        return conjunction
+
+    def __throw_compile_error(msg):
+        logging.error(msg)
+        raise SyntaxError(msg)
+
+    def __throw_operand_error(e, x, y):
+        Compiler.__throw_compile_error(
+            str(e) + '. left operand is \'%s\', and '\
+            'the right operand is \'%s\'.' % (x, y)
+        )
+
+    def __throw_assignment_error(token):
+        msg = 'The storable token \'%s\' was expecting a number, '\
+              'a string, a boolean or a list value.' % token
         logging.error(msg)
         raise SyntaxError(msg)
 
 class Interpreter:
     """
     This class is responsible to stitch everything together.
+
+    Each scrape filter owns an instance of this class, so several scrape
+    filters (i.e. for several spiders) can run in the same process, or
+    in different threads, without sharing any state.
     """
 
     identifiers = [] # List of sfl.Component objects.
     storables = []   # List of sfl.Storable objects.
-    scrape_filter = None
+    scrape_filter = None # The scrape filter the identifiers are bound to.
+    program = None   # The sfl.Program compiled from the code.
 
-    def feed(scrape_filter):
+    def __init__(self):
+        """
+        Initialize a new instance of the Interpreter class. Its SFL script
+        is given by `set`.
+        """
+        self.identifiers = []
+        self.storables = []
+        self.scrape_filter = None
+        self.program = None
+        self.views = {} # Scrape component name -> sfl.Component.
+
+    def feed(self, scrape_filter):
         """
         @param scrape_filter: A scrape filter object.
         
         Feed this interpreter the identifiers and storables.
-        The list `Interpreter.identifiers` is emptied before
-        it is filled again with new values. The list
-        `Interpreter.storables` is only filled once.
+
+        The identifiers are only created once per scrape filter. Each of
+        them is bound to the dictionary of attribute values of its
+        scrape component (see `dmine.Component.values`), so setting an
+        attribute value is all it takes to update the interpreter's
+        view of a component. The list `storables` is also only filled
+        once.
         """
 
-        Interpreter.identifiers = []
-        for comp_name in scrape_filter.comp:
-            component = Component(comp_name)
-            comp = scrape_filter.comp
-            for attr_name in comp[comp_name].attr:
-                attr = comp[comp_name].attr
-                component[attr_name] = attr[attr_name].value
-            Interpreter.identifiers.append(component)
+        if self.scrape_filter is scrape_filter\
+        and len(self.identifiers) == len(scrape_filter.comp):
+            return
+
+        self.scrape_filter = scrape_filter
+        self.identifiers = []
+        self.views = {}
+        for name, comp in scrape_filter.comp.items():
+            component = Component(name)
+            component.bind(comp.values)
+            self.identifiers.append(component)
+            self.views[name] = component
 
-        if len(Interpreter.storables) == 0:
+        if len(self.storables) == 0:
             for name, variable in scrape_filter.var.items():
                storable = Storable(name, variable.default_value)
-               Interpreter.storables.append(storable) 
+               self.storables.append(storable) 
+            self.__check()
 
-    def set(script):
+    def parse(script):
         """
         @param script: SFL script.
-        This 'set' the stage for evaluating the SFL script. This
-        method should be called only once to maximize performance
-        (i.e. at the instantiation of the dmine's scrape filter).
+
+        Returns the code of the SFL script (see `Compiler.lower`).
         """
         tokens = Lexer.lexer(script)
-        Interpreter.parse_tree = Parser(tokens).parse()
+        return Compiler.lower(Parser(tokens).parse())
 
-    def output():
+    def set(self, script, code=None, script_dir=None):
         """
-        @param code: The SFL code.
+        @param script: SFL script.
+        @param code: The code of the SFL script, if it's already known
+                     (i.e. from a cache). The script won't be parsed then.
+        @param script_dir: The directory of the SFL script's file, if any
+                           (see `Compiler`).
 
+        This 'set' the stage for evaluating the SFL script. This
+        method should be called only once to maximize performance
+        (i.e. at the instantiation of the dmine's scrape filter).
+        """
+        if code is None:
+            code = Interpreter.parse(script)
+        self.program = Compiler(code, script_dir).compile()
+        self.scrape_filter = None
+        self.identifiers = []
+        self.storables = []
+        self.views = {}
+
+    def output(self):
+        """
         Run the SFL code. After the interpreter runs the code and
         evaluate it, a dictionary of components and its boolean value
         will be returned. The boolean value for each component dictates
@@ -860,40 +1202,154 @@ class Interpreter:
         code will automatically be flagged as True.
         """
    
-        # Use a clone of the parse tree, since `Evaluator.eval` modifies
-        # the parse tree.
-        ptree_clone = copy.deepcopy(Interpreter.parse_tree)
-
-        out = Evaluator.eval(ptree_clone, 
-                            Interpreter.identifiers,
-                            Interpreter.storables)
+        program = self.program
+        out = {}
 
         # Flag untouched components (identifiers) as True.
-        for idn in Interpreter.identifiers:
-            is_touched = False
-            for sym, val in out:
-                if val == idn.name:
-                    is_touched = True
-                    continue
-            if not is_touched:
+        for idn in self.identifiers:
+            predicate = program.predicates.get(idn.name)
+            if predicate is None:
                 out[('identifier', idn.name)] = True
+            else:
+                out[('identifier', idn.name)] = predicate(idn.attr_dict)
 
         # Assign untouched variables (storables) with their default
         # values.
-        for s in Interpreter.storables:
-            is_touched = False
-            for sym, val in out:
-                if val == s.name:
-                    is_touched = True
-                    continue
-            if not is_touched:
-                out[('storable', s.name)] = s.default_value
+        for s in self.storables:
+            out[('storable', s.name)] = program.storables.get(
+                s.name, s.default_value
+            )
 
         return out
 
+    def output_component(self, comp_name):
+        """
+        @param comp_name: The name of a scrape component.
+
+        Run only the SFL code in the block of the scrape component named
+        `comp_name`, and return whether or not the component should be
+        scraped. Like `output()`, a component that does not show up in the
+        filter code is flagged as True.
+        """
+        predicate = self.program.predicates.get(comp_name)
+        if predicate is None:
+            return True
+        view = self.views.get(comp_name)
+        if view is None:
+            Interpreter.__throw_check_error(
+                'Undefined scrape component: %s' % comp_name
+            )
+        return predicate(view.attr_dict)
+
+    def output_batch(self, comp_name, records):
+        """
+        @param comp_name: The name of a scrape component.
+        @param records: The attribute values of many components named
+                        `comp_name`, either as a list of dicts (one per
+                        component), or as a dict of lists (one per
+                        attribute, all of the same length).
+
+        Returns a list of booleans (a numpy array if numpy is available),
+        one per record, telling whether or not the record should be
+        scraped, as if the records were checked one by one with
+        `output_component`.
+
+        A record only needs the attributes referred to in the block of the
+        scrape component; the other attributes are ignored.
+        """
+        program = self.program
+        if isinstance(records, dict):
+            n = len(next(iter(records.values()), ()))
+        else:
+            n = len(records)
+
+        predicate = program.predicates.get(comp_name)
+        if predicate is None:
+            if numpy is None:
+                return [True] * n
+            return numpy.ones(n, dtype=bool)
+
+        names = program.attributes[comp_name]
+        try:
+            batch = program.batch_predicates.get(comp_name)
+            if batch is not None:
+                if isinstance(records, dict):
+                    columns = {k: Interpreter.__column(records[k])
+                               for k in names}
+                else:
+                    columns = {k: Interpreter.__column([r[k] for r in records])
+                               for k in names}
+                return batch(columns, n)
+
+            if isinstance(records, dict):
+                columns = [records[k] for k in names]
+                records = [dict(zip(names, row)) for row in zip(*columns)]
+            return [predicate(r) for r in records]
+        except KeyError as e:
+            Interpreter.__throw_record_error(
+                'A record of the scrape component \'%s\' has no value '\
+                'for the attribute: %s' % (comp_name, e.args[0])
+            )
+
+    def __column(values):
+        """
+        @param values: A list of attribute values.
+
+        Returns the values as a one dimensional numpy array: an array of
+        numbers if they're all numbers, or an array of python objects
+        otherwise (strings are kept as python objects too, since they
+        are faster to test one by one that way).
+        """
+        if all(isinstance(v, (bool, int, float)) for v in values):
+            try:
+                return numpy.asarray(values)
+            except OverflowError:
+                pass
+        column = numpy.empty(len(values), dtype=object)
+        for i, v in enumerate(values):
+            column[i] = v
+        return column
+
+    def __check(self):
+        """
+        Check that every scrape component, attribute and storable referred
+        to in the compiled program is defined by the fed scrape filter.
+        """
+        program = self.program
+        for comp_name, attributes in program.attributes.items():
+            idn = self.views.get(comp_name)
+            if idn is None:
+                Interpreter.__throw_check_error(
+                    'Undefined scrape component: %s' % comp_name
+                )
+            for attr_name in attributes:
+                if not idn.has_attr(attr_name):
+                    Interpreter.__throw_check_error(
+                        'In the scrape component \'%s\', '\
+                        'there\'s undefined attribute: %s'\
+                        % (comp_name, attr_name)
+                    )
+
+        names = [s.name for s in self.storables]
+        for name in program.storables:
+            if name not in names:
+                Interpreter.__throw_check_error(
+                    'Undefined storable: @%s' % name
+                )
+
+    def __throw_check_error(msg):
+        logging.error(msg)
+        raise SyntaxError(msg)
+
+    def __throw_record_error(msg):
+        logging.error(msg)
+        raise ValueError(msg)
+
     def debug_run(code):
         """
-        Debugging purpose.
+        Debugging purpose. Prints the tokens, the parse tree and the
+        program of the SFL code, and returns the output of the program
+        for a sample post and comment (see `output`).
         """
         # For testing purpose.
         post = Component('post')
@@ -919,20 +1375,21 @@ class Interpreter:
         print('===A===')
         print(parse_tree)
 
-        out = Evaluator.eval(parse_tree, idns, stors)
+        program = Compiler(Compiler.lower(parse_tree)).compile()
         print('===B===')
-        print(parse_tree)
-
-        print('out:', out)
+        print(program)
 
+        out = {}
         for idn in idns:
-            is_touched = False
-            for sym, val in out:
-                if val == idn.name:
-                    is_touched = True
-                    continue
-            if not is_touched:
-                out[('identifier', idn.name)] = True
+            predicate = program.predicates.get(idn.name)
+            out[('identifier', idn.name)] =\
+                predicate is None or predicate(idn.attr_dict)
+        for s in stors:
+            out[('storable', s.name)] = program.storables.get(
+                s.name, s.default_value
+            )
+
+        print('out:', out)
         return out
 
 class ParseTree:
@@ -974,6 +1431,35 @@ class ParseTree:
     def __str__(self):
         return repr(self)
 
+class Program:
+    """
+    A compiled SFL script, created by `Compiler.compile()`.
+    """
+
+    predicates = {} # Scrape component name -> predicate.
+    batch_predicates = {} # Scrape component name -> batch predicate, if
+                          # numpy is available.
+    attributes = {} # Scrape component name -> set of attribute names
+                    # referred to in its predicate.
+    storables = {}  # Storable name (without prefix) -> assigned value.
+    decisions = {}  # Scrape component name -> list of `[source, count]`,
+                    # the number of times each term of its predicate
+                    # decided the result of the term's `and` chain.
+
+    def __init__(self):
+        self.predicates = {}
+        self.batch_predicates = {}
+        self.attributes = {}
+        self.storables = {}
+        self.decisions = {}
+
+    def __repr__(self):
+        return "(components: %s, storables: %s)"\
+               % (self.attributes, self.storables)
+
+    def __str__(self):
+        return repr(self)
+
 class Component(dict):
     """
     Usage: 
@@ -1000,6 +1486,17 @@ class Component(dict):
         self.attr_dict = {}
         self.__dict__[self.name] = self.attr_dict
 
+    def bind(self, attr_dict):
+        """
+        @param attr_dict: A dictionary of attribute names and their values,
+                          which is kept up to date by its owner.
+
+        Make this component a view of `attr_dict` instead of holding its
+        own copy of the attribute values.
+        """
+        self.attr_dict = attr_dict
+        self.__dict__[self.name] = self.attr_dict
+
     def has_attr(self, attr):
         return attr in self.attr_dict
 
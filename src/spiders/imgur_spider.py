@@ -94,21 +94,22 @@ class ImgurSpider(Spider):
                     yield post
 
     def generate_post(self, sf, page):
-        for post in page:
-            sf.get('post').set_attr_values(
-                author=post.account_url,
-                title=post.title,
-                description=post.description,
-                views=post.views,
-                points=int(post.points),
-                score=int(post.score),
-                ups=int(post.ups),
-                downs=int(post.downs),
-                tags=[tag['name'] for tag in post.tags],
-                nsfw=bool(post.nsfw)
-            )
+        # The posts in the page are all filtered at once.
+        mask = sf.filter_batch('post', [{
+            'author': post.account_url,
+            'title': post.title,
+            'description': post.description,
+            'views': post.views,
+            'points': int(post.points),
+            'score': int(post.score),
+            'ups': int(post.ups),
+            'downs': int(post.downs),
+            'tags': [tag['name'] for tag in post.tags],
+            'nsfw': bool(post.nsfw)
+        } for post in page])
 
-            if sf.get('post').should_scrape():
+        for post, should_scrape in zip(page, mask):
+            if should_scrape:
                 yield ComponentLoader('post', {
                     'post_id': post.id,
                     'author': post.account_url,
@@ -5,12 +5,43 @@
 import sys
 import praw
 import logging
-from dmine import Spider, ComponentLoader
+import threading
+import collections
+import concurrent.futures
+from praw.const import API_PATH
+from dmine import Spider, ComponentLoader, ListingScheduler, RateLimiter
 
 class RedditSpider(Spider):
     r = None # Reddit praw instance.
     name = 'reddit'
 
+    # The number of comment trees fetched ahead per worker, with
+    # @comment_workers.
+    prefetch_per_worker = 2
+
+    # The most comment ids reddit resolves per /api/morechildren request.
+    more_children_per_request = 100
+
+    requests = 0        # The number of requests made to fetch comments.
+    comments_fetched = 0
+    counter_lock = None # Guards the counters above, with @comment_workers.
+
+    # praw isn't thread-safe, so each thread (i.e. the workers of
+    # @comment_workers) uses a praw instance of its own (see
+    # `thread_reddit`), made with these arguments.
+    reddit_kwargs = {}
+    local = None
+
+    # The id of each post yielded by a tracked listing (see
+    # `track_listing`), and not yet scanned -> its `TrackedListing`.
+    post_listings = {}
+
+    # The rate limit (requests, seconds) shared by the praw instances of
+    # @comment_workers, if the spider has no rate limiter of its own.
+    # Each instance would otherwise assume it has reddit's whole rate
+    # limit to itself.
+    default_rate_limit = (60, 60)
+
     def comma_separated_list(value):
         if value is None:
             return value
@@ -56,11 +87,42 @@ class RedditSpider(Spider):
             'sections', default='hot, rising, new, top',
             info='The section(s) where you want the spider to scan.'
         )
+        sf.add_var(
+            'interleave', default=False, type=bool,
+            info='If this is set to True, the sections of each subreddit '\
+                 '(or redditor) are scanned at the same time, taking a '\
+                 'post from each in turn, instead of one section after '\
+                 'another. Each section of each subreddit then gets a '\
+                 'fair share of the requests.'
+        )
         sf.add_var(
             'skip_comments', default=False, type=bool,
             info='If this is set to True, comments will not be scanned '\
                  'for each scanned submission (post component).'
         )
+        sf.add_var(
+            'comment_workers', default=0, type=int,
+            info='The number of threads fetching the comments of the '\
+                 'next posts while the comments of a post are scanned. '\
+                 'If this is set to 0, the comments of each post are '\
+                 'fetched in turn. Without --rate-limit, the threads '\
+                 'share a limit of 60 requests per minute.'
+        )
+        sf.add_var(
+            'more_limit', default=0, type=int,
+            info='The maximum number of requests made per post to load '\
+                 'the comments hidden behind the "load more comments" '\
+                 'links. Up to 100 hidden comments are loaded per '\
+                 'request, across the whole comment tree. If this is '\
+                 'set to 0, the hidden comments are not loaded, and if '\
+                 'it\'s negative, they are all loaded.'
+        )
+        sf.add_var(
+            'comment_depth', default=None, type=int,
+            info='The maximum depth (0 for the top-level comments) of '\
+                 'the hidden comments loaded with @more_limit. By '\
+                 'default, there is no maximum depth.'
+        )
         sf.add_var(
             'skip_redditors', default=True, type=bool,
             info='If this is set to True, redditors (redditor component) '\
@@ -99,13 +161,18 @@ class RedditSpider(Spider):
         logging.info('client_id: %s\nclient_secret: %s\nuser_agent: %s' %\
                 (client_id, client_secret, user_agent))
     
-        self.r = praw.Reddit(
-                    client_id=client_id,
-                    client_secret=client_secret,
-                    redirect_uri=redirect_uri,
-                    user_agent=user_agent
-                )
-        self.r.auth.url([], redirect_uri, implicit=False)
+        self.reddit_kwargs = {
+            'client_id': client_id,
+            'client_secret': client_secret,
+            'redirect_uri': redirect_uri,
+            'user_agent': user_agent,
+        }
+        if self.rate_limiter is None and sf.ret('comment_workers') > 0\
+        and not sf.ret('skip_comments'):
+            self.rate_limiter = RateLimiter(*RedditSpider.default_rate_limit)
+        self.r = self.new_reddit()
+        self.local = threading.local()
+        self.local.r = self.r
     
         ##################################################
         # Do spidery deeds.
@@ -114,21 +181,63 @@ class RedditSpider(Spider):
         # Get the sections from which the post appear in each
         # subreddit.
         sub_sections = self.get_subreddit_sections(
-            sf.ret('sections'), sf.ret('subreddits')
+            sf.ret('sections'), sf.ret('subreddits'), sf.ret('interleave')
         )
 
         # Get the sections from which the post/comment appear
         # in each redditor page.
         usr_sections = self.get_redditor_sections(
-            sf.ret('sections'), sf.ret('redditors')
+            sf.ret('sections'), sf.ret('redditors'), sf.ret('interleave')
         )
         
-        if not sf.ret('redditors'):
-            for section in self.scrape_subreddits_sections(sf, sub_sections):
-                yield section
-        else:
-            for redditor in self.scrape_redditors_sections(sf, usr_sections):
-                yield redditor
+        self.requests = 0
+        self.comments_fetched = 0
+        self.counter_lock = threading.Lock()
+        self.post_listings = {}
+        try:
+            if not sf.ret('redditors'):
+                for section in self.scrape_subreddits_sections(
+                    sf, sub_sections
+                ):
+                    yield section
+            else:
+                for redditor in self.scrape_redditors_sections(
+                    sf, usr_sections
+                ):
+                    yield redditor
+        finally:
+            if self.comments_fetched > 0:
+                logging.info(
+                    'Fetched %d comments with %d requests (%.3f requests '\
+                    'per comment).' % (
+                        self.comments_fetched, self.requests,
+                        self.requests / self.comments_fetched
+                    )
+                )
+
+    def new_reddit(self):
+        """
+        Returns a new praw instance. The requests of praw also wait for
+        the spider's rate limiter, which is shared by all the instances
+        (and by the other processes of the spider).
+        """
+        requestor_kwargs = None
+        if self.rate_limiter is not None:
+            requestor_kwargs = {'session': self.session()}
+        r = praw.Reddit(
+                requestor_kwargs=requestor_kwargs, **self.reddit_kwargs
+            )
+        r.auth.url([], self.reddit_kwargs['redirect_uri'], implicit=False)
+        return r
+
+    def thread_reddit(self):
+        """
+        Returns the praw instance of the current thread.
+        """
+        r = getattr(self.local, 'r', None)
+        if r is None:
+            r = self.local.r = self.new_reddit()
+        return r
 
     def scrape_subreddits_sections(self, sf, sections):
         """
@@ -138,6 +247,8 @@ class RedditSpider(Spider):
         Scrape each selected section(s) in the selected subreddit(s),
         given by the sections (generator) object.
         """
+        if sf.ret('interleave'):
+            sections = [ListingScheduler(sections)]
         for section in sections:
             for submission in self.scrape_submissions(sf, section):
                 yield submission
@@ -149,46 +260,224 @@ class RedditSpider(Spider):
 
         Scrape each post from the given section.
         """
-        sf_post = sf.get('post')
-        for post in section:
-            # Assign each component's attribute.
-            sf_post.set_attr_values(
-                title=post.title,
-                score=int(post.score),
-                subreddit=str(post.subreddit),
-                author=str(post.author)
-            )
+        workers = sf.ret('comment_workers')
+        if workers > 0 and not sf.ret('skip_comments'):
+            for item in self.prefetch_submissions(sf, section, workers):
+                yield item
+            return
 
-            # Scrape the post if it pass the filter.
-            if sf_post.should_scrape():
-                yield ComponentLoader('post', {
-                    'post_id': post.id,
-                    'title': post.title,
-                    'subreddit': str(post.subreddit),
-                    'score': post.score,
-                    'author': str(post.author)
-                })
+        for post in section:
+            item = self.scrape_post(sf, post)
+            if item is not None:
+                yield item
 
-            if not sf.ret('skip_comments'):
+            if not sf.ret('skip_comments') and not self.seen(post):
                 for comment in self.scrape_comments(sf, post):
                     yield comment
+            self.scanned(post)
+
+    def prefetch_submissions(self, sf, section, workers):
+        """
+        @param sf: ScrapeFilter of this spider.
+        @param section: A section object which contains post objects.
+        @param workers: The number of threads fetching the comments.
+
+        Scrape each post from the given section, like
+        `scrape_submissions`, except that the comment trees of the next
+        posts are fetched in a thread pool, while the comments of a post
+        are scanned. The posts and comments are yielded in the same
+        order. At most `prefetch_per_worker` trees per worker are fetched
+        ahead, to bound the memory they take.
+
+        praw isn't thread-safe, so each thread fetches the comments with
+        a praw instance of its own. The instances still share the rate
+        limiter of the spider.
+        """
+        limit = workers * RedditSpider.prefetch_per_worker
+        pending = collections.deque()
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='reddit-comments'
+        )
+
+        def scan(item, post, future):
+            if item is not None:
+                yield item
+            if future is not None:
+                for comment in self.scrape_comments(
+                    sf, post, future.result()
+                ):
+                    yield comment
+            self.scanned(post)
+
+        try:
+            for post in section:
+                future = None
+                if not self.seen(post):
+                    future = executor.submit(
+                        self.fetch_comments, post, sf.ret('more_limit'),
+                        sf.ret('comment_depth')
+                    )
+                pending.append((self.scrape_post(sf, post), post, future))
+                if len(pending) < limit:
+                    continue
+                for item in scan(*pending.popleft()):
+                    yield item
 
-    def scrape_comments(self, sf, post):
+            while pending:
+                for item in scan(*pending.popleft()):
+                    yield item
+        finally:
+            # The spider may be stopped before the pending trees are
+            # scanned.
+            for _, _, future in pending:
+                if future is not None:
+                    future.cancel()
+            executor.shutdown(wait=False)
+
+    def scrape_post(self, sf, post):
         """
         @param sf: ScrapeFilter of this spider.
+        @param post: A post object.
+
+        Returns the post component, or None if the post doesn't pass the
+        filter.
+        """
+        sf_post = sf.get('post')
+
+        # Assign each component's attribute.
+        sf_post.set_attr_values(
+            title=post.title,
+            score=int(post.score),
+            subreddit=str(post.subreddit),
+            author=str(post.author)
+        )
+
+        # Scrape the post if it pass the filter.
+        if not sf_post.should_scrape():
+            return None
+        return ComponentLoader('post', {
+            'post_id': post.id,
+            'title': post.title,
+            'subreddit': str(post.subreddit),
+            'score': post.score,
+            'author': str(post.author)
+        })
+
+    def fetch_comments(self, post, more_limit=0, depth=None):
+        """
         @param post: A post object which contains comment objects.
+        @param more_limit: The maximum number of requests made to load the
+                           hidden comments (see `expand_comments`), or a
+                           negative number for no limit.
+        @param depth: The maximum depth of the hidden comments loaded, or
+                      None.
+
+        Returns the list of (most if not all) comments of the post. The
+        comments are fetched with the praw instance of the current thread.
         """
-        sf_comment = sf.get('comment')
-        # Scraping (most if not all) comments of each post.
-        post.comments.replace_more(limit=0)
-        for comment in post.comments.list():
-            sf_comment.set_attr_values(
-                body=comment.body,
-                score=comment.score,
-                author=str(comment.author)
+        reddit = self.thread_reddit()
+        post = reddit.submission(id=post.id)
+        if more_limit == 0:
+            post.comments.replace_more(limit=0)
+            comments, requests = post.comments.list(), 1
+        else:
+            comments, requests = self.expand_comments(
+                post, more_limit, depth, reddit
             )
 
-            if sf_comment.should_scrape():
+        if self.counter_lock is not None:
+            with self.counter_lock:
+                self.requests += requests
+                self.comments_fetched += len(comments)
+        logging.debug(
+            'Fetched %d comments of the post %s with %d requests.'
+            % (len(comments), post.id, requests)
+        )
+        return comments
+
+    def expand_comments(self, post, more_limit, depth=None, reddit=None):
+        """
+        @param post: A post object which contains comment objects.
+        @param more_limit: See `fetch_comments`.
+        @param depth: See `fetch_comments`.
+        @param reddit: The praw instance of the post, or None for the
+                       spider's.
+
+        Returns a tuple `(comments, requests)`: the list of the comments of
+        the post, including the ones hidden behind the "load more
+        comments" links (the MoreComments objects), and the number of
+        requests made to fetch them.
+
+        Instead of making a request per link, like `replace_more`, the
+        ids of the hidden comments of all the links in the tree are
+        gathered, and loaded 100 at a time (the most reddit allows) with
+        /api/morechildren. The comments loaded may hold links to more
+        hidden comments, which are gathered in turn. The "continue this
+        thread" links, which don't hold the ids of their comments, each
+        take a request of their own.
+        """
+        comments = []
+        children = []   # The ids of the hidden comments.
+        threads = []    # The "continue this thread" links.
+
+        def gather(items):
+            queue = collections.deque(items)
+            while queue:
+                item = queue.popleft()
+                if not isinstance(item, praw.models.MoreComments):
+                    comments.append(item)
+                    queue.extend(item.replies)
+                elif depth is None or getattr(item, 'depth', 0) <= depth:
+                    if item.children:
+                        children.extend(item.children)
+                    elif item.parent_id:
+                        item.submission = post
+                        threads.append(item)
+
+        # Fetching the post's comment tree takes a request.
+        gather(post.comments)
+        requests = 1
+
+        n = RedditSpider.more_children_per_request
+        while children or threads:
+            if 0 <= more_limit <= requests - 1:
+                break
+            if children:
+                chunk, children[:n] = children[:n], []
+                reddit = reddit or self.r
+                items = reddit.post(API_PATH['morechildren'], data={
+                    'children': ','.join(chunk),
+                    'link_id': post.fullname,
+                    'sort': post.comment_sort,
+                })
+                for item in items:
+                    item.submission = post
+                gather(items)
+            else:
+                gather(threads.pop(0).comments())
+            requests += 1
+        return comments, requests
+
+    def scrape_comments(self, sf, post, comments=None):
+        """
+        @param sf: ScrapeFilter of this spider.
+        @param post: A post object which contains comment objects.
+        @param comments: The comments of the post, if they are already
+                         fetched (see `fetch_comments`).
+        """
+        # Scraping (most if not all) comments of each post. The comments
+        # of the post are all filtered at once.
+        if comments is None:
+            comments = self.fetch_comments(
+                post, sf.ret('more_limit'), sf.ret('comment_depth')
+            )
+        mask = sf.filter_batch('comment', {
+            'body': [comment.body for comment in comments],
+            'score': [comment.score for comment in comments],
+            'author': [str(comment.author) for comment in comments],
+        })
+        for comment, should_scrape in zip(comments, mask):
+            if should_scrape:
                 yield ComponentLoader('comment', {
                     'comment_id': comment.id,
                     'author': str(comment.author),
@@ -198,7 +487,8 @@ class RedditSpider(Spider):
 
                 if not sf.ret('skip_redditors'):
                     usr_sections = self.get_redditor_sections(
-                        sf.ret('sections'), [str(comment.author)]
+                        sf.ret('sections'), [str(comment.author)],
+                        sf.ret('interleave')
                     )
                     for redditor in self.scrape_redditors_sections(
                         sf, usr_sections
@@ -206,6 +496,8 @@ class RedditSpider(Spider):
                         yield redditor 
 
     def scrape_redditors_sections(self, sf, sections):
+        if sf.ret('interleave'):
+            sections = [ListingScheduler(sections)]
         for section in sections:
             for item in self.scrape_redditors(sf, section):
                 yield item
@@ -228,50 +520,196 @@ class RedditSpider(Spider):
                     'author': str(item.author)
                 })
 
-    def get_subreddit_sections(self, sections, scan_subs):
+    def get_subreddit_sections(self, sections, scan_subs, separate=False):
         """
         @param sections: The list of section(s) to select from.
         @param scan_subs: The list of subreddit(s) to scan.
+        @param separate: If True, each subreddit has its own section(s),
+                         instead of a section for all the subreddits.
 
         Get which section(s) in which subreddit(s) to scrape
         the submissions from. This method returns generator
         object of selected sections.
         """
-        scan_subs = '+'.join(scan_subs)
+        if not separate:
+            scan_subs = ['+'.join(scan_subs)]
 
         # Chain the listing generators of each section
-        # into one listing generator.
-        selected_sections = None
-        if 'hot' in sections:
-            hot_section = self.r.subreddit(scan_subs).hot(limit=None)
-            yield hot_section
-        if 'new' in sections:
-            new_section = self.r.subreddit(scan_subs).new(limit=None)
-            yield new_section
-        if 'rising' in sections:
-            rising_section = self.r.subreddit(scan_subs).rising(limit=None)
-            yield rising_section
-        if 'top' in sections:
-            top_section = self.r.subreddit(scan_subs).top(limit=None)
-            yield top_section
-
-    def get_redditor_sections(self, sections, scan_redditors):
+        # into one listing generator. The separate sections are scanned
+        # at the same time, in threads (see `ListingScheduler`), so each
+        # has a praw instance of its own.
+        def subreddit(sub):
+            r = self.new_reddit() if separate else self.r
+            return r.subreddit(sub)
+
+        for sub in scan_subs:
+            if 'hot' in sections:
+                hot_section = subreddit(sub).hot(limit=None)
+                yield self.track_listing('r/%s/hot' % sub, hot_section)
+            if 'new' in sections:
+                new_section = subreddit(sub).new(limit=None)
+                yield self.track_listing(
+                    'r/%s/new' % sub, new_section, chronological=True
+                )
+            if 'rising' in sections:
+                rising_section = subreddit(sub).rising(limit=None)
+                yield self.track_listing('r/%s/rising' % sub, rising_section)
+            if 'top' in sections:
+                top_section = subreddit(sub).top(limit=None)
+                yield self.track_listing('r/%s/top' % sub, top_section)
+
+    def track_listing(self, key, listing, chronological=False):
+        """
+        @param key: The key of the listing in the spider's state.
+        @param listing: A listing generator of posts.
+        @param chronological: True if the listing is sorted from the
+                              newest post to the oldest (the new section).
+
+        Returns the listing, without what the previous runs of the spider
+        (see `--state-dir`) scanned of it. A chronological listing stops
+        at the newest post seen in it before, as the posts that come
+        after it are all older, and no more of it is fetched. The other
+        listings (hot, rising and top) aren't sorted by time, so they
+        are still fetched, and their posts all yielded, in full: only the
+        comments of the posts they held the last time aren't fetched
+        again (see `seen`).
+
+        The new listing is still paged from the newest post, instead of
+        from the one seen before with reddit's `before` parameter: that
+        takes as many requests, and yields nothing once the post seen
+        before is deleted.
+
+        The mark of the listing (its newest post, or the posts of the
+        other listings) is kept in the spider's state once the whole
+        listing is scanned, that is, once its posts are all fetched and
+        the spider has scanned each of them (see `scanned`). A listing
+        stopped halfway (i.e. by a timeout) leaves the state as it was,
+        so that its posts are scanned again by the next run.
+        """
+        if self.state is None:
+            return listing
+        return RedditSpider.TrackedListing(self, key, listing, chronological)
+
+    def seen(self, post):
+        """
+        Returns True if the post is in the mark of its listing, i.e. its
+        comments were scanned by the previous run.
+        """
+        listing = self.post_listings.get(id(post))
+        return listing is not None and post.fullname in listing.seen
+
+    def scanned(self, post):
+        """
+        Tell the listing of the post that the post, and its comments,
+        are scanned.
+        """
+        listing = self.post_listings.pop(id(post), None)
+        if listing is not None:
+            listing.scanned()
+
+    def get_redditor_sections(self, sections, scan_redditors, separate=False):
         """
         @param sections: The list of section(s) to choose from.
         @param scan_redditors: The list of redditor(s) to scan.
+        @param separate: If True, the sections are scanned at the same
+                         time, each with a praw instance of its own.
 
         Get which section(s) in which redditor(s) to scrape
         the submissions and comments from. This method
         returns generator object of selected sections.
         """
+        def redditor(username):
+            r = self.new_reddit() if separate else self.r
+            return r.redditor(username)
 
         for username in scan_redditors:
             if 'hot' in sections:
-                hot_section = self.r.redditor(username).hot()
+                hot_section = redditor(username).hot()
                 yield hot_section
             if 'new' in sections:
-                new_section = self.r.redditor(username).new()
+                new_section = redditor(username).new()
                 yield new_section
             if 'top' in sections:
-                top_section = self.r.redditor(username).top()
+                top_section = redditor(username).top()
                 yield top_section
+
+    class TrackedListing:
+        """
+        A listing of posts tracked in the spider's state (see
+        `RedditSpider.track_listing`). The listing may be fetched in a
+        thread of its own (see `ListingScheduler`), ahead of the spider
+        scanning its posts.
+        """
+
+        spider = None
+        key = ''
+        listing = None
+        chronological = False
+        old_mark = None     # The mark of the listing in the state.
+        new_mark = None     # The mark of the posts fetched so far.
+        seen = set()        # The fullnames of the posts in the old mark.
+        unscanned = 0       # The number of posts fetched, but not yet
+                            # scanned.
+        exhausted = False
+
+        def __init__(self, spider, key, listing, chronological):
+            self.spider = spider
+            self.key = key
+            self.listing = listing
+            self.chronological = chronological
+            self.old_mark = spider.state.get(key)
+            self.new_mark = None
+            self.seen = set()
+            if self.old_mark is not None and not chronological:
+                self.seen = set(self.old_mark.get('fullnames', ()))
+            self.unscanned = 0
+            self.exhausted = False
+            self.lock = threading.Lock()
+
+        def __iter__(self):
+            mark = self.old_mark
+            newest = mark if self.chronological else None
+            fullnames = []
+            for post in self.listing:
+                if not self.chronological:
+                    fullnames.append(post.fullname)
+                elif mark is not None and (
+                    post.fullname == mark['fullname']
+                    or post.created_utc < mark['created_utc']
+                ):
+                    logging.info('Reached the posts of %s seen in the '\
+                                 'previous run.' % self.key)
+                    break
+                elif newest is None \
+                or post.created_utc > newest['created_utc']:
+                    newest = {
+                        'fullname': post.fullname,
+                        'created_utc': post.created_utc,
+                    }
+
+                with self.lock:
+                    self.unscanned += 1
+                self.spider.post_listings[id(post)] = self
+                yield post
+
+            with self.lock:
+                self.exhausted = True
+                if self.chronological:
+                    self.new_mark = newest
+                else:
+                    self.new_mark = {'fullnames': fullnames}
+                self.__set_mark()
+
+        def scanned(self):
+            """
+            Tell the listing that one of its posts is scanned.
+            """
+            with self.lock:
+                self.unscanned -= 1
+                self.__set_mark()
+
+        def __set_mark(self):
+            # The whole listing is scanned.
+            if self.exhausted and self.unscanned == 0 \
+            and self.new_mark is not None:
+                self.spider.state.set(self.key, self.new_mark)
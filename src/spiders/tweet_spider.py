@@ -59,6 +59,7 @@ class TweetSpider(Spider):
         sf.add_var('replies_limit', default=0, info='limit on replies to be shown if exists')
 
     def fetch_trendings(self, api):
+        self.acquire()
         trends1 = api.trends_place(1) #get worldwide 50 trending tweet topics
         data = trends1[0]
         trends = data['trends']
@@ -92,6 +93,7 @@ class TweetSpider(Spider):
 
         while True:
             try:
+                self.acquire()
                 new_tweets = api.search(q=keyword, lang=sf.ret('lang'), count=100, result_type=sf.ret('tweet_type'), max_id=str(last_id - 1)) #max results per page
                 if not new_tweets:
                     break
@@ -103,7 +105,7 @@ class TweetSpider(Spider):
 
     def load_replies(self, sf, url, parsed, json_data):
         pos=None
-        ses=requests.Session()
+        ses=self.session()
         sf_replies=sf.get('replies')
         while True:
             if pos != None: #skip a get request if load_replies is called for the first time
@@ -156,7 +158,7 @@ class TweetSpider(Spider):
 
 
     def load_status(self, sf, author, tweet_id):
-        ses = requests.Session()
+        ses = self.session()
         base_url="https://twitter.com/i/{}/conversation/{}?include_available_features=1&include_entities=1&max_position={}&reset_error_state=false"
         url=base_url.format(author, tweet_id, None)
         data=ses.get(url)
@@ -6,6 +6,7 @@ base_url = "https://www.googleapis.com/youtube/v3/"
 
 class YoutubeSpider(Spider):
     name = "youtube"
+    http = None # The requests session of the spider (see `Spider.session`).
     HEADERS = {'user-agent': ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_5)'
                           'AppleWebKit/537.36 (KHTML, like Gecko)'
                           'Chrome/45.0.2454.101 Safari/537.36'),
@@ -49,6 +50,7 @@ class YoutubeSpider(Spider):
         sf.add_var('dev_key', default='xxx', info='Developer Key to access Youtube API')
 
     def start(self, sf):
+        self.http = self.session() # Waits for the rate limiter, if any.
         url_list= self.construct_url(sf)
         types=sf.ret('search_types')
 
@@ -85,7 +87,7 @@ class YoutubeSpider(Spider):
 
     def get_tags(self, vid_id, dev_key):
         url=base_url+'videos?id={}&part=snippet&key={}'.format(vid_id, dev_key)
-        json_data=requests.get(url, headers=self.HEADERS).json()
+        json_data=self.http.get(url, headers=self.HEADERS).json()
         tags=""
         if 'tags' in json_data['items'][0]['snippet']:
             tags=json_data['items'][0]['snippet']['tags']
@@ -94,14 +96,14 @@ class YoutubeSpider(Spider):
     def get_category(self, category_id, dev_key):
         category_id=json_data['items'][0]['snippet']['categoryId']
         url=base_url+'videoCategories?id={}&part=snippet&key={}'.format(category_id, dev_key)
-        json_data=requests.get(url,headers=self.HEADERS).json()
+        json_data=self.http.get(url,headers=self.HEADERS).json()
         category=json_data['items'][0]['snippet']['title']
         return category
 
     def search_by_vid(self, sf, url):
         order_by=sf.ret('order_by')
 
-        json_data = requests.get(url+"&order="+order_by).json()
+        json_data = self.http.get(url+"&order="+order_by).json()
         sf_vid=sf.get('video')
         dev_key=sf.ret('dev_key')
         total_results=json_data['pageInfo']['totalResults']
@@ -114,7 +116,7 @@ class YoutubeSpider(Spider):
                 vid_id=result['id']['videoId']
                 url_stats=base_url+'videos?part=statistics&id={}&key={}'.format(vid_id, dev_key)
 
-                vid_stats=requests.get(url_stats, headers=self.HEADERS).json()
+                vid_stats=self.http.get(url_stats, headers=self.HEADERS).json()
 
                 data_dict= { 'vid_id' : vid_id,
                              'entry_out_of' :"{} out of {}".format(i, total_results),
@@ -163,11 +165,11 @@ class YoutubeSpider(Spider):
                 return
 
             new_url=url+"&pageToken="+page_token
-            json_data = requests.get(new_url).json()
+            json_data = self.http.get(new_url).json()
 
 
     def search_by_channel(self, sf, url):
-        json_data=requests.get(url).json()
+        json_data=self.http.get(url).json()
         sf_channel=sf.get('channel')
         dev_key=sf.ret('dev_key')
         page_token=""
@@ -178,7 +180,7 @@ class YoutubeSpider(Spider):
 
                 url_stats=base_url+'channels?part=statistics&id={}&key={}'.format(channelID, dev_key)
 
-                json_stats=requests.get(url_stats).json()
+                json_stats=self.http.get(url_stats).json()
 
                 stats=json_stats['items'][0]['statistics']
                 if not stats['hiddenSubscriberCount']:
@@ -189,7 +191,7 @@ class YoutubeSpider(Spider):
                 views_count = stats['viewCount']
 
                 url_stats=base_url+'channels?part=snippet&id={}&key={}'.format(channelID, dev_key)
-                parsed_json=requests.get(url_stats).json()
+                parsed_json=self.http.get(url_stats).json()
                 items=parsed_json['items'][0]['snippet']
 
                 location=items['country'] if 'country' in items else "none"
@@ -218,14 +220,14 @@ class YoutubeSpider(Spider):
                 return
 
             new_url=url+"&pageToken="+page_token
-            json_data = requests.get(new_url).json()
+            json_data = self.http.get(new_url).json()
 
 
     def fetch_comments(self, vid_id, sf):
         dev_key=sf.ret('dev_key')
         url=base_url+"commentThreads?part=snippet&videoId={}&key={}&maxResults=50".format(vid_id, dev_key)
 
-        json_data=requests.get(url).json()
+        json_data=self.http.get(url).json()
         sf_comments=sf.get('comments')
 
         total_results=json_data['pageInfo']['totalResults']
@@ -262,10 +264,10 @@ class YoutubeSpider(Spider):
                 return
 
             new_url=url+"&pageToken="+page_token
-            json_data = requests.get(new_url).json()
+            json_data = self.http.get(new_url).json()
 
     def search_by_playlist(self, sf, url):
-        json_data=requests.get(url).json()
+        json_data=self.http.get(url).json()
         sf_playlist=sf.get('playlist')
         dev_key=sf.ret('dev_key')
         total_results=json_data['pageInfo']['totalResults']
@@ -296,4 +298,4 @@ class YoutubeSpider(Spider):
                 return
 
             new_url=url+"&pageToken="+page_token
-            json_data = requests.get(new_url).json()
+            json_data = self.http.get(new_url).json()
@@ -0,0 +1,108 @@
+# test_deduplicator.py
+#
+# Tests of the deduplicator of dmine.
+#
+# Usage:
+#     python -m pytest tests
+
+import os
+import sys
+import tempfile
+import unittest
+
+root_path = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path[0:0] = [
+    os.path.join(root_path, 'src'),
+    os.path.join(root_path, 'dep-py'),
+    os.path.join(root_path, 'dep-py', 'jsonlines'),
+]
+
+from dmine import Deduplicator, ComponentLoader
+
+def post(post_id):
+    return ComponentLoader('post', {'post_id': post_id, 'title': 't'})
+
+class DeduplicatorTest(unittest.TestCase):
+
+    def test_added_only(self):
+        # An item is a duplicate once it is added, not once it is checked.
+        dedup = Deduplicator('lru')
+        self.assertFalse(dedup.is_duplicate(post('p1')))
+        self.assertFalse(dedup.is_duplicate(post('p1')))
+        dedup.add(post('p1'))
+        self.assertTrue(dedup.is_duplicate(post('p1')))
+        self.assertTrue(dedup.is_duplicate(post('p1')))
+        self.assertEqual(dedup.suppressed, 2)
+
+    def test_key(self):
+        self.assertEqual(Deduplicator.key(post('p1')), 'post:p1')
+        self.assertEqual(
+            Deduplicator.key(ComponentLoader('comment', {
+                'post_id': 'p1', 'comment_id': 'c1'
+            })), 'comment:c1'
+        )
+        self.assertEqual(
+            Deduplicator.key(ComponentLoader('redditor', {
+                'user_id': 'u1', 'channel_id': 'x'
+            })), 'redditor:u1'
+        )
+        self.assertEqual(Deduplicator.key({'vid_id': 3}), ':3')
+
+        # The same id in another component isn't a duplicate, and an
+        # item without an id never is.
+        dedup = Deduplicator('lru')
+        dedup.add(post('x'))
+        dedup.add({'title': 't'})
+        self.assertFalse(dedup.is_duplicate(
+            ComponentLoader('tweet', {'post_id': 'x'})
+        ))
+        self.assertFalse(dedup.is_duplicate({'title': 't'}))
+
+    def test_lru_eviction(self):
+        dedup = Deduplicator('lru', size=2)
+        dedup.add(post('p1'))
+        dedup.add(post('p2'))
+        # Seeing p1 again makes p2 the least recently seen key.
+        self.assertTrue(dedup.is_duplicate(post('p1')))
+        dedup.add(post('p3'))
+        self.assertTrue(dedup.is_duplicate(post('p1')))
+        self.assertFalse(dedup.is_duplicate(post('p2')))
+        self.assertTrue(dedup.is_duplicate(post('p3')))
+
+    def test_bloom(self):
+        dedup = Deduplicator('bloom', size=1000, error_rate=0.01)
+        for i in range(1000):
+            dedup.add(post(i))
+        self.assertTrue(all(dedup.is_duplicate(post(i)) for i in range(1000)))
+
+        # About 1% of the new keys are false positives.
+        false_positives = sum(
+            dedup.is_duplicate(post(i)) for i in range(1000, 11000)
+        )
+        self.assertLess(false_positives, 300)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            Deduplicator('set')
+
+    def test_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'seen.db')
+            dedup = Deduplicator('lru', size=1, store_path=path)
+            dedup.add(post('p1'))
+            dedup.add(post('p2'))
+            # p1 was evicted from the LRU set, but is still in the store.
+            self.assertTrue(dedup.is_duplicate(post('p1')))
+            self.assertFalse(dedup.is_duplicate(post('p3')))
+            dedup.close()
+
+            # The keys added by a previous run are duplicates too.
+            for method in ('lru', 'bloom'):
+                dedup = Deduplicator(method, size=10, store_path=path)
+                self.assertTrue(dedup.is_duplicate(post('p1')))
+                self.assertTrue(dedup.is_duplicate(post('p2')))
+                self.assertFalse(dedup.is_duplicate(post('p3')))
+                dedup.close()
+
+if __name__ == '__main__':
+    unittest.main()
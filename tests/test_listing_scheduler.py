@@ -0,0 +1,105 @@
+# test_listing_scheduler.py
+#
+# Tests of the listing scheduler of dmine.
+#
+# Usage:
+#     python -m pytest tests
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+root_path = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path[0:0] = [
+    os.path.join(root_path, 'src'),
+    os.path.join(root_path, 'dep-py'),
+    os.path.join(root_path, 'dep-py', 'jsonlines'),
+]
+
+from dmine import ListingScheduler
+
+def round_robin(listings, batch_size, skipped):
+    """
+    Returns the items of the listings in the order they are scheduled,
+    if the first `skipped` listings had no item yet on the first turn.
+    """
+    iterators = [iter(listing) for listing in listings]
+    active = list(range(len(listings)))
+    items = []
+    first = True
+    while active:
+        for i in list(active):
+            if first and i < skipped:
+                continue
+            for _ in range(batch_size):
+                try:
+                    items.append(next(iterators[i]))
+                except StopIteration:
+                    active.remove(i)
+                    break
+        first = False
+    return items
+
+class ListingSchedulerTest(unittest.TestCase):
+
+    def schedule(self, listings, batch_size):
+        # The items are taken slowly, so the listings have all fetched
+        # theirs ahead once the first item comes. Only the listings
+        # whose thread hadn't fetched anything yet on the first turn are
+        # skipped.
+        items = []
+        for item in ListingScheduler(listings, batch_size=batch_size):
+            items.append(item)
+            time.sleep(0.05 if len(items) == 1 else 0.001)
+        return items
+
+    def assertRoundRobin(self, listings, batch_size=1):
+        items = self.schedule(listings, batch_size)
+        self.assertIn(items, [
+            round_robin(listings, batch_size, skipped)
+            for skipped in range(len(listings))
+        ])
+
+    def test_round_robin(self):
+        self.assertRoundRobin([['a1', 'a2', 'a3'], ['b1', 'b2', 'b3'],
+                               ['c1', 'c2', 'c3']])
+
+    def test_uneven_listings(self):
+        self.assertRoundRobin([['a1'], ['b1', 'b2', 'b3', 'b4'], [],
+                               ['d1', 'd2']])
+
+    def test_batch_size(self):
+        self.assertRoundRobin([['a%d' % i for i in range(5)],
+                               ['b%d' % i for i in range(3)]], batch_size=2)
+
+    def test_slow_listing(self):
+        # A listing waiting on a request doesn't hold up the others.
+        fast_done = threading.Event()
+
+        def slow():
+            fast_done.wait(5)
+            yield 's1'
+
+        fast = ['f%d' % i for i in range(10)]
+        items = []
+        for item in ListingScheduler([slow(), fast]):
+            items.append(item)
+            if len(items) == len(fast):
+                fast_done.set()
+        self.assertEqual(items, fast + ['s1'])
+
+    def test_error(self):
+        def failing():
+            yield 'x1'
+            raise RuntimeError('listing failed')
+
+        items = []
+        with self.assertRaises(RuntimeError):
+            for item in ListingScheduler([failing()]):
+                items.append(item)
+        self.assertEqual(items, ['x1'])
+
+if __name__ == '__main__':
+    unittest.main()
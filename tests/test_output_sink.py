@@ -0,0 +1,338 @@
+# test_output_sink.py
+#
+# Tests of the output sink of dmine.
+#
+# Usage:
+#     python -m pytest tests
+
+import os
+import csv
+import sys
+import gzip
+import json
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+root_path = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path[0:0] = [
+    os.path.join(root_path, 'src'),
+    os.path.join(root_path, 'dep-py'),
+    os.path.join(root_path, 'dep-py', 'jsonlines'),
+]
+
+import dmine
+from dmine import OutputSink, ComponentLoader, CompressedFile,\
+                  JsonArrayFile
+
+class CsvOutputTest(unittest.TestCase):
+    """
+    A CSV file starts with a header: the declared columns first, then
+    the other keys of the first row. Later runs keep that header.
+    """
+
+    columns = {'post': ['post_id', 'title', 'score']}
+
+    def write(self, out_dir, rows):
+        with OutputSink(out_dir=out_dir, file_format='csv',
+                        columns=self.columns) as sink:
+            for row in rows:
+                sink.write(ComponentLoader('post', row))
+
+    def read(self, out_dir):
+        with open(os.path.join(out_dir, 'post.csv'), newline='',
+                  encoding='utf-8') as f:
+            return list(csv.reader(f))
+
+    def test_header(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            self.write(out_dir, [
+                {'author': 'a', 'score': 1, 'post_id': 'p1'},
+                {'post_id': 'p2', 'title': 'a, "quoted"\nline',
+                 'score': 2, 'author': 'b', 'extra': 'x'},
+            ])
+            self.assertEqual(self.read(out_dir), [
+                ['post_id', 'score', 'author'],
+                ['p1', '1', 'a'],
+                ['p2', '2', 'b'],
+            ])
+
+    def test_append_keeps_header(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            self.write(out_dir, [{'post_id': 'p1', 'title': 't', 'score': 1}])
+            self.write(out_dir, [
+                {'score': 2, 'title': 'caf\u00e9, "x"\ny', 'post_id': 'p2'},
+                {'post_id': 'p3'},
+            ])
+            self.assertEqual(self.read(out_dir), [
+                ['post_id', 'title', 'score'],
+                ['p1', 't', '1'],
+                ['p2', 'caf\u00e9, "x"\ny', '2'],
+                ['p3', '', ''],
+            ])
+
+class JsonArrayTest(unittest.TestCase):
+    """
+    A JSON array is repaired before more records are appended to it,
+    whether it was closed or its writer was killed.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.dir.name, 'post.json')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, ids):
+        with OutputSink(self.file_path, file_format='json') as sink:
+            for i in ids:
+                sink.write(ComponentLoader('post', {'post_id': i}))
+
+    def read(self):
+        with open(self.file_path, encoding='utf-8') as f:
+            return [r['post_id'] for r in json.load(f)]
+
+    def repair(self, data):
+        with open(self.file_path, 'wb') as f:
+            f.write(data)
+        has_records = JsonArrayFile.repair(self.file_path)
+        with open(self.file_path, 'rb') as f:
+            return has_records, f.read()
+
+    def test_repair(self):
+        self.assertEqual(
+            self.repair(b'[\n{"a": 1},\n{"a": 2}\n]\n'),
+            (True, b'[\n{"a": 1},\n{"a": 2}')
+        )
+        # Killed in the middle of a record, or right after a separator.
+        self.assertEqual(
+            self.repair(b'[\n{"a": 1},\n{"a": "x, y'),
+            (True, b'[\n{"a": 1}')
+        )
+        self.assertEqual(
+            self.repair(b'[\n{"a": 1},\n'), (True, b'[\n{"a": 1}')
+        )
+        self.assertEqual(self.repair(b'[\n]\n'), (False, b'['))
+        self.assertEqual(self.repair(b'['), (False, b'['))
+        self.assertEqual(self.repair(b''), (None, b''))
+        with self.assertRaises(ValueError):
+            self.repair(b'{"a": 1}\n')
+
+    def test_append(self):
+        self.write(range(3))
+        self.write(range(3, 5))
+        self.assertEqual(self.read(), list(range(5)))
+
+        # Killed in the middle of the last record.
+        with open(self.file_path, 'r+b') as f:
+            f.truncate(f.seek(0, os.SEEK_END) - 6)
+        self.write([5])
+        self.assertEqual(self.read(), [0, 1, 2, 3, 5])
+
+class RotationTest(unittest.TestCase):
+
+    def test_window_ends_on_flush(self):
+        # A shard whose time window is over gets its name when the sink
+        # is flushed, even if no record comes afterwards.
+        with tempfile.TemporaryDirectory() as out_dir,\
+             mock.patch('dmine.time.time') as now:
+            sink = OutputSink(out_dir=out_dir, file_format='jsonl',
+                              rotate_interval='minute')
+            now.return_value = 59.5
+            sink.write(ComponentLoader('post', {'post_id': 1}))
+            sink.flush()
+            self.assertEqual(os.listdir(out_dir), ['.post-1970-01-01T00-00'
+                                                   '.jsonl.tmp'])
+            now.return_value = 60.5
+            sink.flush()
+            sink.sync()
+            self.assertEqual(os.listdir(out_dir),
+                             ['post-1970-01-01T00-00.jsonl'])
+
+            sink.write(ComponentLoader('post', {'post_id': 2}))
+            sink.close()
+            self.assertEqual(sorted(os.listdir(out_dir)), [
+                'post-1970-01-01T00-00.jsonl', 'post-1970-01-01T00-01.jsonl'
+            ])
+
+class SqliteOutputTest(unittest.TestCase):
+    """
+    The rows of a component with a key column are upserted on it, and
+    the new keys of later rows are added to the tables as columns.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'out.sqlite')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, items):
+        with OutputSink(filename=self.path, file_format='sqlite',
+                        columns={'post': ['post_id', 'score']}) as sink:
+            for name, row in items:
+                sink.write(ComponentLoader(name, row))
+
+    def select(self, query):
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute(query).fetchall()
+        finally:
+            connection.close()
+
+    def test_upsert(self):
+        self.write([('post', {'post_id': 'p1', 'score': 1}),
+                    ('post', {'post_id': 'p2', 'score': 2})])
+        self.write([('post', {'post_id': 'p1', 'score': 10})])
+        self.assertEqual(
+            self.select('SELECT post_id, score FROM post ORDER BY post_id'),
+            [('p1', 10), ('p2', 2)]
+        )
+
+    def test_key_of_component(self):
+        # A comment carries the id of its post too, but is keyed on its
+        # own id: the comments of the same post are all kept.
+        self.write([
+            ('comment', {'post_id': 'p1', 'comment_id': 'c1', 'body': 'a'}),
+            ('comment', {'post_id': 'p1', 'comment_id': 'c2', 'body': 'b'}),
+            ('comment', {'post_id': 'p2', 'comment_id': 'c1', 'body': 'c'}),
+        ])
+        self.assertEqual(
+            self.select('SELECT comment_id, post_id, body FROM comment '
+                        'ORDER BY comment_id'),
+            [('c1', 'p2', 'c'), ('c2', 'p1', 'b')]
+        )
+
+    def test_no_key(self):
+        # A component without a key column is only inserted.
+        self.write([('redditor', {'name': 'a'}), ('redditor', {'name': 'a'})])
+        self.assertEqual(self.select('SELECT name FROM redditor'),
+                         [('a',), ('a',)])
+
+    def test_new_columns(self):
+        self.write([('post', {'post_id': 'p1', 'score': 1})])
+        self.write([('post', {'post_id': 'p2', 'title': 't', 'score': 2}),
+                    ('post', {'post_id': 'p1', 'flair': 'f'})])
+        self.assertEqual(
+            self.select('SELECT * FROM post ORDER BY post_id'),
+            [('p1', 1, None, 'f'), ('p2', 2, 't', None)]
+        )
+        columns = [c[1] for c in self.select('PRAGMA table_info(post)')]
+        self.assertEqual(columns, ['post_id', 'score', 'title', 'flair'])
+
+class CompressedOutputTest(unittest.TestCase):
+    """
+    What is written before a flush can be decompressed without closing
+    the sink, as if the spider had crashed right after the flush.
+    """
+
+    def write_and_flush(self, out_dir, compress, file_format):
+        sink = OutputSink(
+            out_dir=out_dir, file_format=file_format, compress=compress
+        )
+        for i in range(10):
+            sink.write(ComponentLoader('post', {'post_id': i, 'score': i}))
+        sink.flush()
+        return sink
+
+    def test_gzip_flush(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            for file_format in ('jsonl', 'csv', 'json'):
+                sink = self.write_and_flush(out_dir, 'gzip', file_format)
+                file_path = os.path.join(out_dir, 'post.%s.gz' % file_format)
+                with open(file_path, 'rb') as f:
+                    data = gzip.decompress(f.read()).decode('utf-8')
+                if file_format == 'json':
+                    # The array is closed when the sink is.
+                    data = json.loads(data + ']')
+                else:
+                    data = data.splitlines()[file_format == 'csv':]
+                self.assertEqual(len(data), 10)
+                sink.close()
+
+    @unittest.skipIf(dmine.zstandard is None, 'zstandard is not installed')
+    def test_zstd_flush(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            sink = self.write_and_flush(out_dir, 'zstd', 'jsonl')
+            file_path = os.path.join(out_dir, 'post.jsonl.zst')
+            with open(file_path, 'rb') as f:
+                decompressor = dmine.zstandard.ZstdDecompressor()
+                data = decompressor.decompressobj().decompress(f.read())
+            self.assertEqual(data.count(b'\n'), 10)
+            sink.close()
+
+class CompressedJsonAppendTest(unittest.TestCase):
+    """
+    A run writing into an existing compressed JSON array appends its
+    records to the array.
+    """
+
+    def write(self, out_dir, compress, ids, close=True):
+        sink = OutputSink(out_dir=out_dir, file_format='json',
+                          compress=compress)
+        for i in ids:
+            sink.write(ComponentLoader('post', {'post_id': i}))
+            # A member per record, so that the repair has several members
+            # to go through.
+            sink.flush()
+        if close:
+            sink.close()
+        return sink
+
+    def read(self, file_path, compress):
+        with open(file_path, 'rb') as f:
+            if compress == 'gzip':
+                data = gzip.decompress(f.read())
+            else:
+                decompressor = dmine.zstandard.ZstdDecompressor()
+                data = decompressor.stream_reader(
+                    f, read_across_frames=True
+                ).read()
+        return [r['post_id'] for r in json.loads(data.decode('utf-8'))]
+
+    def check_append(self, compress):
+        ext = CompressedFile.extensions[compress]
+        with tempfile.TemporaryDirectory() as out_dir:
+            file_path = os.path.join(out_dir, 'post.json' + ext)
+            self.write(out_dir, compress, range(3))
+            self.write(out_dir, compress, range(3, 5))
+            self.assertEqual(self.read(file_path, compress), list(range(5)))
+
+            # A run killed in the middle of a member: its last member is
+            # cut short, and the array isn't closed.
+            sink = self.write(out_dir, compress, range(5, 8), close=False)
+            sink.write(ComponentLoader('post', {'post_id': 8}))
+            size = os.path.getsize(file_path)
+            sink.close()
+            with open(file_path, 'r+b') as f:
+                f.truncate(size + 3)
+            self.write(out_dir, compress, [9])
+            self.assertEqual(
+                self.read(file_path, compress), list(range(8)) + [9]
+            )
+
+    def test_gzip_append(self):
+        self.check_append('gzip')
+
+    @unittest.skipIf(dmine.zstandard is None, 'zstandard is not installed')
+    def test_zstd_append(self):
+        self.check_append('zstd')
+
+    def test_empty(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            file_path = os.path.join(out_dir, 'post.json.gz')
+            open(file_path, 'wb').close()
+            self.write(out_dir, 'gzip', [1])
+            self.assertEqual(self.read(file_path, 'gzip'), [1])
+
+            # An array without any record.
+            with open(file_path, 'wb') as f:
+                f.write(gzip.compress(b'[\n]\n'))
+            self.write(out_dir, 'gzip', [2, 3])
+            self.assertEqual(self.read(file_path, 'gzip'), [2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
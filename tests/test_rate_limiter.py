@@ -0,0 +1,150 @@
+# test_rate_limiter.py
+#
+# Tests of the rate limiter of dmine.
+#
+# Usage:
+#     python -m pytest tests
+
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+root_path = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path[0:0] = [
+    os.path.join(root_path, 'src'),
+    os.path.join(root_path, 'dep-py'),
+    os.path.join(root_path, 'dep-py', 'jsonlines'),
+]
+
+import dmine
+from dmine import RateLimiter
+
+class Clock:
+    """
+    A clock that only moves when it is told to, and whose sleeps are
+    recorded instead of waited.
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+class RateLimiterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patches = [
+            mock.patch('dmine.time.monotonic', self.clock.time),
+            mock.patch('dmine.time.time', self.clock.time),
+            mock.patch('dmine.time.sleep', self.clock.sleep),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+class ThreadBackendTest(RateLimiterTestCase):
+
+    def test_burst(self):
+        limiter = RateLimiter(10, 1.0, burst=3)
+        waits = [limiter.acquire() for _ in range(5)]
+        # The bucket holds 3 tokens, and a token comes every 0.1s: the
+        # waiting requests reserve the coming tokens in turn.
+        self.assertEqual(waits[:3], [0, 0, 0])
+        self.assertAlmostEqual(waits[3], 0.1)
+        self.assertAlmostEqual(waits[4], 0.2)
+        self.assertEqual(len(self.clock.sleeps), 2)
+        self.assertEqual((limiter.requests, limiter.waits), (5, 2))
+        self.assertAlmostEqual(limiter.max_wait, 0.2)
+
+    def test_refill(self):
+        limiter = RateLimiter(60, 60, burst=2)
+        limiter.acquire(2)
+        self.clock.now += 1.5
+        # 1.5 tokens came, so the next token is 0.5s away.
+        self.assertEqual(limiter.acquire(), 0)
+        self.assertAlmostEqual(limiter.acquire(), 0.5)
+
+        # The bucket doesn't hold more than `burst` tokens.
+        self.clock.now += 3600
+        self.assertEqual(limiter.acquire(2), 0)
+        self.assertAlmostEqual(limiter.acquire(), 1.0)
+
+    def test_wrap(self):
+        limiter = RateLimiter(1, 10)
+        limited = limiter.wrap(lambda x: x * 2)
+        self.assertEqual(limited(2), 4)
+        self.assertEqual(limited(3), 6)
+        self.assertEqual(limiter.requests, 2)
+        self.assertEqual(self.clock.sleeps, [10.0])
+
+    def test_invalid(self):
+        for args, kwargs in (
+                ((0,), {}), ((1, 0), {}), ((1,), {'burst': 0}),
+                ((1,), {'backend': 'redis'}), ((1,), {'backend': 'file'})):
+            with self.assertRaises(ValueError):
+                RateLimiter(*args, **kwargs)
+
+class ThreadsTest(unittest.TestCase):
+
+    def test_shared_by_threads(self):
+        # 4 threads taking 5 tokens each, at 100 tokens per second, take
+        # at least 0.19s in all.
+        limiter = RateLimiter(100, 1.0)
+        threads = [
+            threading.Thread(
+                target=lambda: [limiter.acquire() for _ in range(5)]
+            ) for _ in range(4)
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+        self.assertEqual(limiter.requests, 20)
+
+@unittest.skipIf(dmine.fcntl is None, 'requires fcntl')
+class FileBackendTest(RateLimiterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, 'bucket')
+
+    def limiter(self):
+        limiter = RateLimiter(10, 1.0, burst=2, backend='file',
+                              file_path=self.path)
+        self.addCleanup(limiter.close)
+        return limiter
+
+    def test_shared_bucket(self):
+        # The limiters of several processes share the bucket of the file.
+        first, second = self.limiter(), self.limiter()
+        self.assertEqual(first.acquire(), 0)
+        self.assertEqual(second.acquire(), 0)
+        self.assertAlmostEqual(first.acquire(), 0.1)
+        self.assertAlmostEqual(second.acquire(), 0.2)
+
+        self.clock.now += 10
+        self.assertEqual(second.acquire(2), 0)
+        self.assertAlmostEqual(first.acquire(), 0.1)
+
+    def test_kept_in_file(self):
+        self.limiter().acquire(2)
+        # A limiter opened later finds the bucket empty.
+        self.assertAlmostEqual(self.limiter().acquire(), 0.1)
+        self.assertEqual(os.path.getsize(self.path), 16)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+# test_scrape_filter.py
+#
+# Tests of the scrape filters of dmine.
+#
+# Usage:
+#     python -m pytest tests
+
+import os
+import sys
+import json
+import pickle
+import random
+import tempfile
+import threading
+import unittest
+
+root_path = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path[0:0] = [
+    os.path.join(root_path, 'src'),
+    os.path.join(root_path, 'dep-py'),
+    os.path.join(root_path, 'dep-py', 'jsonlines'),
+]
+
+from dmine import ScrapeFilter, FilterCache
+from sfl import Interpreter
+
+# Two scripts whose results never agree on the comments below.
+SCRIPTS = {
+    'high': "@label = 'high' comment { score > 500 and body search 'linux' }",
+    'low': "@label = 'low' comment { score <= 500 and author != 'bot' }",
+}
+
+EXPECTED = {
+    'high': lambda c: c['score'] > 500 and 'linux' in c['body'],
+    'low': lambda c: c['score'] <= 500 and c['author'] != 'bot',
+}
+
+def setup_filter(sf):
+    sf.add_com('comment')
+    sf_comment = sf.get('comment')
+    for name in ('score', 'body', 'author'):
+        sf_comment.add(name)
+    sf.add_var('label', default='')
+
+def comment_stream(n, seed):
+    rand = random.Random(seed)
+    return [{
+        'score': rand.randint(0, 1000),
+        'body': rand.choice(['linux kernel', 'a cat', 'linux meme']),
+        'author': rand.choice(['bot', 'alice', 'bob']),
+    } for _ in range(n)]
+
+class ConcurrentFiltersTest(unittest.TestCase):
+    """
+    Filters with different scripts, run at the same time on several
+    threads, each only return their own results.
+    """
+
+    threads_per_script = 4
+    comments = 20000
+
+    def setUp(self):
+        self.cache_enabled = FilterCache.enabled
+        FilterCache.enabled = False
+
+    def tearDown(self):
+        FilterCache.enabled = self.cache_enabled
+
+    def run_filter(self, name, seed, barrier, results):
+        sf = ScrapeFilter(SCRIPTS[name], spider_name='test')
+        setup_filter(sf)
+        sf.run_interpreter()
+        comments = comment_stream(self.comments, seed)
+
+        barrier.wait()
+        sf_comment = sf.get('comment')
+        decisions = []
+        for c in comments:
+            sf_comment.set_attr_values(**c)
+            decisions.append(sf_comment.should_scrape())
+        batch = list(sf.filter_batch('comment', comments))
+        results[seed] = (name, sf.ret('label'), comments, decisions, batch)
+
+    def test_no_cross_talk(self):
+        names = sorted(SCRIPTS) * self.threads_per_script
+        barrier = threading.Barrier(len(names))
+        results = {}
+        threads = [
+            threading.Thread(
+                target=self.run_filter, args=(name, seed, barrier, results)
+            )
+            for seed, name in enumerate(names)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(results), len(names))
+        for name, label, comments, decisions, batch in results.values():
+            expected = [EXPECTED[name](c) for c in comments]
+            self.assertEqual(label, name)
+            self.assertEqual(decisions, expected)
+            self.assertEqual([bool(b) for b in batch], expected)
+
+class FilterCacheTest(unittest.TestCase):
+
+    script = "@label = 'x' comment { score > 500 and author not in "\
+             "['bot', 'alice'] or body search '^linux' }"
+
+    def setUp(self):
+        self.cache_enabled = FilterCache.enabled
+        self.cache_home = os.environ.get('XDG_CACHE_HOME')
+        self.dir = tempfile.TemporaryDirectory()
+        os.environ['XDG_CACHE_HOME'] = self.dir.name
+        FilterCache.enabled = True
+
+    def tearDown(self):
+        FilterCache.enabled = self.cache_enabled
+        if self.cache_home is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.cache_home
+        self.dir.cleanup()
+
+    def decisions(self):
+        sf = ScrapeFilter(self.script, spider_name='test')
+        setup_filter(sf)
+        sf.run_interpreter()
+        comments = comment_stream(500, 0)
+        return sf.ret('label'), list(sf.filter_batch('comment', comments))
+
+    def test_hit(self):
+        hits, misses = FilterCache.hits, FilterCache.misses
+        parsed = self.decisions()
+        self.assertEqual(FilterCache.misses, misses + 1)
+        cached = self.decisions()
+        self.assertEqual(FilterCache.hits, hits + 1)
+        self.assertEqual(cached, parsed)
+
+        # The cache file is plain JSON.
+        names = os.listdir(FilterCache.path())
+        self.assertEqual(len(names), 1)
+        with open(os.path.join(FilterCache.path(), names[0])) as f:
+            self.assertIn('components', json.load(f))
+
+    def test_pickle_isnt_loaded(self):
+        file_path = os.path.join(
+            FilterCache.path(), FilterCache.key(self.script, 'test')
+        )
+        os.makedirs(FilterCache.path())
+        with open(file_path, 'wb') as f:
+            pickle.dump(Interpreter.parse(self.script), f)
+
+        misses = FilterCache.misses
+        self.assertEqual(self.decisions()[0], 'x')
+        self.assertEqual(FilterCache.misses, misses + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,345 @@
+# test_sfl_compiler.py
+#
+# Tests of the semantics of the SFL scripts compiled by sfl.Compiler.
+#
+# Usage:
+#     python -m pytest tests
+
+import os
+import re
+import sys
+import tempfile
+import itertools
+import unittest
+
+root_path = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path[0:0] = [
+    os.path.join(root_path, 'src'),
+    os.path.join(root_path, 'dep-py'),
+    os.path.join(root_path, 'dep-py', 'jsonlines'),
+]
+
+import sfl
+from sfl import Compiler, Interpreter
+from dmine import ScrapeFilter, FilterCache
+
+def compile_script(script):
+    return Compiler(Interpreter.parse(script)).compile()
+
+class CompilerTestCase(unittest.TestCase):
+    """
+    Checks a script's block against a python function on every record,
+    both one record at a time and as a batch.
+    """
+
+    def setUp(self):
+        self.cache_enabled = FilterCache.enabled
+        FilterCache.enabled = False
+
+    def tearDown(self):
+        FilterCache.enabled = self.cache_enabled
+
+    def assertFilter(self, block, expected, records):
+        script = 'c { %s }' % block
+        program = compile_script(script)
+        predicate = program.predicates['c']
+        for record in records:
+            self.assertEqual(
+                predicate(record), expected(record),
+                '%s on %s' % (block, record)
+            )
+
+        interpreter = Interpreter()
+        interpreter.set(script)
+        batch = interpreter.output_batch('c', records)
+        self.assertEqual(
+            [bool(b) for b in batch], [expected(r) for r in records], block
+        )
+
+def truth_table(*names):
+    """
+    Returns the records of every combination of 0 and 1 for the given
+    attribute names.
+    """
+    return [dict(zip(names, values))
+            for values in itertools.product((0, 1), repeat=len(names))]
+
+class BooleanTest(CompilerTestCase):
+
+    records = truth_table('a', 'b', 'c')
+
+    def test_and_binds_tighter_than_or(self):
+        self.assertFilter(
+            'a == 1 and b == 1 or c == 1',
+            lambda r: (r['a'] and r['b']) or r['c'] == 1, self.records
+        )
+        self.assertFilter(
+            'a == 1 or b == 1 and c == 1',
+            lambda r: r['a'] == 1 or (r['b'] and r['c']), self.records
+        )
+        self.assertFilter(
+            'a == 1 and b == 1 or a == 0 and c == 1',
+            lambda r: bool(r['a'] and r['b'] or not r['a'] and r['c']),
+            self.records
+        )
+
+    def test_parentheses(self):
+        self.assertFilter(
+            '(a == 1 or b == 1) and c == 1',
+            lambda r: bool((r['a'] or r['b']) and r['c']), self.records
+        )
+        self.assertFilter(
+            '(a == 1) and (b == 1)',
+            lambda r: bool(r['a'] and r['b']), self.records
+        )
+        self.assertFilter(
+            'a == 1 and (b == 1 or (c == 1))',
+            lambda r: bool(r['a'] and (r['b'] or r['c'])), self.records
+        )
+
+    def test_not(self):
+        self.assertFilter(
+            'not a == 1 and b == 1',
+            lambda r: bool(not r['a'] and r['b']), self.records
+        )
+        self.assertFilter(
+            'not (a == 1 and b == 1)',
+            lambda r: not (r['a'] and r['b']), self.records
+        )
+        self.assertFilter(
+            'not (a == 1 or b == 1) or c == 1',
+            lambda r: bool(not (r['a'] or r['b']) or r['c']), self.records
+        )
+        self.assertFilter(
+            'not (not a == 1)', lambda r: r['a'] == 1, self.records
+        )
+
+    def test_truthiness(self):
+        self.assertFilter('a', lambda r: bool(r['a']), self.records)
+        self.assertFilter('not a', lambda r: not r['a'], self.records)
+        self.assertFilter('True and a == 1', lambda r: r['a'] == 1,
+                          self.records)
+        self.assertFilter('False or a == 1', lambda r: r['a'] == 1,
+                          self.records)
+
+class ComparisonTest(CompilerTestCase):
+
+    records = [{'x': x, 'y': y} for x in range(-1, 12, 3)
+               for y in (0, 5, 10)]
+
+    def test_operators(self):
+        for opt, operate in (
+                ('<', lambda x, y: x < y), ('<=', lambda x, y: x <= y),
+                ('>', lambda x, y: x > y), ('>=', lambda x, y: x >= y),
+                ('==', lambda x, y: x == y), ('!=', lambda x, y: x != y)):
+            self.assertFilter(
+                'x %s y' % opt,
+                lambda r: operate(r['x'], r['y']), self.records
+            )
+            self.assertFilter(
+                'x %s 5' % opt, lambda r: operate(r['x'], 5), self.records
+            )
+
+    def test_chained(self):
+        self.assertFilter(
+            '0 < x < 10', lambda r: 0 < r['x'] < 10, self.records
+        )
+        self.assertFilter(
+            '0 <= x <= y < 10', lambda r: 0 <= r['x'] <= r['y'] < 10,
+            self.records
+        )
+        self.assertFilter(
+            'not 0 < x < 10 or y == 0',
+            lambda r: not 0 < r['x'] < 10 or r['y'] == 0, self.records
+        )
+
+    def test_none_holds(self):
+        records = [{'x': None, 'y': 1}, {'x': 1, 'y': None}]
+        self.assertFilter('x > y', lambda r: True, records)
+        self.assertFilter('x > y and y < 0', lambda r: r['y'] is None,
+                          records)
+
+class MembershipTest(CompilerTestCase):
+
+    records = [{'name': name, 'title': title}
+               for name in ('alice', 'bob', 'bot')
+               for title in ('a cat', 'the dog', '')]
+
+    def test_in(self):
+        self.assertFilter(
+            "name in ['alice', 'bot']",
+            lambda r: r['name'] in ('alice', 'bot'), self.records
+        )
+        self.assertFilter(
+            "'cat' in title", lambda r: 'cat' in r['title'], self.records
+        )
+        self.assertFilter(
+            "name in 'alice, bob'", lambda r: r['name'] in 'alice, bob',
+            self.records
+        )
+
+    def test_not_in(self):
+        self.assertFilter(
+            "name not in ['alice', 'bot']",
+            lambda r: r['name'] not in ('alice', 'bot'), self.records
+        )
+        self.assertFilter(
+            "'cat' not in title and name != 'bob'",
+            lambda r: 'cat' not in r['title'] and r['name'] != 'bob',
+            self.records
+        )
+        self.assertFilter(
+            "not name in ['bob']", lambda r: r['name'] != 'bob',
+            self.records
+        )
+
+class SearchTest(CompilerTestCase):
+
+    records = [{'title': title, 'pattern': pattern}
+               for title in ('a cat', 'Cats', 'the dog', '')
+               for pattern in ('cat', '^the', '[CD]')]
+
+    def test_literal_is_the_pattern(self):
+        # A string literal is the pattern, on either side of `search`.
+        for block in ("title search 'cat'", "'cat' search title"):
+            self.assertFilter(
+                block, lambda r: 'cat' in r['title'], self.records
+            )
+        self.assertFilter(
+            "title search '^[a-z]+ [cd]' and title != 'the dog'",
+            lambda r: r['title'] == 'a cat', self.records
+        )
+
+    def test_attribute_pattern(self):
+        # Between two attributes, the left one is the pattern.
+        self.assertFilter(
+            'pattern search title',
+            lambda r: re.search(r['pattern'], r['title']) is not None,
+            self.records
+        )
+        self.assertFilter(
+            'not title search pattern',
+            lambda r: re.search(r['title'], r['pattern']) is None,
+            self.records
+        )
+
+    def test_invalid_pattern(self):
+        # An invalid pattern is reported when the script is compiled,
+        # before any record is filtered.
+        for block in ("title search '('", "'[a-' search title"):
+            with self.assertRaises(SyntaxError):
+                ScrapeFilter('c { %s }' % block, spider_name='test')
+
+class ListTest(CompilerTestCase):
+
+    records = [{'name': name, 'file': n}
+               for name in ('alice', 'bob', 'bot1', '')
+               for n in (0, 1)]
+
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.dir.name, 'bots.txt'), 'w') as f:
+            f.write('bot1\n  bot2  \n\nbob\n')
+
+    def tearDown(self):
+        super().tearDown()
+        self.dir.cleanup()
+
+    def test_list_file(self):
+        path = os.path.join(self.dir.name, 'bots.txt')
+        self.assertFilter(
+            "name not in file'%s'" % path,
+            lambda r: r['name'] not in ('bot1', 'bot2', 'bob'), self.records
+        )
+        program = compile_script('@l = file"%s"' % path)
+        self.assertEqual(program.storables['l'], ['bot1', 'bot2', 'bob'])
+
+    def test_relative_list_file(self):
+        # A relative path is resolved against the script's directory.
+        code = Interpreter.parse("c { name in file'bots.txt' }")
+        program = Compiler(code, self.dir.name).compile()
+        self.assertTrue(program.predicates['c']({'name': 'bot2'}))
+        self.assertFalse(program.predicates['c']({'name': 'alice'}))
+
+        missing = os.path.join(self.dir.name, 'missing.txt')
+        with self.assertRaises(SyntaxError):
+            compile_script("c { name in file'%s' }" % missing)
+
+    def test_file_is_not_reserved(self):
+        # Only a string directly preceded by `file` is a list file.
+        self.assertFilter(
+            'file == 1 and name != "bob"',
+            lambda r: r['file'] == 1 and r['name'] != 'bob', self.records
+        )
+        with self.assertRaises(SyntaxError):
+            compile_script("c { name in file 'bots.txt' }")
+
+    def test_folded_into_frozenset(self):
+        compiler = Compiler({'components': {}, 'storables': {}})
+        operation = compiler._Compiler__operation
+        for opt in ('in', 'notin'):
+            _, _, right, _ = operation(opt, (False, None), (True, ['a', 1]))
+            self.assertEqual(right, (True, frozenset(['a', 1])))
+
+        # A list with an unhashable element is kept as is.
+        _, _, right, _ = operation('in', (False, None), (True, [[1], 2]))
+        self.assertEqual(right, (True, [[1], 2]))
+        self.assertFilter(
+            "name in [['alice'], 'bob']", lambda r: r['name'] == 'bob',
+            self.records
+        )
+
+class ShortCircuitTest(unittest.TestCase):
+    """
+    A term that can't be tested on a record (a string searched in a
+    number) raises an error only if the other terms don't decide first.
+    """
+
+    def test_cheapest_first(self):
+        # `x > 5` is cheaper than `search`, so it is tested first.
+        program = compile_script("c { title search 'a' and x > 5 }")
+        predicate = program.predicates['c']
+        self.assertFalse(predicate({'title': 5, 'x': 0}))
+        with self.assertRaises(SyntaxError):
+            predicate({'title': 5, 'x': 10})
+
+    def test_or(self):
+        program = compile_script("c { title search 'a' or x > 5 }")
+        predicate = program.predicates['c']
+        self.assertTrue(predicate({'title': 5, 'x': 10}))
+        with self.assertRaises(SyntaxError):
+            predicate({'title': 5, 'x': 0})
+
+    def test_decisions(self):
+        program = compile_script('c { x > 5 and y > 5 or z }')
+        predicate = program.predicates['c']
+        for x, y, z in itertools.product((0, 10), (0, 10), (0, 1)):
+            predicate({'x': x, 'y': y, 'z': z})
+        # `z` is tested first, as a lone attribute is cheaper than a
+        # comparison. It decides its chain on every record, and the
+        # `and` chain is only tested when `z` doesn't hold: `x > 5` then
+        # decides on the 2 records where it doesn't hold, and `y > 5` on
+        # the 2 others.
+        self.assertEqual(
+            sorted(map(tuple, program.decisions['c'])),
+            [('x > 5', 2), ('y > 5', 2), ('z', 8)]
+        )
+
+class BatchWithoutNumpyTest(BooleanTest):
+    """
+    The same tests as `BooleanTest`, with the batches filtered one record
+    at a time.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.numpy = sfl.numpy
+        sfl.numpy = None
+
+    def tearDown(self):
+        super().tearDown()
+        sfl.numpy = self.numpy
+
+if __name__ == '__main__':
+    unittest.main()
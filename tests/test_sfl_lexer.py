@@ -0,0 +1,181 @@
+# test_sfl_lexer.py
+#
+# Tests that the SFL lexer yields the same tokens as the char-by-char
+# lexer it replaced.
+#
+# Usage:
+#     python -m pytest tests
+
+import os
+import re
+import sys
+import unittest
+
+root_path = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path[0:0] = [
+    os.path.join(root_path, 'src'),
+    os.path.join(root_path, 'dep-py'),
+    os.path.join(root_path, 'dep-py', 'jsonlines'),
+]
+
+from sfl import Lexer
+
+class CharLexer:
+    """
+    The char-by-char lexer of the previous versions of dmine, kept as the
+    reference the lexer is checked against.
+    """
+
+    def lexer(line):
+        tokens = []
+        i = 0
+        opt_chars = r'[(){}<>!=andornotin\[\]\,search]'
+        while i < len(line):
+            if CharLexer.__is_whitespace(line[i]):
+                i += 1
+            elif CharLexer.__is_newline(line[i]):
+                i += 1
+            elif re.match('[_a-zA-Z]', line[i])\
+            or   re.match(opt_chars, line[i]):
+                boolean, i = CharLexer.__scan(
+                    i, line, '[TrueFalse]', '^(True|False)$'
+                )
+                if boolean:
+                    tokens.append(('boolean', boolean))
+                    continue
+
+                opts = r'^(\(|\)|\{|\}|<|<=|>|>=|=='\
+                       r'|!=|=|and|or|not|in|search|\[|\]|,)$'
+                operator, i = CharLexer.__scan(i, line, opt_chars, opts)
+                if operator:
+                    tokens.append((operator, ''))
+                    continue
+
+                identifier, i = CharLexer.__scan(
+                    i, line, '[_a-zA-Z0-9]', '^[a-zA-Z0-9_]+$', last=True
+                )
+                if identifier:
+                    tokens.append(('identifier', identifier))
+                    continue
+            elif line[i] == '\"' or line[i] == '\'':
+                string, i = CharLexer.__scan_str(i, line, line[i])
+                if string:
+                    tokens.append(('string', string))
+                else:
+                    CharLexer.__throw_token_error(string)
+            elif re.match(r'[\-0-9]', line[i]):
+                number, i = CharLexer.__scan(
+                    i, line, r'[\-\.0-9]', r'-?\d+(\.\d+)?'
+                )
+                if number:
+                    tokens.append(('number', number))
+                else:
+                    CharLexer.__throw_token_error(number)
+            elif line[i] == '@':
+                storable, i = CharLexer.__scan(
+                    i, line, r'[\_\@a-zA-Z0-9]', r'\@[a-zA-Z0-9_]+'
+                )
+                if storable:
+                    tokens.append(('storable', storable))
+                else:
+                    CharLexer.__throw_token_error(storable)
+            else:
+                CharLexer.__throw_token_error(line[i])
+
+        tokens.append(('EOF', ''))
+        return tokens
+
+    def __throw_token_error(token):
+        raise ValueError('Invalid token: %s' % token)
+
+    def __is_whitespace(c):
+        return c == ' ' or c == '\t'
+
+    def __is_newline(c):
+        return c == '\n'
+
+    def __scan(i, line, chars_pattern, token_pattern, last=False):
+        s = ''
+        j = i
+        if line[i] in ('{', '}', '(', ')', '[', ']', ','):
+            if re.match(token_pattern, line[i]):
+                return line[i], j + 1
+            else:
+                return None, i
+
+        delimiter = r'(\s|{|}|\(|\)|\[|\]|,)'
+        while j < len(line) and not re.match(delimiter, line[j]):
+            s += line[j]
+            j += 1
+
+        match = re.match(token_pattern, s)
+        if not match:
+            if last:
+                CharLexer.__throw_token_error(s)
+            else:
+                return None, i
+        return s, j
+
+    def __scan_str(i, line, delim):
+        s = ''
+        j = i + 1
+        while j < len(line) and line[j] != delim:
+            s += line[j]
+            j += 1
+        if j >= len(line):
+            CharLexer.__throw_token_error(delim + s)
+        return s, j + 1
+
+# Scripts written the way the char-by-char lexer requires: its operators
+# and numbers end at a whitespace or a punctuation char.
+SCRIPTS = [
+    "post { score > 10 }",
+    "post { 0 < score < 100 and title search 'cat' }",
+    "comment { score >= -5 and score <= 1.5 or score == 0 }",
+    "comment { author != 'bot' and not score < 0 }",
+    "comment { author not in ['a', 'b', \"c\"] and 'x' in body }",
+    "comment { author in [ 'a' , 'b' ] }",
+    "post { (score > 1 or score < -1) and (title search \"^a\") }",
+    "@subreddits = 'gaming, linuxmemes' @skip_comments = True "
+    "post { score > 0 }",
+    "@limit = 100 @flag = False",
+    "post { title search 'a\\d+\\s' and body search \"it's\" }",
+    "post { title == '\"quoted\"' and body != 'tab\\there' }",
+    "post {\n\tscore > 0\n\tand title in ['x', [1, 2], True]\n}",
+    "post{score>0}",
+    "@nested_list = [['a'], [], [1, -2.5]]",
+    "post { file_count > 0 and search_term search title }",
+    "post { inbox and notice or andrew }",
+]
+
+class LexerTest(unittest.TestCase):
+
+    def test_same_tokens(self):
+        for script in SCRIPTS:
+            try:
+                expected = CharLexer.lexer(script)
+            except ValueError:
+                # Some scripts aren't valid for the char-by-char lexer.
+                continue
+            self.assertEqual(Lexer.lexer(script), expected, script)
+
+    def test_references_are_lexed(self):
+        # Every script above but the one without spaces is valid for the
+        # char-by-char lexer, so the comparison above isn't vacuous.
+        valid = 0
+        for script in SCRIPTS:
+            try:
+                CharLexer.lexer(script)
+                valid += 1
+            except ValueError:
+                pass
+        self.assertEqual(valid, len(SCRIPTS) - 1)
+
+    def test_invalid_tokens(self):
+        for script in ("post { score > 10 $ }", "post { title == 'open }",
+                       "post { # }"):
+            with self.assertRaises(ValueError):
+                Lexer.lexer(script)
+
+if __name__ == '__main__':
+    unittest.main()